@@ -269,6 +269,11 @@ fi
 
 echo "cp -R $source_dir/share ./dist"
 cp -R "$source_dir/share" "./dist"
+# Schema inference in the API uses the validators from the Glue ETL library
+mkdir -p ./dist/library
+for library_file in __init__.py email_normalizer.py state_normalizer.py zip_normalizer.py schema_inference.py; do
+  cp "$source_dir/glue/library/$library_file" ./dist/library/
+done
 
 echo "Running chalice..."
 chalice package --merge-template external_resources.json dist
@@ -280,8 +285,8 @@ if [ $? -ne 0 ]; then
   exit 1
 fi
 cd dist
-echo "deployment.zip /share/* -x **/__pycache__/*"
-zip -r deployment.zip share/* -x "**/__pycache__/*"
+echo "deployment.zip /share/* /library/* -x **/__pycache__/*"
+zip -r deployment.zip share/* library/* -x "**/__pycache__/*"
 cd ..
 echo "cp ./dist/deployment.zip $regional_dist_dir-api.zip"
 cp ./dist/deployment.zip "$regional_dist_dir"/api.zip
@@ -402,6 +407,7 @@ pip3 install --quiet -r ../requirements.txt --target .
 zip -q -r9 ../dist/amc_uploader.zip .
 popd || exit 1
 zip -q -g ./dist/amc_uploader.zip ./amc_uploader.py
+zip -q -g ./dist/amc_uploader.zip ./upload_tracker.py
 zip -q -g ./dist/amc_uploader.zip ./lib/tasks.py
 cd dist
 echo "amc_uploader.zip share/* -x **/__pycache__/*"
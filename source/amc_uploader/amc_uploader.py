@@ -19,16 +19,17 @@
 import json
 import logging
 import os
+import time
 import urllib.parse
 from datetime import datetime
+from functools import lru_cache
 
 import boto3
 
 # Patch libraries to instrument downstream calls
 from aws_xray_sdk.core import patch_all
-from boto3.dynamodb.conditions import Key
 from botocore import config
-from lib.tasks import tasks
+from lib.tasks import metrics, tasks
 
 patch_all()
 
@@ -36,7 +37,21 @@ patch_all()
 solution_config = json.loads(os.environ["botoConfig"])
 config = config.Config(**solution_config)
 UPLOAD_FAILURES_TABLE_NAME = os.environ["UPLOAD_FAILURES_TABLE_NAME"]
+UPLOADS_TABLE_NAME = os.environ["UPLOADS_TABLE_NAME"]
+UPLOAD_LEDGER_TABLE_NAME = os.environ["UPLOAD_LEDGER_TABLE_NAME"]
+# How long a submitted manifest is remembered, in seconds
+UPLOAD_LEDGER_TTL_SECONDS = int(
+    os.environ.get("UPLOAD_LEDGER_TTL_SECONDS", str(7 * 24 * 3600))
+)
+# How long an unfinished submission blocks retries of the same manifest.
+# This must be longer than the Lambda timeout.
+UPLOAD_LEDGER_LEASE_SECONDS = int(
+    os.environ.get("UPLOAD_LEDGER_LEASE_SECONDS", "900")
+)
 SYSTEM_TABLE_NAME = os.environ["SYSTEM_TABLE_NAME"]
+AMC_INSTANCES_CACHE_TTL_SECONDS = int(
+    os.environ.get("AMC_INSTANCES_CACHE_TTL_SECONDS", "60")
+)
 
 # format log messages like this:
 formatter = logging.Formatter(
@@ -59,8 +74,9 @@ def lambda_handler(event, context):
     logger.info("context:\n {s}".format(s=context))
     bucket = event["Records"][0]["s3"]["bucket"]["name"]
     key = urllib.parse.unquote_plus(event["Records"][0]["s3"]["object"]["key"])
+    sequencer = event["Records"][0]["s3"]["object"].get("sequencer")
     if _is_manifest(key):
-        upload_res_info = _start_upload(bucket=bucket, key=key)
+        upload_res_info = _start_upload(bucket=bucket, key=key, sequencer=sequencer)
         logger.debug(upload_res_info)
     else:
         message = f"The key '{key}' is not a .txt manifest file. Exiting."
@@ -71,30 +87,104 @@ def _is_manifest(key):
     return key.endswith(".txt")
 
 
+@lru_cache(maxsize=None)
+def get_dynamo_resource():
+    # Created once per Lambda container and reused across invocations.
+    return boto3.resource("dynamodb", region_name=os.environ["AWS_REGION"])
+
+
 def get_dynamo_table(table_name):
-    dynamo_resource = boto3.resource(
-        "dynamodb", region_name=os.environ["AWS_REGION"]
-    )
+    dynamo_resource = get_dynamo_resource()
     return dynamo_resource.Table(table_name), dynamo_resource
 
 
+class AmcInstanceRegistry:
+    #
+    # Per-container cache of the AmcInstances system configuration, indexed
+    # by instance_id.
+    #
+    # The instance list is loaded from the system table once and reused by
+    # later invocations of this Lambda container. After the TTL expires only
+    # the Version attribute of the AmcInstances item is read. The Version is
+    # changed by the API every time the AMC instances are saved, so the full
+    # list is reloaded only when it actually changed (or when the item has
+    # no Version). An unknown instance_id also forces one reload so that
+    # newly registered instances are found immediately. The miss is then
+    # cached for the TTL, so repeated lookups of an unknown instance_id do
+    # not reload the list every time.
+    #
+    def __init__(self, ttl_seconds=AMC_INSTANCES_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.clear()
+
+    def clear(self):
+        self.instances = None
+        self.version = None
+        self.expires_at = 0
+        # instance_id: time.monotonic() until which it is known to be missing
+        self.misses = {}
+
+    def _get_item(self, **kwargs):
+        system_table, _ = get_dynamo_table(SYSTEM_TABLE_NAME)
+        response = system_table.get_item(Key={"Name": "AmcInstances"}, **kwargs)
+        return response.get("Item", {})
+
+    def load(self):
+        item = self._get_item()
+        self.instances = {
+            instance.get("instance_id"): instance
+            for instance in item.get("Value", [])
+        }
+        self.version = item.get("Version")
+        self.expires_at = time.monotonic() + self.ttl_seconds
+        self.misses = {}
+
+    def refresh(self):
+        # Returns True if the instance list was reloaded.
+        if self.instances is None:
+            self.load()
+            return True
+        if time.monotonic() < self.expires_at:
+            return False
+        version = self._get_item(
+            ProjectionExpression="#version",
+            ExpressionAttributeNames={"#version": "Version"},
+        ).get("Version")
+        if version is None or version != self.version:
+            self.load()
+            return True
+        self.expires_at = time.monotonic() + self.ttl_seconds
+        return False
+
+    def get(self, instance_id):
+        reloaded = self.refresh()
+        instance = self.instances.get(instance_id)
+        if instance is not None or self.misses.get(instance_id, 0) > time.monotonic():
+            return instance
+        if not reloaded:
+            self.load()
+            instance = self.instances.get(instance_id)
+        if instance is None:
+            self.misses[instance_id] = time.monotonic() + self.ttl_seconds
+        return instance
+
+
+instance_registry = AmcInstanceRegistry()
+
+
+@metrics.timed("AmcInstanceLookup")
 def get_amc_instance(instance_id):
-    system_table, _ = get_dynamo_table(SYSTEM_TABLE_NAME)
-    response = system_table.query(
-        KeyConditionExpression=Key("Name").eq("AmcInstances")
-    )
-
-    for item in response["Items"]:
-        for instance in item["Value"]:
-            if instance.get("instance_id") == instance_id:
-                if not (instance.get("marketplace_id") and instance.get("advertiser_id")):
-                    raise ValueError(
-                        f"AMC instances: marketplace_id and advertiser_id required for {instance_id}."
-                    )
-                return instance
-    raise ValueError(f"AMC instances: {instance_id} not found.")
+    instance = instance_registry.get(instance_id)
+    if instance is None:
+        raise ValueError(f"AMC instances: {instance_id} not found.")
+    if not (instance.get("marketplace_id") and instance.get("advertiser_id")):
+        raise ValueError(
+            f"AMC instances: marketplace_id and advertiser_id required for {instance_id}."
+        )
+    return instance
 
 
+@metrics.timed("VerifyAmcRequest")
 def verify_amc_request(**kwargs):
     # Verify AMC requests
     ads_kwargs = tasks.get_ads_token(**kwargs, redirect_uri="None")
@@ -103,23 +193,118 @@ def verify_amc_request(**kwargs):
     return ads_kwargs
 
 
+@metrics.timed("UploadFailuresWrite")
 def update_upload_failures_table(response, dataset_id, instance_id):
     logger.info(f"Response code: {response.status_code}\n")
     logger.info("Response: " + response.text)
-    upload_failures_table, dynamo_resource = get_dynamo_table(
-        UPLOAD_FAILURES_TABLE_NAME
-    )
+    upload_failures_table, dynamo_resource = get_dynamo_table(UPLOAD_FAILURES_TABLE_NAME)
     item_key = {"dataset_id": dataset_id, "instance_id": instance_id}
-    # Clear previously recorded failure item.
+    # If this upload failed then record that failure, replacing any failure
+    # recorded previously.
+    if response.status_code != 200:
+        upload_failures_table.put_item(Item={**item_key, "Value": response.text})
+        return
+    # Otherwise clear the previously recorded failure, if there is one, with
+    # one conditional delete. There is no gap between a read and the delete
+    # in which another invocation could record a new failure.
     try:
-        upload_failures_table.delete_item(Key=item_key)
+        upload_failures_table.delete_item(
+            Key=item_key, ConditionExpression="attribute_exists(dataset_id)"
+        )
     except dynamo_resource.meta.client.exceptions.ConditionalCheckFailedException:
         pass
-    # If this upload failed then record that failure.
-    if response.status_code != 200:
-        item = item_key
-        item["Value"] = response.text
-        upload_failures_table.put_item(Item=item)
+
+
+@metrics.timed("UploadRecordWrite")
+def record_upload(response, **kwargs):
+    # Save the upload ID returned by AMC so that upload_tracker.py can poll
+    # its status until it completes.
+    upload_id = safe_json_loads(response.text)
+    if not isinstance(upload_id, dict) or not upload_id.get("uploadId"):
+        logger.info("No uploadId in AMC response. Upload will not be tracked.")
+        return
+    uploads_table, _ = get_dynamo_table(UPLOADS_TABLE_NAME)
+    now = int(time.time())
+    item = {
+        "dataset_id": kwargs["dataset_id"],
+        "upload_id": upload_id["uploadId"],
+        "instance_id": kwargs["instance_id"],
+        "user_id": kwargs["user_id"],
+        "advertiser_id": kwargs["advertiser_id"],
+        "marketplace_id": kwargs["marketplace_id"],
+        "bucket": kwargs["bucket"],
+        "manifest_key": kwargs["key"],
+        "tracking_status": "PENDING",
+        "submitted_at": now,
+        "next_poll_at": now,
+        "poll_count": 0,
+    }
+    try:
+        uploads_table.put_item(Item=item)
+    except Exception as ex:
+        # The upload itself was accepted by AMC, so don't fail it just
+        # because it could not be tracked.
+        logger.error(f"Failed to record upload {item['upload_id']}: {ex}")
+
+
+# S3 event notifications are delivered at least once, so the same event
+# may be received more than once. Each event (bucket, key and the sequencer
+# of the S3 event) is recorded in the upload ledger before the manifest is
+# submitted to AMC so that duplicate deliveries do not upload the same data
+# again. The sequencer differs each time the manifest is written, so re-runs
+# that write an identical manifest are still submitted.
+def format_manifest_id(bucket, key, sequencer):
+    if not sequencer:
+        return None
+    return f"{bucket}/{key}/{sequencer}"
+
+
+@metrics.timed("UploadLedgerWrite")
+def claim_manifest(manifest_id):
+    # Returns False if this manifest was already submitted, or is being
+    # submitted by another invocation.
+    ledger_table, dynamo_resource = get_dynamo_table(UPLOAD_LEDGER_TABLE_NAME)
+    now = int(time.time())
+    try:
+        ledger_table.put_item(
+            Item={
+                "manifest_id": manifest_id,
+                "ledger_status": "IN_PROGRESS",
+                "lease_expires_at": now + UPLOAD_LEDGER_LEASE_SECONDS,
+                "expires_at": now + UPLOAD_LEDGER_TTL_SECONDS,
+            },
+            ConditionExpression="attribute_not_exists(manifest_id) OR "
+            "(ledger_status = :in_progress AND lease_expires_at < :now)",
+            ExpressionAttributeValues={":in_progress": "IN_PROGRESS", ":now": now},
+        )
+    except dynamo_resource.meta.client.exceptions.ConditionalCheckFailedException:
+        return False
+    except Exception as ex:
+        # Don't block uploads if the ledger is unavailable.
+        logger.error(f"Failed to record manifest {manifest_id} in upload ledger: {ex}")
+    return True
+
+
+def release_manifest(manifest_id):
+    # Forget a manifest whose submission failed so that it can be retried.
+    ledger_table, _ = get_dynamo_table(UPLOAD_LEDGER_TABLE_NAME)
+    try:
+        ledger_table.delete_item(Key={"manifest_id": manifest_id})
+    except Exception as ex:
+        logger.error(f"Failed to remove manifest {manifest_id} from upload ledger: {ex}")
+
+
+def complete_manifest(manifest_id):
+    ledger_table, _ = get_dynamo_table(UPLOAD_LEDGER_TABLE_NAME)
+    try:
+        ledger_table.update_item(
+            Key={"manifest_id": manifest_id},
+            UpdateExpression="SET ledger_status = :submitted REMOVE lease_expires_at",
+            ExpressionAttributeValues={":submitted": "SUBMITTED"},
+        )
+    except Exception as ex:
+        logger.error(f"Failed to update manifest {manifest_id} in upload ledger: {ex}")
+
 
 def safe_json_loads(val):
     try:
@@ -128,7 +313,9 @@ def safe_json_loads(val):
         return val
 
 
+@metrics.timed("StartUpload")
 def _start_upload(**kwargs):
+    manifest_id = None
     try:
         logger.info("Uploading dataset")
         bucket = kwargs["bucket"]
@@ -140,6 +327,12 @@ def _start_upload(**kwargs):
         _, dataset_id, update_strategy, file_format, country_code, instance_id_user_id, filename_quoted = key.split('/')
         instance_id, user_id = instance_id_user_id.split("|")
         filename = urllib.parse.unquote_plus(filename_quoted)
+        manifest_id = format_manifest_id(bucket, key, kwargs.get("sequencer"))
+        if manifest_id and not claim_manifest(manifest_id):
+            message = f"The manifest s3://{bucket}/{key} was already submitted. Exiting."
+            logger.info(message)
+            manifest_id = None
+            return {"Status": "Warning", "Message": message}
         ads_kwargs = verify_amc_request(**kwargs, user_id=user_id)
         amc_instance = get_amc_instance(instance_id=instance_id)
         kwargs["marketplace_id"] = amc_instance["marketplace_id"]
@@ -188,11 +381,22 @@ def _start_upload(**kwargs):
             payload=json.dumps(data)
         )
         response = amc_request.process_request(**kwargs, **ads_kwargs)
+        # Mark the manifest as submitted before anything else can fail, so
+        # that it is not released and submitted again.
+        if response.status_code == 200 and manifest_id:
+            complete_manifest(manifest_id)
+        elif manifest_id:
+            release_manifest(manifest_id)
+        manifest_id = None
         update_upload_failures_table(response, dataset_id, instance_id)
+        if response.status_code == 200:
+            record_upload(response, dataset_id=dataset_id, **kwargs)
         return response.text
 
     except Exception as ex:
         logger.error(ex)
+        if manifest_id:
+            release_manifest(manifest_id)
         return {"Status": "Error", "Message": ex}
 
 
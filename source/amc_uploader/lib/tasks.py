@@ -16,3 +16,4 @@ import sys
 
 sys.path.insert(0, "./share/tasks.py")
 tasks = importlib.import_module("share.tasks")
+metrics = importlib.import_module("share.metrics")
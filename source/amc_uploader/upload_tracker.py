@@ -0,0 +1,275 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###############################################################################
+# PURPOSE:
+#   Track AMC uploads started by amc_uploader.py until they complete.
+#   Pending uploads are read from the uploads table, their status is polled
+#   from AMC in batches, and terminal states are saved along with the time
+#   each upload took to complete.
+#
+# USAGE:
+#   Start this Lambda on a schedule (e.g. an EventBridge rate(5 minutes) rule).
+#
+# REQUIREMENTS:
+#   Items in the uploads table are written by amc_uploader.py. Uploads that
+#   are still in progress are polled again with an exponentially increasing
+#   interval so that long-running uploads are not polled on every run.
+#   Uploads that are still pending after UPLOAD_TRACKER_MAX_AGE seconds, or
+#   that AMC does not know (404), are marked ABANDONED and not polled again.
+###############################################################################
+
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from datetime import datetime
+from functools import lru_cache
+
+import boto3
+
+# Patch libraries to instrument downstream calls
+from aws_xray_sdk.core import patch_all
+from boto3.dynamodb.conditions import Key
+from lib.tasks import metrics, tasks
+
+patch_all()
+
+# Environment variables
+UPLOADS_TABLE_NAME = os.environ["UPLOADS_TABLE_NAME"]
+UPLOADS_PENDING_INDEX = "tracking_status-next_poll_at-index"
+# Maximum number of pending uploads polled per invocation
+UPLOAD_TRACKER_BATCH_SIZE = int(os.environ.get("UPLOAD_TRACKER_BATCH_SIZE", "200"))
+# Maximum number of concurrent requests to AMC
+UPLOAD_TRACKER_MAX_CONCURRENCY = int(
+    os.environ.get("UPLOAD_TRACKER_MAX_CONCURRENCY", "10")
+)
+# Polling interval bounds, in seconds
+MIN_POLL_INTERVAL = int(os.environ.get("UPLOAD_TRACKER_MIN_POLL_INTERVAL", "60"))
+MAX_POLL_INTERVAL = int(os.environ.get("UPLOAD_TRACKER_MAX_POLL_INTERVAL", "3600"))
+# Uploads still pending after this many seconds are abandoned
+UPLOAD_TRACKER_MAX_AGE = int(os.environ.get("UPLOAD_TRACKER_MAX_AGE", str(7 * 24 * 3600)))
+# AMC upload statuses that will not change anymore
+TERMINAL_STATUSES = ("SUCCEEDED", "FAILED", "PARTIALSUCCESS", "CANCELLED")
+# AMC response codes that will not change when the upload is polled again
+PERMANENT_ERROR_STATUS_CODES = (400, 404, 410)
+
+# format log messages like this:
+formatter = logging.Formatter(
+    "{%(pathname)s:%(lineno)d} %(levelname)s - %(message)s"
+)
+handler = logging.StreamHandler()
+handler.setFormatter(formatter)
+
+# Remove the default logger in order to avoid duplicate log messages
+# after we attach our custom logging handler.
+logging.getLogger().handlers.clear()
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+logger.addHandler(handler)
+
+
+def lambda_handler(event, context):
+    logger.info("event:\n {s}".format(s=event))
+    now = int(time.time())
+    uploads = list_pending_uploads(now)
+    logger.info(f"Polling {len(uploads)} pending uploads")
+    summary = poll_uploads(uploads, now)
+    logger.info(json.dumps(summary))
+    return summary
+
+
+@lru_cache(maxsize=None)
+def get_dynamo_resource():
+    # Created once per Lambda container and reused across invocations.
+    return boto3.resource("dynamodb", region_name=os.environ["AWS_REGION"])
+
+
+def get_uploads_table():
+    return get_dynamo_resource().Table(UPLOADS_TABLE_NAME)
+
+
+def list_pending_uploads(now, limit=UPLOAD_TRACKER_BATCH_SIZE):
+    # Returns pending uploads which are due to be polled, oldest first.
+    uploads_table = get_uploads_table()
+    query_kwargs = {
+        "IndexName": UPLOADS_PENDING_INDEX,
+        "KeyConditionExpression": Key("tracking_status").eq("PENDING")
+        & Key("next_poll_at").lte(now),
+    }
+    uploads = []
+    while len(uploads) < limit:
+        response = uploads_table.query(Limit=limit - len(uploads), **query_kwargs)
+        uploads.extend(response["Items"])
+        if "LastEvaluatedKey" not in response:
+            break
+        query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    return uploads
+
+
+def is_terminal_status(status):
+    return str(status).upper().replace("_", "") in TERMINAL_STATUSES
+
+
+def next_poll_interval(poll_count):
+    # Exponential backoff between MIN_POLL_INTERVAL and MAX_POLL_INTERVAL.
+    return min(MIN_POLL_INTERVAL * 2 ** min(int(poll_count), 16), MAX_POLL_INTERVAL)
+
+
+def completed_at(response_json, now):
+    # Returns the time AMC last updated a completed upload, so that the
+    # duration does not include the time until it was polled, which can be
+    # up to MAX_POLL_INTERVAL. Falls back to the poll time.
+    try:
+        updated_time = datetime.fromisoformat(response_json["updatedTime"].replace("Z", "+00:00"))
+    except (KeyError, AttributeError, ValueError):
+        return now
+    return min(int(updated_time.timestamp()), now)
+
+
+@metrics.timed("PollUploads")
+def poll_uploads(uploads, now):
+    summary = {"polled": 0, "completed": 0, "pending": 0, "errors": 0, "abandoned": 0}
+    # Each user has their own LwA token, so poll uploads grouped by user.
+    uploads_by_user = defaultdict(list)
+    for upload in uploads:
+        uploads_by_user[upload["user_id"]].append(upload)
+
+    for user_id, user_uploads in uploads_by_user.items():
+        # A failure for one user must not stop the uploads of other users
+        # from being polled. The uploads of this user are polled again on
+        # the next run.
+        try:
+            poll_user_uploads(user_id, user_uploads, now, summary)
+        except Exception as ex:
+            logger.error(f"Failed to poll uploads for user {user_id}: {ex}")
+            summary["errors"] += len(user_uploads)
+    return summary
+
+
+def poll_user_uploads(user_id, user_uploads, now, summary):
+    ads_kwargs = tasks.get_ads_token(user_id=user_id, redirect_uri="None")
+    if ads_kwargs.get("authorize_url") or "access_token" not in ads_kwargs:
+        logger.error(f"Unauthorized AMC request for user {user_id}.")
+        for upload in user_uploads:
+            rescheduled = reschedule_upload(upload, now, error="Unauthorized AMC request.")
+            summary["errors" if rescheduled else "abandoned"] += 1
+        return
+
+    amc_requests = [
+        (
+            tasks.AsyncAMCRequests(
+                amc_path=f"/uploads/{upload['dataset_id']}/{upload['upload_id']}",
+                http_method="GET",
+            ),
+            {
+                **ads_kwargs,
+                "instance_id": upload["instance_id"],
+                "advertiser_id": upload["advertiser_id"],
+                "marketplace_id": upload["marketplace_id"],
+            },
+        )
+        for upload in user_uploads
+    ]
+    responses = tasks.fan_out_amc_requests(
+        amc_requests, max_concurrency=UPLOAD_TRACKER_MAX_CONCURRENCY
+    )
+    for upload, response in zip(user_uploads, responses):
+        summary["polled"] += 1
+        result = record_poll_result(upload, response, now)
+        summary[result] += 1
+
+
+def record_poll_result(upload, response, now):
+    # Returns "completed", "pending", "errors", or "abandoned".
+    if isinstance(response, Exception):
+        rescheduled = reschedule_upload(upload, now, error=str(response))
+        return "errors" if rescheduled else "abandoned"
+    if response.status_code in PERMANENT_ERROR_STATUS_CODES:
+        abandon_upload(upload, error=response.text)
+        return "abandoned"
+    if response.status_code != 200:
+        rescheduled = reschedule_upload(upload, now, error=response.text)
+        return "errors" if rescheduled else "abandoned"
+
+    response_json = response.json()
+    status = response_json.get("status", "")
+    if not is_terminal_status(status):
+        rescheduled = reschedule_upload(upload, now, upload_status=status)
+        return "pending" if rescheduled else "abandoned"
+
+    duration = completed_at(response_json, now) - int(upload["submitted_at"])
+    get_uploads_table().update_item(
+        Key={"dataset_id": upload["dataset_id"], "upload_id": upload["upload_id"]},
+        UpdateExpression="SET tracking_status = :complete, upload_status = :status, "
+        "completed_at = :now, duration_seconds = :duration, poll_count = poll_count + :one "
+        "REMOVE last_error",
+        ExpressionAttributeValues={
+            ":complete": "COMPLETE",
+            ":status": status,
+            ":now": now,
+            ":duration": duration,
+            ":one": 1,
+        },
+    )
+    logger.info(
+        json.dumps(
+            {
+                "dataset_id": upload["dataset_id"],
+                "upload_id": upload["upload_id"],
+                "instance_id": upload["instance_id"],
+                "manifest_key": upload["manifest_key"],
+                "upload_status": status,
+                "duration_seconds": duration,
+            }
+        )
+    )
+    return "completed"
+
+
+def reschedule_upload(upload, now, upload_status=None, error=None):
+    # Returns False if the upload is abandoned instead, because it has been
+    # pending for longer than UPLOAD_TRACKER_MAX_AGE.
+    if now - int(upload["submitted_at"]) > UPLOAD_TRACKER_MAX_AGE:
+        abandon_upload(
+            upload,
+            upload_status=upload_status,
+            error=error or f"Upload did not complete within {UPLOAD_TRACKER_MAX_AGE} seconds.",
+        )
+        return False
+    poll_count = int(upload.get("poll_count", 0)) + 1
+    update_expression = "SET next_poll_at = :next_poll_at, poll_count = :poll_count"
+    expression_attribute_values = {
+        ":next_poll_at": now + next_poll_interval(poll_count),
+        ":poll_count": poll_count,
+    }
+    if upload_status:
+        update_expression += ", upload_status = :status"
+        expression_attribute_values[":status"] = upload_status
+    if error:
+        update_expression += ", last_error = :error"
+        expression_attribute_values[":error"] = error
+    get_uploads_table().update_item(
+        Key={"dataset_id": upload["dataset_id"], "upload_id": upload["upload_id"]},
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=expression_attribute_values,
+    )
+    return True
+
+
+def abandon_upload(upload, upload_status=None, error=None):
+    # Stops polling an upload whose status is not expected to change.
+    logger.error(
+        f"Abandoned upload {upload['upload_id']} of dataset {upload['dataset_id']}: {error}"
+    )
+    update_expression = "SET tracking_status = :abandoned, last_error = :error, poll_count = poll_count + :one"
+    expression_attribute_values = {":abandoned": "ABANDONED", ":error": error, ":one": 1}
+    if upload_status:
+        update_expression += ", upload_status = :status"
+        expression_attribute_values[":status"] = upload_status
+    get_uploads_table().update_item(
+        Key={"dataset_id": upload["dataset_id"], "upload_id": upload["upload_id"]},
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=expression_attribute_values,
+    )
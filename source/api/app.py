@@ -1,15 +1,24 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 
+import csv
 import json
 import logging
 import os
 import re
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial, wraps
 
-import awswrangler as wr
 import boto3
 from aws_xray_sdk.core import patch_all
+from boto3.dynamodb.conditions import Key
 from botocore import config
+from botocore.config import Config
 from chalice import (
     BadRequestError,
     Chalice,
@@ -17,7 +26,8 @@ from chalice import (
     IAMAuthorizer,
     Response,
 )
-from chalicelib.tasks import tasks
+from chalicelib.response_cache import ResponseCache
+from chalicelib.tasks import load_schema_inference, metrics, tasks
 
 solution_config = json.loads(os.environ["botoConfig"])
 config = config.Config(**solution_config)
@@ -43,6 +53,20 @@ patch_all()
 app = Chalice(app_name="amcufa_api")
 authorizer = IAMAuthorizer()
 
+# Record the latency of every route when latency metrics are enabled.
+if metrics.METRICS_ENABLED:
+    @app.middleware("http")
+    def record_route_latency(event, get_response):
+        with metrics.timed("Route", Route=event.context.get("resourcePath", event.path)):
+            return get_response(event)
+
+# Inferred schemas by (bucket, key, file format, country, sample rows)
+schema_cache = OrderedDict()
+# First page of Glue ETL job runs by page size
+etl_job_runs_cache = {}
+# Responses of read-only AMC endpoints
+response_cache = ResponseCache()
+
 # Environment variables
 VERSION = os.environ["VERSION"]
 AMC_GLUE_JOB_NAME = os.environ["AMC_GLUE_JOB_NAME"]
@@ -57,11 +81,101 @@ JSON_CONTENT_TYPE = "application/json"
 CSV_CONTENT_TYPE = "text/csv"
 PLAIN_TEXT_CONTENT_TYPE = "text/plain"
 GZIP_CONTENT_TYPE = "application/x-gzip"
+# Maximum number of objects returned by one /list_bucket call
+LIST_BUCKET_PAGE_SIZE = 1000
+# Bytes read per ranged GET when /get_data_columns looks for the first line
+# of a file, and the most it will read before giving up on finding one.
+HEADER_SNIFF_BYTES = 8 * 1024
+HEADER_SNIFF_MAX_BYTES = 1024 * 1024
+HEADER_SNIFF_MAX_WORKERS = 32
+# Header reads are small, so a slow read is retried rather than waited for.
+HEADER_SNIFF_CLIENT_CONFIG = Config(
+    max_pool_connections=HEADER_SNIFF_MAX_WORKERS,
+    connect_timeout=5,
+    read_timeout=10,
+)
+GZIP_MAGIC_NUMBER = b"\x1f\x8b"
+# Default and maximum number of rows sampled by /infer_data_schema, the bytes
+# read per ranged GET, and the most it will read to get them.
+SCHEMA_SAMPLE_ROWS = 100
+SCHEMA_MAX_SAMPLE_ROWS = 1000
+SCHEMA_SAMPLE_BYTES = 64 * 1024
+SCHEMA_SAMPLE_MAX_BYTES = 4 * 1024 * 1024
+# Maximum number of uploads in one /bulk_upload_status request
+BULK_UPLOAD_STATUS_MAX_UPLOADS = 200
+# Maximum number of files in one /batch_start_amc_transformation request,
+# the number of files handled concurrently, and how long, in seconds, Glue
+# job runs that exceed the concurrent runs quota are retried.
+BATCH_TRANSFORMATION_MAX_FILES = 500
+BATCH_TRANSFORMATION_MAX_WORKERS = 10
+BATCH_TRANSFORMATION_RETRY_SECONDS = 20
+BATCH_TRANSFORMATION_MAX_RETRY_DELAY = 8
+# Default and maximum number of runs in one /get_etl_jobs page, the number of
+# runs requested at a time when looking for new runs, and how long the first
+# page of runs is cached.
+ETL_JOB_RUNS_PAGE_SIZE = 200
+ETL_JOB_RUNS_PROBE_SIZE = 10
+ETL_JOB_RUNS_CACHE_TTL_SECONDS = 300
+# Glue job run states that will not change anymore
+GLUE_TERMINAL_STATES = ("STOPPED", "SUCCEEDED", "FAILED", "TIMEOUT", "ERROR")
+# Index of the upload failures table used to find the failures of a dataset
+# in every AMC instance, and the most keys DynamoDB accepts per BatchGetItem.
+UPLOAD_FAILURES_DATASET_INDEX = "dataset_id-index"
+BATCH_GET_ITEM_MAX_KEYS = 100
+# BatchGetItem requests with unprocessed keys are retried up to this many
+# times, waiting BATCH_GET_ITEM_BACKOFF_SECONDS * 2 ** retry between them.
+BATCH_GET_ITEM_MAX_RETRY = 5
+BATCH_GET_ITEM_BACKOFF_SECONDS = 0.1
+# Number of inferred schemas kept in memory, keyed by file and ETag
+SCHEMA_CACHE_SIZE = 256
+
+
+def datasets_cache_scope():
+    # Datasets are cached per AMC instance, so that creating or deleting a
+    # dataset invalidates the cached lists of every user of that instance.
+    request = app.current_request.json_body
+    return "#".join(
+        [
+            "datasets",
+            str(request.get("instance_id", "")),
+            str(request.get("advertiser_id", "")),
+            str(request.get("marketplace_id", "")),
+        ]
+    )
+
+
+def serve_cached_amc_response(scope):
+    #
+    # This decorator returns the cached response of a read-only AMC route
+    # for the scope (a string, or a function that returns one) and user of
+    # the request. It is applied outside of authorize_amc_request, so cache
+    # hits need no Secrets Manager read or LwA token exchange. Requests with
+    # ?refresh=true always call the route.
+    #
+    def serve_cached_amc_response_decorator(func):
+        @wraps(func)
+        def wrapper(**kwargs):
+            query_params = app.current_request.query_params or {}
+            if query_params.get("refresh", "").lower() != "true":
+                body = response_cache.get(
+                    scope() if callable(scope) else scope,
+                    app.current_request.json_body.get("user_id", ""),
+                )
+                if body is not None:
+                    return Response(
+                        body=body,
+                        status_code=200,
+                        headers={"Content-Type": JSON_CONTENT_TYPE, "X-Cache": "Hit"},
+                    )
+            return func(**kwargs)
+        return wrapper
+    return serve_cached_amc_response_decorator
 
 
 @app.route(
     "/list_datasets", cors=True, methods=["POST"], authorizer=authorizer
 )
+@serve_cached_amc_response(datasets_cache_scope)
 @tasks.authorize_amc_request(app=app)
 def list_datasets(**kwargs):
     """
@@ -75,31 +189,33 @@ def list_datasets(**kwargs):
     """
     log_request_parameters()
     try:
-        amc_request = tasks.AMCRequests(
-            amc_path="/dataSets/list",
-            http_method="POST",
-        )
-        response = amc_request.process_request(
-            **kwargs, **app.current_request.json_body
-        )
-        response_json = response.json()
-
-        datasets = response_json.get('dataSets', [])
-        while 'nextToken' in response_json:
+        def get_datasets():
             amc_request = tasks.AMCRequests(
                 amc_path="/dataSets/list",
                 http_method="POST",
-                request_parameters={'nextToken': response_json['nextToken']}
             )
-            response_json = amc_request.process_request(
+            response = amc_request.process_request(
                 **kwargs, **app.current_request.json_body
-            ).json()
-            datasets.extend(response_json.get('dataSets', []))
-
-        return Response(
-            body=json.dumps({'dataSets': datasets}),
-            status_code=response.status_code,
-            headers={"Content-Type": JSON_CONTENT_TYPE},
+            )
+            response_json = response.json()
+
+            datasets = response_json.get('dataSets', [])
+            while 'nextToken' in response_json:
+                amc_request = tasks.AMCRequests(
+                    amc_path="/dataSets/list",
+                    http_method="POST",
+                    request_parameters={'nextToken': response_json['nextToken']}
+                )
+                response_json = amc_request.process_request(
+                    **kwargs, **app.current_request.json_body
+                ).json()
+                datasets.extend(response_json.get('dataSets', []))
+            return json.dumps({'dataSets': datasets}), response.status_code
+
+        return cache_amc_response(
+            scope=datasets_cache_scope(),
+            key=app.current_request.json_body.get("user_id", ""),
+            get_response=get_datasets,
         )
     except Exception as ex:
         logger.error(ex)
@@ -168,6 +284,8 @@ def create_dataset(**kwargs):
         response = amc_request.process_request(
             **kwargs, **app.current_request.json_body
         )
+        if response.status_code == 200:
+            response_cache.invalidate(datasets_cache_scope())
 
         return Response(
             body=response.text,
@@ -200,19 +318,9 @@ def start_amc_transformation(**_):
     """
     log_request_parameters()
     try:
-        source_bucket = app.current_request.json_body["sourceBucket"]
-        source_key = app.current_request.json_body["sourceKey"]
-        output_bucket = app.current_request.json_body["outputBucket"]
-        pii_fields = app.current_request.json_body["piiFields"]
-        deleted_fields = app.current_request.json_body["deletedFields"]
-        dataset_id = app.current_request.json_body["datasetId"]
-        country_code = app.current_request.json_body.get("countryCode")
-        update_strategy = app.current_request.json_body["updateStrategy"]
-        session = boto3.session.Session(region_name=os.environ["AWS_REGION"])
-        amc_instances = json.loads(
-            app.current_request.json_body["amc_instances"]
-        )
-        user_id = app.current_request.json_body["user_id"]
+        request_body = app.current_request.json_body
+        source_bucket = request_body["sourceBucket"]
+        source_key = request_body["sourceKey"]
 
         # The fileFormat parameter is optional.
         # If this function  is called from the GUI then the payload will
@@ -223,37 +331,12 @@ def start_amc_transformation(**_):
         #
         # At the end of this function, fileFormat is required so that it can be
         # passed to the Glue ETL job.
-        file_format = app.current_request.json_body.get("fileFormat", "")
-        if file_format not in ("", "JSON", "CSV"):
-            logger.error("Unexpected fileFormat value: " + file_format)
-            logger.error("fileFormat must be \"CSV\" or \"JSON\".")
-            raise BadRequestError("Unexpected file format: " + file_format)
+        file_format = validate_file_format(request_body.get("fileFormat", ""))
         if file_format == "":
             file_format = get_file_format(source_bucket, source_key)
 
-        client = session.client("glue", config=config)
-        args = {
-            "--source_bucket": source_bucket,
-            "--output_bucket": output_bucket,
-            "--source_key": source_key,
-            "--pii_fields": pii_fields,
-            "--deleted_fields": deleted_fields,
-            "--dataset_id": dataset_id,
-            "--file_format": file_format,
-            "--update_strategy": update_strategy,
-            "--user_id": user_id,
-            "--amc_instances": json.dumps(
-                [instance["instance_id"] for instance in amc_instances]
-            ),
-        }
-
-        # countryCode is optional
-        if country_code:
-            args["--country_code"] = country_code
-
-        # timestampColumn is optional and will only be present for FACT datasets
-        if app.current_request.json_body.get("timestampColumn", "") != "":
-            args["--timestamp_column"] = app.current_request.json_body["timestampColumn"]
+        client = tasks.get_boto3_client("glue")
+        args = glue_job_arguments(request_body, source_key, file_format)
 
         logger.info("Starting Glue job:")
         logger.info("Equivalent AWS CLI command: ")
@@ -277,33 +360,327 @@ def start_amc_transformation(**_):
         return {"Status": "Error", "Message": str(ex)}
 
 
+@app.route(
+    "/batch_start_amc_transformation",
+    cors=True,
+    methods=["POST"],
+    authorizer=authorizer,
+)
+@tasks.authorize_amc_request(app=app)
+def batch_start_amc_transformation(**_):
+    """
+    Invoke the Glue job for each of many files with a single request.
+
+    The request body is the same as for /start_amc_transformation except
+    that ``sourceKeys``, a list of keys in sourceBucket, replaces
+    ``sourceKey``. If fileFormat is not provided then it is inferred for
+    each file concurrently, and the Glue job runs are started in parallel.
+
+    Runs that exceed the concurrent runs quota of the Glue job are queued
+    and started again as runs complete, until
+    BATCH_TRANSFORMATION_RETRY_SECONDS have passed. Files that still exceed
+    the quota then are listed in Queued, and should be sent again in a new
+    request once more runs have completed. Files that could not be
+    transformed for any other reason are listed in Errors along with the
+    reason.
+
+    Returns:
+
+    .. code-block:: python
+
+        {
+            "JobRunIds": {source_key: string},
+            "Queued": {source_key: string},
+            "Errors": {source_key: string}
+        }
+    """
+    log_request_parameters()
+    try:
+        request_body = app.current_request.json_body
+        source_bucket = request_body["sourceBucket"]
+        # Keys are deduplicated so that each file is only transformed once.
+        source_keys = list(dict.fromkeys(request_body["sourceKeys"]))
+        if len(source_keys) > BATCH_TRANSFORMATION_MAX_FILES:
+            raise BadRequestError(
+                f"At most {BATCH_TRANSFORMATION_MAX_FILES} files can be transformed per request."
+            )
+        file_format = validate_file_format(request_body.get("fileFormat", ""))
+
+        job_arguments = {}
+        errors = {}
+        with ThreadPoolExecutor(max_workers=BATCH_TRANSFORMATION_MAX_WORKERS) as executor:
+            if file_format:
+                file_formats = {source_key: file_format for source_key in source_keys}
+            else:
+                futures = {
+                    source_key: executor.submit(get_file_format, source_bucket, source_key)
+                    for source_key in source_keys
+                }
+                file_formats = {}
+                for source_key, future in futures.items():
+                    try:
+                        file_formats[source_key] = future.result()
+                    except Exception as ex:
+                        errors[source_key] = str(ex)
+            for source_key, source_file_format in file_formats.items():
+                job_arguments[source_key] = glue_job_arguments(
+                    request_body, source_key, source_file_format
+                )
+            logger.info(f"Starting {len(job_arguments)} Glue job runs")
+            job_run_ids, queued, start_errors = start_glue_job_runs(executor, job_arguments)
+        errors.update(start_errors)
+        return {"JobRunIds": job_run_ids, "Queued": queued, "Errors": errors}
+    except Exception as ex:
+        logger.error(ex)
+        return {"Status": "Error", "Message": str(ex)}
+
+
+def validate_file_format(file_format):
+    if file_format not in ("", "JSON", "CSV"):
+        logger.error("Unexpected fileFormat value: " + file_format)
+        logger.error("fileFormat must be \"CSV\" or \"JSON\".")
+        raise BadRequestError("Unexpected file format: " + file_format)
+    return file_format
+
+
+def validate_timeseries_partition_size(timeseries_partition_size):
+    if timeseries_partition_size not in ("", "P1D", "PT1H"):
+        logger.error("Unexpected timeseriesPartitionSize value: " + timeseries_partition_size)
+        logger.error("timeseriesPartitionSize must be \"P1D\" or \"PT1H\".")
+        raise BadRequestError("Unexpected timeseries partition size: " + timeseries_partition_size)
+    return timeseries_partition_size
+
+
+def glue_job_arguments(request_body, source_key, file_format):
+    # Returns the arguments of the Glue ETL job run for one source file.
+    amc_instances = json.loads(request_body["amc_instances"])
+    args = {
+        "--source_bucket": request_body["sourceBucket"],
+        "--output_bucket": request_body["outputBucket"],
+        "--source_key": source_key,
+        "--pii_fields": request_body["piiFields"],
+        "--deleted_fields": request_body["deletedFields"],
+        "--dataset_id": request_body["datasetId"],
+        "--file_format": file_format,
+        "--update_strategy": request_body["updateStrategy"],
+        "--user_id": request_body["user_id"],
+        "--amc_instances": json.dumps(
+            [instance["instance_id"] for instance in amc_instances]
+        ),
+    }
+
+    # countryCode is optional
+    if request_body.get("countryCode"):
+        args["--country_code"] = request_body["countryCode"]
+
+    # timestampColumn is optional and will only be present for FACT datasets
+    if request_body.get("timestampColumn", "") != "":
+        args["--timestamp_column"] = request_body["timestampColumn"]
+
+    # timeseriesPartitionSize is optional and also partitions FACT datasets
+    # into output files by the day or hour of timestampColumn
+    timeseries_partition_size = validate_timeseries_partition_size(
+        request_body.get("timeseriesPartitionSize", "")
+    )
+    if timeseries_partition_size != "":
+        args["--timeseries_partition_size"] = timeseries_partition_size
+    return args
+
+
+def start_glue_job_runs(executor, job_arguments):
+    # Starts a Glue job run for each source key in parallel and returns
+    # (job run IDs, queued, errors) by source key. Runs that exceed the
+    # concurrent runs quota are queued and retried with exponential backoff
+    # until BATCH_TRANSFORMATION_RETRY_SECONDS have passed. Queued holds the
+    # quota error of runs that still exceed it then.
+    client = tasks.get_boto3_client("glue")
+    deadline = time.time() + BATCH_TRANSFORMATION_RETRY_SECONDS
+    retry_delay = 1
+    job_run_ids = {}
+    errors = {}
+    quota_errors = {}
+    queued = dict(job_arguments)
+    while queued:
+        futures = {
+            source_key: executor.submit(
+                client.start_job_run, JobName=AMC_GLUE_JOB_NAME, Arguments=args
+            )
+            for source_key, args in queued.items()
+        }
+        queued = {}
+        for source_key, future in futures.items():
+            try:
+                job_run_ids[source_key] = future.result()["JobRunId"]
+            except client.exceptions.ConcurrentRunsExceededException as ex:
+                queued[source_key] = job_arguments[source_key]
+                quota_errors[source_key] = str(ex)
+            except Exception as ex:
+                errors[source_key] = str(ex)
+        if time.time() + retry_delay > deadline:
+            break
+        if queued:
+            logger.info(f"Concurrent runs exceeded. Retrying {len(queued)} runs in {retry_delay}s.")
+            time.sleep(retry_delay)
+            retry_delay = min(retry_delay * 2, BATCH_TRANSFORMATION_MAX_RETRY_DELAY)
+    return job_run_ids, {source_key: quota_errors[source_key] for source_key in queued}, errors
+
+
 @app.route("/get_etl_jobs", cors=True, methods=["GET"], authorizer=authorizer)
 def get_etl_jobs():
     """
-    Retrieves metadata for all runs of a given Glue ETL job definition.
+    Retrieves metadata for the runs of the Glue ETL job definition, newest first.
+
+    Optional query string parameters:
+
+    * ``nextToken`` and ``maxResults`` are passed through to Glue GetJobRuns.
+    * ``dataset_id`` and ``state`` (comma separated) filter the runs.
+    * ``started_after`` and ``started_before`` are ISO-8601 times that filter
+      the runs by StartedOn.
+
+    Filters are applied to each page of runs, so a page may hold fewer than
+    ``maxResults`` runs and still be followed by a NextToken.
+
+    The first page of runs is cached for ETL_JOB_RUNS_CACHE_TTL_SECONDS.
+    Finished runs never change, so only new runs and the runs that were in
+    progress are read from Glue again.
 
     Returns:
 
     .. code-block:: python
 
-        {'JobRuns': [...]}
+        {'JobRuns': [...], 'NextToken': string}
     """
     log_request_parameters()
     try:
-        client = boto3.client("glue", config=config)
-        response = client.get_job_runs(JobName=AMC_GLUE_JOB_NAME)
-        for i in range(len(response["JobRuns"])):
-            if "Arguments" in response["JobRuns"][i]:
-                if response["JobRuns"][i]["Arguments"].get("--dataset_id"):
-                    response["JobRuns"][i]["DatasetId"] = response["JobRuns"][
-                        i
-                    ]["Arguments"]["--dataset_id"]
+        query_params = app.current_request.query_params or {}
+        page_size = max(
+            1,
+            min(
+                int(query_params.get("maxResults", ETL_JOB_RUNS_PAGE_SIZE)),
+                ETL_JOB_RUNS_PAGE_SIZE,
+            ),
+        )
+        if query_params.get("nextToken"):
+            response = tasks.get_boto3_client("glue").get_job_runs(
+                JobName=AMC_GLUE_JOB_NAME,
+                NextToken=query_params["nextToken"],
+                MaxResults=page_size,
+            )
+            job_runs = [format_etl_job_run(job_run) for job_run in response["JobRuns"]]
+            next_token = response.get("NextToken")
+        else:
+            job_runs, next_token = get_first_etl_job_runs(page_size)
+
+        dataset_id = query_params.get("dataset_id")
+        states = query_params.get("state")
+        states = set(states.upper().split(",")) if states else None
+        started_after = parse_iso_time(query_params.get("started_after"))
+        started_before = parse_iso_time(query_params.get("started_before"))
+        response = {
+            "JobRuns": [
+                job_run
+                for job_run in job_runs
+                if (not dataset_id or job_run.get("DatasetId") == dataset_id)
+                and (not states or job_run.get("JobRunState") in states)
+                and (not started_after or job_run["StartedOn"] >= started_after)
+                and (not started_before or job_run["StartedOn"] <= started_before)
+            ]
+        }
+        # Runs are listed newest first, so later pages hold no runs started
+        # after started_after once this page reaches it.
+        if next_token and not (
+            started_after and job_runs and job_runs[-1]["StartedOn"] < started_after
+        ):
+            response["NextToken"] = next_token
         return json.loads(json.dumps(response, default=str))
     except Exception as ex:
         logger.error(ex)
         return {"Status": "Error", "Message": str(ex)}
 
 
+def format_etl_job_run(job_run):
+    if job_run.get("Arguments", {}).get("--dataset_id"):
+        job_run["DatasetId"] = job_run["Arguments"]["--dataset_id"]
+    return job_run
+
+
+def parse_iso_time(value):
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
+def get_first_etl_job_runs(page_size):
+    # Returns the newest page_size runs of the Glue ETL job and the NextToken
+    # that follows them. The page is cached, and finished runs never change,
+    # so later calls only read the head of the run list: the runs started
+    # since the page was cached, down to the oldest cached run that was still
+    # in progress. If the page no longer fits in page_size runs, it is read
+    # again with one GetJobRuns request.
+    client = tasks.get_boto3_client("glue")
+    now = time.time()
+    cached = etl_job_runs_cache.get(page_size)
+    if cached and cached["expires_at"] > now:
+        job_runs = refresh_etl_job_runs(client, cached["job_runs"], page_size)
+        if job_runs is not None:
+            cached["job_runs"] = job_runs
+            return cached["job_runs"], cached["next_token"]
+
+    response = client.get_job_runs(JobName=AMC_GLUE_JOB_NAME, MaxResults=page_size)
+    cached = {
+        "job_runs": [format_etl_job_run(job_run) for job_run in response["JobRuns"]],
+        "next_token": response.get("NextToken"),
+        "expires_at": now + ETL_JOB_RUNS_CACHE_TTL_SECONDS,
+    }
+    etl_job_runs_cache[page_size] = cached
+    return cached["job_runs"], cached["next_token"]
+
+
+def refresh_etl_job_runs(client, cached_job_runs, page_size):
+    # Returns cached_job_runs with the runs started since they were read
+    # added first and the runs that were in progress updated, or None if they
+    # no longer fit in page_size runs.
+    cached_positions = {job_run["Id"]: position for position, job_run in enumerate(cached_job_runs)}
+    in_progress = [
+        position
+        for position, job_run in enumerate(cached_job_runs)
+        if job_run.get("JobRunState") not in GLUE_TERMINAL_STATES
+    ]
+    # Runs are listed newest first. Read down to the oldest run in progress,
+    # or to the first cached run, which ends the new runs.
+    if in_progress:
+        last_position = in_progress[-1]
+    else:
+        last_position = 0 if cached_job_runs else -1
+    new_job_runs = []
+    refreshed = {}
+    kwargs = {
+        "JobName": AMC_GLUE_JOB_NAME,
+        "MaxResults": min(last_position + 1 + ETL_JOB_RUNS_PROBE_SIZE, ETL_JOB_RUNS_PAGE_SIZE),
+    }
+    while True:
+        response = client.get_job_runs(**kwargs)
+        for job_run in response["JobRuns"]:
+            position = cached_positions.get(job_run["Id"])
+            if position is not None:
+                refreshed[position] = format_etl_job_run(job_run)
+            elif not refreshed:
+                # New runs are listed before the cached ones. Runs listed
+                # after them are older than the page.
+                new_job_runs.append(format_etl_job_run(job_run))
+        if len(new_job_runs) + len(cached_job_runs) > page_size:
+            return None
+        if max(refreshed, default=-1) >= last_position or "NextToken" not in response:
+            break
+        kwargs["NextToken"] = response["NextToken"]
+    return new_job_runs + [
+        refreshed.get(position, job_run) for position, job_run in enumerate(cached_job_runs)
+    ]
+
+
 @app.route(
     "/upload_status", cors=True, methods=["POST"], authorizer=authorizer
 )
@@ -341,6 +718,151 @@ def upload_status(**kwargs):
         return {"Status": "Error", "Message": str(e)}
 
 
+@app.route(
+    "/bulk_upload_status", cors=True, methods=["POST"], authorizer=authorizer
+)
+@tasks.authorize_amc_request(app=app)
+def bulk_upload_status(**kwargs):
+    """
+    Get the status of many AMC data upload operations with one request.
+
+    Uploads are specified either as a list of dataset and upload IDs, or as
+    one dataSetId, in which case every upload listed for that dataset is
+    included. Statuses are requested from AMC concurrently.
+
+    Body:
+
+    .. code-block:: python
+
+        {
+            "uploads": [{"dataSetId": string, "uploadId": string}, ...],
+            "dataSetId": string,
+            "nextToken": string
+        }
+
+    Only one of uploads or dataSetId is required. At most
+    BULK_UPLOAD_STATUS_MAX_UPLOADS uploads may be listed. Uploads of a dataset
+    are listed one page at a time until that many are found. If the dataset
+    has more uploads, pass the returned nextToken to get the status of the rest.
+
+    Returns:
+
+    .. code-block:: python
+
+        {
+            "uploads": [{
+                "dataSetId": string,
+                "uploadId": string,
+                "statusCode": integer,
+                "response": { dict }
+                },
+                ...
+            ],
+            "summary": {status: count, ...},
+            "nextToken": string
+        }
+
+    An upload that could not be requested has an "error" message instead
+    of statusCode and response.
+    """
+    log_request_parameters()
+    try:
+        request_body = app.current_request.json_body
+        request_kwargs = {**kwargs, **request_body}
+        next_token = None
+        if "uploads" in request_body:
+            uploads = [
+                {"dataSetId": upload["dataSetId"], "uploadId": upload["uploadId"]}
+                for upload in request_body["uploads"]
+            ]
+            if len(uploads) > BULK_UPLOAD_STATUS_MAX_UPLOADS:
+                raise BadRequestError(
+                    f"Number of uploads cannot exceed {BULK_UPLOAD_STATUS_MAX_UPLOADS}."
+                )
+        else:
+            uploads, next_token = list_dataset_uploads(
+                request_body["dataSetId"], request_body.get("nextToken"), request_kwargs
+            )
+
+        responses = tasks.fan_out_amc_requests(
+            [
+                (
+                    tasks.AsyncAMCRequests(
+                        amc_path=f"/uploads/{upload['dataSetId']}/{upload['uploadId']}",
+                        http_method="GET",
+                    ),
+                    request_kwargs,
+                )
+                for upload in uploads
+            ]
+        )
+
+        results = []
+        summary = {}
+        for upload, response in zip(uploads, responses):
+            if isinstance(response, Exception):
+                results.append({**upload, "error": str(response)})
+                status = "ERROR"
+            else:
+                response_json = tasks.safe_json_loads(response.text)
+                results.append(
+                    {
+                        **upload,
+                        "statusCode": response.status_code,
+                        "response": response_json,
+                    }
+                )
+                status = "ERROR"
+                if response.status_code == 200 and isinstance(response_json, dict):
+                    status = str(response_json.get("status", "UNKNOWN"))
+            summary[status] = summary.get(status, 0) + 1
+
+        result = {"uploads": results, "summary": summary}
+        if next_token:
+            result["nextToken"] = next_token
+        return result
+    except Exception as ex:
+        logger.error(ex)
+        return {"Status": "Error", "Message": str(ex)}
+
+
+# This function lists pages of uploads of an AMC dataset, starting at
+# next_token, until no more pages fit in BULK_UPLOAD_STATUS_MAX_UPLOADS.
+# It returns those uploads and the token for the remaining uploads. A page
+# that does not fit is listed again with the returned token. Only a single
+# page with more than BULK_UPLOAD_STATUS_MAX_UPLOADS uploads is cut short.
+def list_dataset_uploads(data_set_id, next_token, request_kwargs):
+    uploads = []
+    while len(uploads) < BULK_UPLOAD_STATUS_MAX_UPLOADS:
+        request_parameters = {"dataSetId": data_set_id}
+        if next_token:
+            request_parameters["nextToken"] = next_token
+        response = tasks.AMCRequests(
+            amc_path="/uploads/list",
+            http_method="POST",
+            request_parameters=request_parameters,
+        ).process_request(**request_kwargs)
+        if response.status_code != 200:
+            raise ChaliceViewError(f"Failed to list uploads: {response.text}")
+        response_json = response.json()
+        page = [
+            {"dataSetId": data_set_id, "uploadId": upload["uploadId"]}
+            for upload in response_json.get("uploads", [])
+        ]
+        if uploads and len(uploads) + len(page) > BULK_UPLOAD_STATUS_MAX_UPLOADS:
+            break
+        if len(page) > BULK_UPLOAD_STATUS_MAX_UPLOADS:
+            logger.warning(
+                f"Listed {len(page)} uploads of dataset {data_set_id} in one page. "
+                f"Only the first {BULK_UPLOAD_STATUS_MAX_UPLOADS} are included."
+            )
+        uploads.extend(page[:BULK_UPLOAD_STATUS_MAX_UPLOADS])
+        next_token = response_json.get("nextToken")
+        if not next_token:
+            break
+    return uploads, next_token
+
+
 @app.route("/list_uploads", cors=True, methods=["POST"], authorizer=authorizer)
 @tasks.authorize_amc_request(app=app)
 def list_uploads(**kwargs):
@@ -383,6 +905,7 @@ def list_uploads(**kwargs):
 @app.route(
     "/get_amc_instances", cors=True, methods=["POST"], authorizer=authorizer
 )
+@serve_cached_amc_response("amc_instances")
 @tasks.authorize_amc_request(app=app)
 def get_amc_instances(**kwargs):
     """
@@ -397,18 +920,21 @@ def get_amc_instances(**kwargs):
     """
     log_request_parameters()
     try:
-        amc_request = tasks.AMCRequests(
-            amc_path="/amc/instances",
-            http_method="GET",
-            is_amc_report=False,
-        )
-        response = amc_request.process_request(
-            **kwargs, **app.current_request.json_body
-        )
-        return Response(
-            body=response.text,
-            status_code=response.status_code,
-            headers={"Content-Type": JSON_CONTENT_TYPE},
+        def get_amc_instances():
+            amc_request = tasks.AMCRequests(
+                amc_path="/amc/instances",
+                http_method="GET",
+                is_amc_report=False,
+            )
+            response = amc_request.process_request(
+                **kwargs, **app.current_request.json_body
+            )
+            return response.text, response.status_code
+
+        return cache_amc_response(
+            scope="amc_instances",
+            key=app.current_request.json_body.get("user_id", ""),
+            get_response=get_amc_instances,
         )
     except Exception as ex:
         logger.error(ex)
@@ -418,6 +944,7 @@ def get_amc_instances(**kwargs):
 @app.route(
     "/get_amc_accounts", cors=True, methods=["POST"], authorizer=authorizer
 )
+@serve_cached_amc_response("amc_accounts")
 @tasks.authorize_amc_request(app=app)
 def get_amc_accounts(**kwargs):
     """
@@ -432,18 +959,21 @@ def get_amc_accounts(**kwargs):
     """
     log_request_parameters()
     try:
-        amc_request = tasks.AMCRequests(
-            amc_path="/amc/accounts",
-            http_method="GET",
-            is_amc_report=False,
-        )
-        response = amc_request.process_request(
-            **kwargs, **app.current_request.json_body
-        )
-        return Response(
-            body=response.text,
-            status_code=response.status_code,
-            headers={"Content-Type": JSON_CONTENT_TYPE},
+        def get_amc_accounts():
+            amc_request = tasks.AMCRequests(
+                amc_path="/amc/accounts",
+                http_method="GET",
+                is_amc_report=False,
+            )
+            response = amc_request.process_request(
+                **kwargs, **app.current_request.json_body
+            )
+            return response.text, response.status_code
+
+        return cache_amc_response(
+            scope="amc_accounts",
+            key=app.current_request.json_body.get("user_id", ""),
+            get_response=get_amc_accounts,
         )
     except Exception as ex:
         logger.error(ex)
@@ -465,7 +995,7 @@ def list_upload_failures():
 
     """
     log_request_parameters()
-    dynamo_resource = boto3.resource("dynamodb", config=config)
+    dynamo_resource = tasks.get_boto3_resource("dynamodb")
     try:
         dataset_id = app.current_request.json_body["dataSetId"]
         instance_id = app.current_request.json_body["instance_id"]
@@ -488,6 +1018,102 @@ def list_upload_failures():
         return {"Status": "Error", "Message": str(ex)}
 
 
+@app.route(
+    "/batch_list_upload_failures", cors=True, methods=["POST"], authorizer=authorizer
+)
+def batch_list_upload_failures():
+    """
+    List the upload failure messages of many datasets and AMC instances at once.
+
+    The request body contains either a list of ``{"dataSetId", "instance_id"}``
+    pairs, which are read with BatchGetItem, or a ``dataSetId`` alone, in which
+    case the failures recorded for that dataset in every AMC instance are
+    returned. Pairs without a recorded failure are left out of the response.
+
+    Returns:
+
+    .. code-block:: python
+
+        {
+            "failures": [
+                {"dataSetId": string, "instance_id": string, "message": string}
+            ]
+        }
+
+    """
+    log_request_parameters()
+    try:
+        request_body = app.current_request.json_body
+        upload_failures_table = tasks.get_boto3_resource("dynamodb").Table(
+            UPLOAD_FAILURES_TABLE_NAME
+        )
+        if "items" in request_body:
+            items = batch_get_upload_failures(
+                [
+                    {"instance_id": item["instance_id"], "dataset_id": item["dataSetId"]}
+                    for item in request_body["items"]
+                ]
+            )
+        else:
+            query_kwargs = {
+                "IndexName": UPLOAD_FAILURES_DATASET_INDEX,
+                "KeyConditionExpression": Key("dataset_id").eq(
+                    request_body["dataSetId"]
+                ),
+            }
+            items = []
+            while True:
+                response = upload_failures_table.query(**query_kwargs)
+                items.extend(response["Items"])
+                if "LastEvaluatedKey" not in response:
+                    break
+                query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return {
+            "failures": [
+                {
+                    "dataSetId": item["dataset_id"],
+                    "instance_id": item["instance_id"],
+                    "message": item["Value"],
+                }
+                for item in items
+            ]
+        }
+    except Exception as ex:
+        logger.error(ex)
+        return {"Status": "Error", "Message": str(ex)}
+
+
+def batch_get_upload_failures(keys):
+    # Reads upload failure items with BatchGetItem, BATCH_GET_ITEM_MAX_KEYS
+    # keys at a time. Keys that DynamoDB did not process, usually because
+    # the table is throttled, are retried with exponential backoff.
+    dynamo_resource = tasks.get_boto3_resource("dynamodb")
+    # BatchGetItem rejects duplicate keys.
+    keys = list({(key["instance_id"], key["dataset_id"]): key for key in keys}.values())
+    items = []
+    for start in range(0, len(keys), BATCH_GET_ITEM_MAX_KEYS):
+        request_items = {
+            UPLOAD_FAILURES_TABLE_NAME: {
+                "Keys": keys[start:start + BATCH_GET_ITEM_MAX_KEYS],
+                "ConsistentRead": True,
+            }
+        }
+        retry = 0
+        while request_items:
+            response = dynamo_resource.batch_get_item(RequestItems=request_items)
+            items.extend(response["Responses"].get(UPLOAD_FAILURES_TABLE_NAME, []))
+            request_items = response.get("UnprocessedKeys")
+            if not request_items:
+                break
+            if retry == BATCH_GET_ITEM_MAX_RETRY:
+                raise ChaliceViewError(
+                    f"Failed to read upload failures after {BATCH_GET_ITEM_MAX_RETRY} retries."
+                )
+            time.sleep(BATCH_GET_ITEM_BACKOFF_SECONDS * 2 ** retry)
+            retry += 1
+    return items
+
+
 @app.route(
     "/delete_dataset", cors=True, methods=["POST"], authorizer=authorizer
 )
@@ -517,7 +1143,8 @@ def delete_dataset(**kwargs):
             **kwargs, **app.current_request.json_body
         )
         if response.status_code == 200:
-            dynamo_resource = boto3.resource("dynamodb", config=config)
+            response_cache.invalidate(datasets_cache_scope())
+            dynamo_resource = tasks.get_boto3_resource("dynamodb")
             item_key = {
                 "instance_id": app.current_request.json_body["instance_id"],
                 "dataset_id": dataset_id,
@@ -569,46 +1196,89 @@ def version():
     authorizer=authorizer,
 )
 def list_bucket():
-    """List the contents of a user-specified S3 bucket
+    """List one page of objects in a user-specified S3 bucket
 
     Body:
 
     .. code-block:: python
 
         {
-            "s3bucket": string
+            "s3bucket": string,
+            "prefix": string,
+            "delimiter": string,
+            "page_size": integer,
+            "continuation_token": string,
+            "suffixes": [string, ...]
         }
 
+    Only s3bucket is required. Set delimiter to "/" to list one folder level
+    at a time. page_size defaults to, and is limited to, LIST_BUCKET_PAGE_SIZE.
+    Pass the continuation_token from the previous response to get the next
+    page. When suffixes (e.g. [".csv", ".json", ".gz"]) are specified, only
+    keys ending with one of them are returned, so a page may hold fewer than
+    page_size objects.
 
     Returns:
-        A list of S3 keys (i.e. paths and file names) for all objects in the bucket.
+        S3 keys (i.e. paths and file names) for the objects in one page.
 
         .. code-block:: python
 
             {
                 "objects": [{
-                    "key": string
+                    "key": string,
+                    "last_modified": string,
+                    "size": integer
                     },
                     ...
+                ],
+                "common_prefixes": [string, ...],
+                "next_continuation_token": string
             }
 
+        next_continuation_token is null on the last page.
+
     Raises:
         500: ChaliceViewError - internal server error
     """
     log_request_parameters()
     try:
-        s3_obj = boto3.resource("s3", config=config)
-        bucket = json.loads(app.current_request.raw_body.decode())["s3bucket"]
+        s3 = tasks.get_boto3_client("s3")
+        request_body = json.loads(app.current_request.raw_body.decode())
+        page_size = int(request_body.get("page_size") or LIST_BUCKET_PAGE_SIZE)
+        list_kwargs = {
+            "Bucket": request_body["s3bucket"],
+            "MaxKeys": max(1, min(page_size, LIST_BUCKET_PAGE_SIZE)),
+        }
+        if request_body.get("prefix"):
+            list_kwargs["Prefix"] = request_body["prefix"]
+        if request_body.get("delimiter"):
+            list_kwargs["Delimiter"] = request_body["delimiter"]
+        if request_body.get("continuation_token"):
+            list_kwargs["ContinuationToken"] = request_body["continuation_token"]
+        suffixes = tuple(
+            suffix.lower() for suffix in request_body.get("suffixes") or []
+        )
+        # Fetch a single page so that latency does not depend on bucket size.
+        response = s3.list_objects_v2(**list_kwargs)
         results = []
-        for s3object in s3_obj.Bucket(bucket).objects.all():
+        for s3object in response.get("Contents", []):
+            if suffixes and not s3object["Key"].lower().endswith(suffixes):
+                continue
             results.append(
                 {
-                    "key": s3object.key,
-                    "last_modified": s3object.last_modified.isoformat(),
-                    "size": s3object.size,
+                    "key": s3object["Key"],
+                    "last_modified": s3object["LastModified"].isoformat(),
+                    "size": s3object["Size"],
                 }
             )
-        return json.dumps(results)
+        return {
+            "objects": results,
+            "common_prefixes": [
+                common_prefix["Prefix"]
+                for common_prefix in response.get("CommonPrefixes", [])
+            ],
+            "next_continuation_token": response.get("NextContinuationToken"),
+        }
     except Exception as ex:
         logger.error(ex)
         return {"Status": "Error", "Message": str(ex)}
@@ -673,17 +1343,28 @@ def get_data_columns():
         if len(keys) > 200:
             raise BadRequestError("Number of files selected cannot exceed 200.")
 
-        # If file format is unspecified then infer it from the first file:
-        if file_format == "":
-            file_format = get_file_format(s3bucket, keys[0])
+        # Read the first line of every file concurrently. The file format is
+        # inferred from the first file if it is unspecified.
+        s3 = get_header_sniff_client()
+        with ThreadPoolExecutor(
+            max_workers=min(HEADER_SNIFF_MAX_WORKERS, len(keys))
+        ) as executor:
+            headers = executor.map(
+                partial(read_file_header, s3, s3bucket), keys
+            )
+            content_type, first_line = next(headers)
+            if file_format == "":
+                file_format = file_format_from_content_type(content_type, keys[0])
 
-        # Get the list of data fields from the first file:
-        first_file_description = describe_file(s3bucket, keys[0], file_format)
+            # Get the list of data fields from the first file:
+            first_file_description = describe_header(first_line, file_format)
 
-        # Make sure all files have the same format and data fields:
-        for key in keys[1:]:
-            if describe_file(s3bucket, key, file_format) != first_file_description:
-                raise BadRequestError("Every file must have the same format and data fields.")
+            # Make sure all files have the same format and data fields. Stop
+            # at the first file that does not match.
+            for _, line in headers:
+                if describe_header(line, file_format) != first_file_description:
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    raise BadRequestError("Every file must have the same format and data fields.")
 
         return first_file_description
 
@@ -711,9 +1392,12 @@ def extract_request_parameters(request):
 # This function determines whether the input file contains data formatted as
 # CSV or JSON.
 def get_file_format(bucket, key):
-    s3_obj = boto3.client("s3", config=config)
+    s3_obj = tasks.get_boto3_client("s3")
     head_object_response = s3_obj.head_object(Bucket=bucket, Key=key)
-    content_type = head_object_response["ContentType"]
+    return file_format_from_content_type(head_object_response["ContentType"], key)
+
+
+def file_format_from_content_type(content_type, key):
     if content_type == JSON_CONTENT_TYPE:
         file_format = "JSON"
     elif content_type == CSV_CONTENT_TYPE:
@@ -734,28 +1418,88 @@ def get_file_format(bucket, key):
     return file_format
 
 
-# This function reads the first row of the input file and returns the data
-# fields present in that row along with the content_type of the file.
-def describe_file(bucket, key, file_format):
+def get_header_sniff_client():
+    # One client is shared by all header reads so that they reuse a
+    # connection pool large enough for HEADER_SNIFF_MAX_WORKERS threads.
+    return tasks.get_boto3_client("s3", HEADER_SNIFF_CLIENT_CONFIG)
+
+
+# This function returns the content_type and the first line of the input file.
+def read_file_header(s3, bucket, key):
+    content_type, _, lines = read_file_lines(s3, bucket, key, num_lines=1)
+    return content_type, lines[0] if lines else ""
+
+
+# This function returns the content_type, ETag, and up to num_lines complete
+# lines from the start of the input file. The file is read with ranged GET
+# requests of chunk_size bytes, so usually only one small request is made per
+# file. Gzipped files are decompressed incrementally until enough lines are
+# read. If if_none_match is the current ETag of the file then (None, ETag, None)
+# is returned without reading the file.
+def read_file_lines(
+    s3,
+    bucket,
+    key,
+    num_lines,
+    chunk_size=HEADER_SNIFF_BYTES,
+    max_bytes=HEADER_SNIFF_MAX_BYTES,
+    if_none_match=None,
+):
+    decompressor = None
+    content_type = None
+    etag = None
+    data = b""
+    start = 0
+    end_of_file = False
+    while start < max_bytes:
+        get_object_kwargs = {
+            "Bucket": bucket,
+            "Key": key,
+            "Range": f"bytes={start}-{start + chunk_size - 1}",
+        }
+        if start == 0 and if_none_match:
+            get_object_kwargs["IfNoneMatch"] = if_none_match
+        try:
+            response = s3.get_object(**get_object_kwargs)
+        except s3.exceptions.ClientError as ex:
+            error_code = ex.response["Error"]["Code"]
+            if error_code in ("304", "NotModified"):
+                return None, if_none_match, None
+            # Ranges that start past the end of the file are not satisfiable.
+            if error_code == "InvalidRange":
+                end_of_file = True
+                break
+            raise
+        content_type = content_type or response["ContentType"]
+        etag = etag or response["ETag"]
+        chunk = response["Body"].read()
+        if start == 0 and chunk[:2] == GZIP_MAGIC_NUMBER:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        data += decompressor.decompress(chunk) if decompressor else chunk
+        end_of_file = len(chunk) < chunk_size
+        if end_of_file or data.count(b"\n") >= num_lines:
+            break
+        start += len(chunk)
+    lines = data.decode("utf-8-sig", errors="ignore").split("\n")
+    # Unless the whole file was read, the last line may be incomplete.
+    if not end_of_file:
+        lines = lines[:-1]
+    lines = [line.rstrip("\r") for line in lines]
+    return content_type, etag, [line for line in lines if line][:num_lines]
+
+
+# This function returns the data fields present in the first line of the
+# input file along with the content_type of the file.
+def describe_header(first_line, file_format):
     try:
         file_description = None
         if file_format == "JSON":
-            dfs = wr.s3.read_json(
-                path=["s3://" + bucket + "/" + key],
-                chunksize=1,
-                lines=True,
-            )
-            chunk = next(dfs)
-            columns = chunk.columns.to_list()
+            columns = list(json.loads(first_line).keys())
             file_description = json.dumps(
                 {"columns": columns, "content_type": JSON_CONTENT_TYPE}
             )
         elif file_format == "CSV":
-            dfs = wr.s3.read_csv(
-                path=["s3://" + bucket + "/" + key], chunksize=1
-            )
-            chunk = next(dfs)
-            columns = chunk.columns.to_list()
+            columns = next(csv.reader([first_line]))
             file_description = json.dumps(
                 {"columns": columns, "content_type": CSV_CONTENT_TYPE}
             )
@@ -764,6 +1508,129 @@ def describe_file(bucket, key, file_format):
         logger.error(ex)
         return {"Status": "Error", "Message": str(ex)}
 
+@app.route(
+    "/infer_data_schema",
+    cors=True,
+    methods=["POST"],
+    content_types=[JSON_CONTENT_TYPE],
+    authorizer=authorizer,
+)
+def infer_data_schema():
+    """Infer the data type and likely PII type of each column in a JSON or CSV file.
+
+       The first rows of the file are sampled with ranged reads and checked
+       with the validators used by the normalizers in the Glue ETL job.
+       Columns in which every sampled value is a SHA-256 hash are flagged as
+       hashed. Results are cached until the ETag of the file changes.
+
+    Body:
+        fileFormat, countryCode, and sampleRows are optional. If fileFormat
+        is not specified then it will be inferred from the content_type
+        specified by S3. sampleRows defaults to SCHEMA_SAMPLE_ROWS and is
+        limited to SCHEMA_MAX_SAMPLE_ROWS.
+
+        .. code-block:: python
+
+            {
+                "s3bucket": string,
+                "s3key": string,
+                "fileFormat": string,
+                "countryCode": string,
+                "sampleRows": integer
+            }
+
+    Returns:
+        Inferred schema of the file.
+
+        .. code-block:: python
+
+            {
+                "columns": [{
+                    "column_name": string,
+                    "data_type": string,
+                    "pii_type": string,
+                    "hashed": boolean,
+                    "match_ratio": number,
+                    "null_count": integer
+                    },
+                    ...
+                ],
+                "content_type": string,
+                "sampled_rows": integer
+            }
+
+        If the file cannot be read, is empty, or has an unsupported format,
+        then an error message is returned instead.
+
+        .. code-block:: python
+
+            {
+                "Status": "Error",
+                "Message": string
+            }
+    """
+    log_request_parameters()
+    try:
+        current_request = json.loads(app.current_request.raw_body.decode())
+        s3bucket, keys, file_format = extract_request_parameters(current_request)
+        country_code = current_request.get("countryCode") or None
+        sample_rows = max(
+            1,
+            min(
+                int(current_request.get("sampleRows") or SCHEMA_SAMPLE_ROWS),
+                SCHEMA_MAX_SAMPLE_ROWS,
+            ),
+        )
+        cache_key = (s3bucket, keys[0], file_format, country_code, sample_rows)
+        cached_etag, cached_schema = schema_cache.get(cache_key, (None, None))
+
+        # Only the first rows are read. If the file has not changed since the
+        # schema was cached, then S3 returns 304 Not Modified and nothing is read.
+        content_type, etag, lines = read_file_lines(
+            get_header_sniff_client(),
+            s3bucket,
+            keys[0],
+            num_lines=sample_rows + 1,
+            chunk_size=SCHEMA_SAMPLE_BYTES,
+            max_bytes=SCHEMA_SAMPLE_MAX_BYTES,
+            if_none_match=cached_etag,
+        )
+        if lines is None:
+            schema_cache.move_to_end(cache_key)
+            return cached_schema
+        if not lines:
+            return {"Status": "Error", "Message": f"The file {keys[0]} is empty."}
+
+        if file_format == "":
+            file_format = file_format_from_content_type(content_type, keys[0])
+        if file_format == "JSON":
+            rows = [json.loads(line) for line in lines]
+            columns = list(dict.fromkeys(column for row in rows for column in row))
+            content_type = JSON_CONTENT_TYPE
+        else:
+            columns, *values = list(csv.reader(lines))
+            rows = [dict(zip(columns, row)) for row in values]
+            content_type = CSV_CONTENT_TYPE
+        rows = rows[:sample_rows]
+
+        schema = {
+            "columns": load_schema_inference().infer_schema(
+                columns, rows, country_code
+            ),
+            "content_type": content_type,
+            "sampled_rows": len(rows),
+        }
+        schema_cache[cache_key] = (etag, schema)
+        schema_cache.move_to_end(cache_key)
+        while len(schema_cache) > SCHEMA_CACHE_SIZE:
+            schema_cache.popitem(last=False)
+        return schema
+
+    except Exception as e:
+        logger.error(e)
+        return {"Status": "Error", "Message": str(e)}
+
+
 # Validate the AmcInstances parameter
 def validate_amc_system_parameter(system_parameter):
     if "Name" not in system_parameter:
@@ -814,7 +1681,7 @@ def save_system_configuration():
         500: ChaliceViewError - internal server error
     """
     log_request_parameters()
-    dynamo_resource = boto3.resource("dynamodb", config=config)
+    dynamo_resource = tasks.get_boto3_resource("dynamodb")
 
     try:
         system_parameter = json.loads(app.current_request.raw_body.decode())
@@ -825,8 +1692,12 @@ def save_system_configuration():
         logger.error("Exception: {}".format(ex))
         return {"Status": "Error", "Message": str(ex)}
 
+    # Change the Version attribute on every save so that consumers which
+    # cache the AMC instance list (e.g. amc_uploader) know to reload it.
+    system_parameter["Version"] = str(uuid.uuid4())
     system_table.put_item(Item=system_parameter)
-    tasks.apply_amc_bucket_permission()
+    # Use the saved AMC instances rather than reading them back from the table.
+    tasks.apply_amc_bucket_permission(amc_instances=system_parameter["Value"])
     return {}
 
 
@@ -847,7 +1718,7 @@ def get_system_configuration():
         200: The system configuration was returned successfully.
         500: ChaliceViewError - internal server error
     """
-    dynamodb_resource = boto3.resource("dynamodb", config=config)
+    dynamodb_resource = tasks.get_boto3_resource("dynamodb")
     try:
         system_table = dynamodb_resource.Table(SYSTEM_TABLE_NAME)
         response = system_table.scan(ConsistentRead=True)
@@ -857,6 +1728,20 @@ def get_system_configuration():
     return response["Items"]
 
 
+def cache_amc_response(scope, key, get_response):
+    # Calls get_response() to get the (body, status_code) of a new response,
+    # which is cached if it succeeded. Cached responses are served by
+    # serve_cached_amc_response.
+    body, status_code = get_response()
+    if status_code == 200:
+        response_cache.put(scope, key, body)
+    return Response(
+        body=body,
+        status_code=status_code,
+        headers={"Content-Type": JSON_CONTENT_TYPE, "X-Cache": "Miss"},
+    )
+
+
 def log_request_parameters():
     logger.info("Processing the following request:\n")
     logger.info(
@@ -0,0 +1,107 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###########################################################################
+# This file contains a cache for responses from read-only AMC endpoints.
+#
+# Responses are kept in memory for RESPONSE_CACHE_TTL_SECONDS. When
+# RESPONSE_CACHE_TABLE_NAME is set, responses are also saved in that DynamoDB
+# table so that they are shared by every container of the API Lambda, and
+# DynamoDB removes them with a TTL on the expires_at attribute.
+#
+# Entries are grouped by scope (e.g. the datasets of one AMC instance) so
+# that every entry of a scope can be invalidated at once. Entries in the
+# memory of other containers expire after RESPONSE_CACHE_TTL_SECONDS.
+#
+# Cache errors are logged and never fail a request.
+#
+##########################################################################
+
+import logging
+import os
+import time
+
+from chalicelib.tasks import tasks
+
+RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get("RESPONSE_CACHE_TTL_SECONDS", "60"))
+RESPONSE_CACHE_TABLE_NAME = os.environ.get("RESPONSE_CACHE_TABLE_NAME", "")
+
+logger = logging.getLogger()
+
+
+class ResponseCache:
+    def __init__(self, ttl_seconds=RESPONSE_CACHE_TTL_SECONDS, table_name=RESPONSE_CACHE_TABLE_NAME):
+        self.ttl_seconds = ttl_seconds
+        self.table_name = table_name
+        # scope -> {key: (expires_at, body)}
+        self.entries = {}
+
+    def clear(self):
+        self.entries = {}
+
+    def get_table(self):
+        return tasks.get_boto3_resource("dynamodb").Table(self.table_name)
+
+    def get(self, scope, key):
+        # Returns the cached response body, or None.
+        now = time.time()
+        expires_at, body = self.entries.get(scope, {}).get(key, (0, None))
+        if expires_at > now:
+            return body
+        if not self.table_name:
+            return None
+        try:
+            item = self.get_table().get_item(
+                Key={"cache_scope": scope, "cache_key": key}
+            ).get("Item")
+        except Exception as ex:
+            logger.error(f"Failed to read response cache: {ex}")
+            return None
+        # DynamoDB deletes expired items in the background, so they may still
+        # be returned for a while after they expire.
+        if not item or int(item["expires_at"]) <= now:
+            return None
+        self.entries.setdefault(scope, {})[key] = (
+            min(int(item["expires_at"]), now + self.ttl_seconds),
+            item["body"],
+        )
+        return item["body"]
+
+    def put(self, scope, key, body):
+        expires_at = int(time.time()) + self.ttl_seconds
+        self.entries.setdefault(scope, {})[key] = (expires_at, body)
+        if not self.table_name:
+            return
+        try:
+            self.get_table().put_item(
+                Item={
+                    "cache_scope": scope,
+                    "cache_key": key,
+                    "body": body,
+                    "expires_at": expires_at,
+                }
+            )
+        except Exception as ex:
+            logger.error(f"Failed to write response cache: {ex}")
+
+    def invalidate(self, scope):
+        self.entries.pop(scope, None)
+        if not self.table_name:
+            return
+        try:
+            table = self.get_table()
+            query_kwargs = {
+                "KeyConditionExpression": "cache_scope = :scope",
+                "ExpressionAttributeValues": {":scope": scope},
+                "ProjectionExpression": "cache_scope, cache_key",
+            }
+            with table.batch_writer() as batch:
+                while True:
+                    response = table.query(**query_kwargs)
+                    for item in response["Items"]:
+                        batch.delete_item(Key=item)
+                    if "LastEvaluatedKey" not in response:
+                        break
+                    query_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        except Exception as ex:
+            logger.error(f"Failed to invalidate response cache: {ex}")
@@ -16,3 +16,10 @@ import sys
 
 sys.path.insert(0, "..")
 tasks = importlib.import_module("share.tasks")
+metrics = importlib.import_module("share.metrics")
+
+
+def load_schema_inference():
+    # Imported on first use so that only /infer_data_schema pays for loading
+    # phonenumbers.
+    return importlib.import_module("library.schema_inference")
@@ -5,22 +5,32 @@
 #   Normalize and hash clear-text PII, and partition time series datasets for AMC.
 #
 # PREREQUISITES:
-#   Timestamp columns must be formatted according to ISO 8601.
+#   Timestamp columns must be formatted according to ISO 8601. Rows whose timestamp cannot be parsed are dropped, and their number and row numbers are printed to the job log.
 #
 # INPUT:
 #   --source_bucket: S3 bucket containing input file
 #   --output_bucket: S3 bucket for output data
 #   --source_key: S3 key of input file.
 #   --timestamp_column: Column name containing timestamps for time series datasets (e.g. FACT). Leave blank for datasets that are not time series (e.g. DIMENSION).
-#   --pii_fields: json formatted array containing column names that need to be hashed and the PII type of their data. The type must be FIRST_NAME, LAST_NAME, PHONE, ADDRESS, CITY, STATE, ZIP, or EMAIL.
+#   --timeseries_partition_size: "P1D" or "PT1H" to also partition time series datasets into output files by the day or hour (UTC) of their timestamps, sorted by timestamp. Output files are named after their day or hour, e.g. [source_key]-20240101T13_0.gz, so re-uploading a file that covers a few days or hours only replaces the output files of those days or hours. Leave blank to partition by size only.
+#   --pii_fields: json formatted array containing column names that need to be hashed and the PII type of their data. The type must be FIRST_NAME, LAST_NAME, PHONE, ADDRESS, CITY, STATE, ZIP, or EMAIL. Set "hashed": true on columns that are already hashed, such as those reported by the /infer_data_schema API, to skip normalizing and hashing them when every value is a sha256 hash.
 #   --deleted_fields: array of strings indicating the names of columns which the user requested to be dropped from the dataset prior to uploading to AMC.
 #   --dataset_id: name of dataset, used as the prefix folder for the output s3key.
 #   --country_code: country-specific normalization to apply to all rows in the dataset (2-digit ISO country code).
 #   --amc_instances: List of AMC instances to receive uploads
+#   --enable_job_metrics: "true" to put the wall time, CPU time, peak memory and rows of each stage, and the skipped and invalidated records of each PII type, in CloudWatch metrics (namespace amcufa).
+#   --engine: "pandas" (default) or "arrow". The arrow engine holds strings in Arrow arrays and normalizes them with pyarrow.compute kernels, which uses less memory and time. Output is identical, except that integer CSV columns with missing values are written as integers instead of floats.
+#   --compression_backend: gzip implementation for output files: "auto" (default, the fastest available of isal, zlib-ng and zlib), "isal", "zlib-ng" or "zlib".
+#   --compression_level: gzip compression level from 1 (fastest) to 9 (smallest, default). isa-l has four levels, to which 1-2, 3-4, 5-6 and 7-9 are mapped.
+#   --compression_threads: number of threads that compress each output file (default 1). With more than one, blocks are compressed in parallel and the output is still standard gzip.
+#   --profile_normalize: "true" to run the normalize stage under cProfile and save its output to s3://[output_bucket]/profiles/[dataset_id]/[JOB_RUN_ID]/normalize.prof
 #
 # OUTPUT:
 #   - Transformed data files in user-specified output bucket,
-#     partitioned according to AMC spec.
+#     partitioned according to AMC spec, and a manifest file that lists them
+#     (in time order when partitioned with --timeseries_partition_size).
+#   - A JSON line in the job log with the performance profile of each stage
+#     and PII column.
 #
 # SAMPLE COMMAND-LINE USAGE:
 #
@@ -41,6 +51,7 @@
 import sys
 
 from awsglue.utils import GlueArgumentError, getResolvedOptions
+from library import arrow_engine, output_writer
 from library import read_write as rw
 from library import transform
 
@@ -61,7 +72,17 @@ REQUIRED_PARAMS = [
     "amc_instances",
     "update_strategy"
 ]
-OPTIONAL_PARAMS = ["timestamp_column", "country_code"]
+OPTIONAL_PARAMS = [
+    "timestamp_column",
+    "country_code",
+    "enable_job_metrics",
+    "profile_normalize",
+    "engine",
+    "compression_backend",
+    "compression_level",
+    "compression_threads",
+    "timeseries_partition_size",
+]
 
 
 def check_params(required: list, optional: list) -> dict:
@@ -106,6 +127,31 @@ def check_params(required: list, optional: list) -> dict:
         print("ERROR: Invalid file format for input files:")
         print(args["file_format"])
         sys.exit(1)
+    if args.get("engine") and args.get("engine") not in ("pandas", "arrow"):
+        print("ERROR: Invalid engine:")
+        print(args["engine"])
+        sys.exit(1)
+    if args.get("timeseries_partition_size") and args.get("timeseries_partition_size") not in ("P1D", "PT1H"):
+        print("ERROR: Invalid timeseries partition size:")
+        print(args["timeseries_partition_size"])
+        sys.exit(1)
+    if args.get("compression_backend") and args.get("compression_backend") not in (
+        "auto",
+        *output_writer.available_compression_backends(),
+    ):
+        print("ERROR: Invalid or unavailable compression backend:")
+        print(args["compression_backend"])
+        sys.exit(1)
+    if args.get("compression_level") and args.get("compression_level") not in [str(level) for level in range(1, 10)]:
+        print("ERROR: Invalid compression level:")
+        print(args["compression_level"])
+        sys.exit(1)
+    if args.get("compression_threads") and not (
+        args.get("compression_threads").isdigit() and int(args.get("compression_threads")) >= 1
+    ):
+        print("ERROR: Invalid number of compression threads:")
+        print(args["compression_threads"])
+        sys.exit(1)
     if len(args["amc_instances"]) == 0:
         print("amc_instances cannot be empty")
         sys.exit(1)
@@ -118,21 +164,41 @@ print("Runtime args:")
 print(params)
 
 file = rw.DataFile(args=params)
+output_writer.configure_compression(
+    backend=params.get("compression_backend") or None,
+    level=params.get("compression_level") or None,
+    threads=params.get("compression_threads") or None,
+)
+engine = arrow_engine if params.get("engine") == "arrow" else transform
 
-file.read_bucket()
-file.load_input_data()
-file.remove_deleted_fields()
+with file.profile.stage("read") as stage:
+    file.read_bucket()
+    file.load_input_data()
+    stage["rows"] += len(file.data)
+with file.profile.stage("drop") as stage:
+    file.remove_deleted_fields()
+    stage["rows"] += len(file.data)
+with file.profile.stage("compact") as stage:
+    file.compact_columns()
+    stage["rows"] += len(file.data)
 
 if file.country_code:
-    file.data = transform.transform_data(
-        data=file.data, pii_fields=file.pii_fields, country_code=file.country_code
-    )
-file.data = transform.hash_data(data=file.data, pii_fields=file.pii_fields)
+    with file.profile.stage("normalize") as stage:
+        file.data = engine.transform_data(
+            data=file.data, pii_fields=file.pii_fields, country_code=file.country_code, profile=file.profile
+        )
+        stage["rows"] += len(file.data)
+with file.profile.stage("hash") as stage:
+    file.data = engine.hash_data(data=file.data, pii_fields=file.pii_fields, profile=file.profile)
+    stage["rows"] += len(file.data)
 
 if file.timestamp_column:
-    file.timestamp_transform()
-    
+    with file.profile.stage("timestamp") as stage:
+        file.timestamp_transform()
+        stage["rows"] += len(file.data)
+
 file.save_output()
+file.log_performance_profile()
 
 if params.get("enable_anonymous_data", "false") == "true":
     file.save_performance_metrics()
@@ -0,0 +1,289 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###########################################################################
+# Arrow-backed engine for the Glue ETL job, selected with --engine arrow.
+#
+# The pandas engine holds every string as a Python object. This engine holds
+# strings in Arrow string arrays (pandas "string[pyarrow]" columns), which
+# use a fraction of the memory, and normalizes and hashes them with
+# pyarrow.compute kernels:
+#
+#   - CSV files are read with pyarrow.csv, using the null, true and false
+#     values and the type inference of pandas.read_csv. Columns that Arrow
+#     would parse as dates or times are kept as strings, as pandas does.
+#     Integers are read as nullable integers, so that large IDs in columns
+#     with missing values are not rounded to floats.
+#   - JSON files are read with the pandas reader, because pyarrow.json infers
+#     types and dates differently from pandas.read_json. Each chunk is
+#     converted to Arrow strings as it is read.
+#   - Names, cities, emails and zip codes are normalized with compute kernels
+#     when every value of the column is ASCII, where the kernels give the
+#     same result as the Python normalizers. Other columns, and addresses,
+#     states and phone numbers, are normalized in Python once per unique
+#     value. Values are hashed once per unique value.
+#   - Output is written by the same pandas writers as the pandas engine,
+#     so output files are identical. pyarrow has no JSON writer, and its CSV
+#     writer quotes and formats values differently from pandas. The one
+#     difference is CSV integer columns with missing values, which this
+#     engine writes as integers (101) and the pandas engine as floats (101.0).
+#
+# The compute kernels need pyarrow 5.0 or later (if_else and
+# utf8_slice_codeunits). The Glue job pins pyarrow 7.0.0, the latest that
+# awswrangler 2.14 supports, in --additional-python-modules.
+#
+##########################################################################
+
+import hashlib
+
+import boto3
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+from pandas.io.common import infer_compression
+from library.profiling import DISABLED_PROFILE
+from library.transform import NormalizationPatterns, skip_column_flag
+from library.zip_normalizer import ZipNormalizer
+
+STRING_DTYPE = "string[pyarrow]"
+# Storage type of STRING_DTYPE arrays. pandas before 2.2, which Glue 3.0
+# runs, only accepts string storage. Later versions convert it to
+# large_string themselves.
+STRING_TYPE = pa.string()
+
+# The null, true and false values of pandas.read_csv
+PANDAS_NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND",
+    "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+PANDAS_TRUE_VALUES = ["True", "TRUE", "true"]
+PANDAS_FALSE_VALUES = ["False", "FALSE", "false"]
+
+# Arrow types that pandas.read_csv also infers. Columns of any other type
+# are read as strings.
+PANDAS_CSV_TYPES = (pa.int64(), pa.float64(), pa.bool_(), pa.string(), pa.null())
+
+# Compression inferred by pandas: Arrow codec. Files with other
+# compressions are read by the pandas reader.
+ARROW_COMPRESSION = {None: None, "gzip": "gzip", "bz2": "bz2", "zstd": "zstd"}
+
+# A sha256 hash, as matched by transform.skip_record_flag
+SHA256_PATTERN = "^[a-f0-9]{64}\n?$"
+
+
+###############################
+# READING
+###############################
+
+
+def open_s3_stream(bucket: str, key: str, compression: str):
+    body = boto3.client("s3").get_object(Bucket=bucket, Key=key)["Body"]
+    stream = pa.PythonFile(body, mode="r")
+    if compression:
+        stream = pa.CompressedInputStream(stream, compression)
+    return stream
+
+
+def reverse_chunks(table: pa.Table, chunksize: int) -> pa.Table:
+    # The pandas engine prepends each chunk it reads, so rows are output in
+    # reverse order of chunks. Use the same order so that output is identical.
+    starts = range(0, table.num_rows, chunksize)
+    if len(starts) < 2:
+        return table
+    return pa.concat_tables([table.slice(start, chunksize) for start in reversed(starts)])
+
+
+def reverse_chunks_index(num_rows: int, chunksize: int) -> pd.Index:
+    # The row numbers of the input in the order of reverse_chunks, which the
+    # pandas engine has as the index.
+    rows = np.arange(num_rows)
+    return pd.Index(rows[np.argsort(-(rows // chunksize), kind="stable")])
+
+
+def read_csv(bucket: str, key: str, pii_fields: list, chunksize: int):
+    # Returns the CSV file as a DataFrame with Arrow string columns, or None if
+    # the file is compressed in a format this engine does not read.
+    inferred_compression = infer_compression(key, "infer")
+    if inferred_compression not in ARROW_COMPRESSION:
+        return None
+    compression = ARROW_COMPRESSION[inferred_compression]
+    parse_options = pa_csv.ParseOptions(newlines_in_values=True)
+    column_types = {field["column_name"]: pa.string() for field in pii_fields}
+
+    def convert_options():
+        return pa_csv.ConvertOptions(
+            column_types=column_types,
+            null_values=PANDAS_NA_VALUES,
+            true_values=PANDAS_TRUE_VALUES,
+            false_values=PANDAS_FALSE_VALUES,
+            strings_can_be_null=True,
+        )
+
+    # Infer types from the first block, then read columns that pandas would
+    # not parse, such as dates, as strings.
+    with open_s3_stream(bucket, key, compression) as stream:
+        schema = pa_csv.open_csv(stream, parse_options=parse_options, convert_options=convert_options()).schema
+    for field in schema:
+        if field.type not in PANDAS_CSV_TYPES:
+            column_types[field.name] = pa.string()
+
+    with open_s3_stream(bucket, key, compression) as stream:
+        table = pa_csv.read_csv(stream, parse_options=parse_options, convert_options=convert_options())
+    # Integers are read as nullable integers, so that columns with missing
+    # values are not converted to floats, which round large IDs.
+    types = {pa.string(): pd.StringDtype("pyarrow"), pa.int64(): pd.Int64Dtype()}
+    df = reverse_chunks(table, chunksize).to_pandas(types_mapper=types.get)
+    df.index = reverse_chunks_index(len(df), chunksize)
+    return df
+
+
+def compact_strings(df: pd.DataFrame) -> pd.DataFrame:
+    # Converts object columns that only hold strings to Arrow strings.
+    for column_name in df.columns[df.dtypes == object]:
+        if pd.api.types.infer_dtype(df[column_name], skipna=True) == "string":
+            df[column_name] = df[column_name].astype(STRING_DTYPE)
+    return df
+
+
+###############################
+# COMPUTE KERNELS
+###############################
+
+
+def default_kernel(country_code):
+    def normalize(values):
+        return pc.replace_substring_regex(pc.utf8_lower(values), "[^a-z0-9]", "")
+
+    return normalize
+
+
+def city_kernel(country_code):
+    def normalize(values):
+        return pc.replace_substring_regex(pc.utf8_lower(values), "[^a-zA-Z0-9]+", "")
+
+    return normalize
+
+
+def email_kernel(country_code):
+    def normalize(values):
+        values = pc.replace_substring_regex(pc.utf8_lower(values), r"[^\w.@-]+", "")
+        valid = pc.match_substring_regex(values, r"^[\w._-]+@[\w._-]+")
+        return pc.if_else(valid, values, "")
+
+    return normalize
+
+
+def zip_kernel(country_code):
+    zip_normalizer = ZipNormalizer(country_code)
+
+    def normalize(values):
+        values = pc.replace_substring_regex(values, zip_normalizer.normalize_regex, "")
+        values = pc.utf8_slice_codeunits(values, 0, zip_normalizer.zip_length)
+        valid = pc.match_substring_regex(values, f"^(?:{zip_normalizer.regex.pattern})")
+        return pc.if_else(valid, values, "")
+
+    return normalize
+
+
+# PII type: kernel factory. The kernels match the Python normalizers for
+# ASCII text only. Types without a kernel are normalized in Python.
+KERNELS = {
+    "CITY": city_kernel,
+    "EMAIL": email_kernel,
+    "ZIP": zip_kernel,
+    "ADDRESS": None,
+    "STATE": None,
+    "PHONE": None,
+}
+
+
+###############################
+# HELPER FUNCTIONS
+###############################
+
+
+def to_arrow(series: pd.Series) -> pa.ChunkedArray:
+    values = pa.array(series, type=STRING_TYPE, from_pandas=True)
+    # Arrow string columns are converted to a ChunkedArray in their own
+    # storage type, which is large_string since pandas 2.2.
+    if not isinstance(values, pa.ChunkedArray):
+        values = pa.chunked_array([values])
+    return values.cast(STRING_TYPE) if values.type != STRING_TYPE else values
+
+
+def to_series(values: pa.ChunkedArray, index: pd.Index) -> pd.Series:
+    return pd.Series(pd.arrays.ArrowStringArray(values.cast(STRING_TYPE)), index=index)
+
+
+def skip_record_mask(values: pa.ChunkedArray) -> pa.ChunkedArray:
+    # Vectorized transform.skip_record_flag
+    return pc.or_kleene(pc.is_null(values), pc.fill_null(pc.match_substring_regex(values, SHA256_PATTERN), False))
+
+
+def map_unique(values: pa.ChunkedArray, skipped: pa.ChunkedArray, function) -> pa.ChunkedArray:
+    # Applies function once to each unique value that is not skipped.
+    # Skipped values are null in the result.
+    unique_values = pc.unique(pc.filter(values, pc.invert(skipped)))
+    mapped = pa.array([function(value) for value in unique_values.to_pylist()], type=STRING_TYPE)
+    return pc.take(mapped, pc.index_in(values, value_set=unique_values))
+
+
+def count_true(mask) -> int:
+    return int(pc.sum(mask).as_py() or 0)
+
+
+###############################
+# DATA NORMALIZATION
+###############################
+
+
+def transform_data(
+    data: pd.DataFrame, pii_fields: dict, country_code: str, profile=DISABLED_PROFILE
+) -> pd.DataFrame:
+    for field in pii_fields:
+        with profile.column("normalize", field, len(data)) as column:
+            if skip_column_flag(data, field):
+                column["skipped"] += len(data)
+                continue
+            column_name = field["column_name"]
+            pii_type = field["pii_type"]
+            values = to_arrow(data[column_name])
+            skipped = skip_record_mask(values)
+            kernel = KERNELS.get(pii_type, default_kernel)
+            if kernel is not None and pc.all(pc.string_is_ascii(values)).as_py() is not False:
+                normalized = kernel(country_code)(values)
+            else:
+                field_normalizer = NormalizationPatterns(field=pii_type, country_code=country_code)
+                normalized = map_unique(
+                    values, skipped, lambda x, field_normalizer=field_normalizer: field_normalizer.text_transformations(text=x)
+                )
+            normalized = pc.if_else(skipped, values, normalized)
+            data[column_name] = to_series(normalized, data.index)
+            if profile.enabled:
+                # Normalizers return an empty string for invalid values.
+                column["skipped"] += count_true(skipped)
+                column["invalidated"] += count_true(pc.and_(pc.equal(normalized, ""), pc.invert(skipped)))
+    return data
+
+
+###############################
+# PII HASHING
+###############################
+
+
+def hash_data(data: pd.DataFrame, pii_fields: dict, profile=DISABLED_PROFILE) -> pd.DataFrame:
+    for field in pii_fields:
+        with profile.column("hash", field, len(data)) as column:
+            if skip_column_flag(data, field):
+                column["skipped"] += len(data)
+                continue
+            column_name = field["column_name"]
+            values = to_arrow(data[column_name])
+            skipped = skip_record_mask(values)
+            hashed = map_unique(values, skipped, lambda x: hashlib.sha256(x.encode()).hexdigest())
+            data[column_name] = to_series(pc.if_else(skipped, values, hashed), data.index)
+            if profile.enabled:
+                column["skipped"] += count_true(skipped)
+    return data
@@ -0,0 +1,57 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###########################################################################
+# Holds the columns that pass through the Glue ETL job unchanged (columns
+# that are not PII or timestamps) in compact types:
+#
+#   - Integers are downcast to the smallest integer type that holds them,
+#     including the nullable integers that the arrow engine reads from
+#     integer text with missing values.
+#   - Strings with few distinct values, such as campaigns, channels and
+#     categories, are held as categoricals: each distinct string is held once
+#     and each row holds a small integer code. The JSON and CSV writers
+#     decode them, so the output text is unchanged.
+#
+# Floats are kept as float64. Whether a float column was integer text can
+# only be decided from the text, which the pandas readers do not keep:
+# "10,,12" and "10.0,,12.0" are both read as 10.0, NaN, 12.0. float32 would
+# also change the text that the writers output.
+#
+# Usage:
+#
+#   df = compact_columns(df, skip_columns=["email", "timestamp"])
+#
+##########################################################################
+
+import pandas as pd
+
+# Strings are held as categoricals when at most this share of rows have
+# distinct values.
+CATEGORY_MAX_UNIQUE_RATIO = 0.5
+
+
+def is_low_cardinality_string(values: pd.Series) -> bool:
+    if not (pd.api.types.is_object_dtype(values) or isinstance(values.dtype, pd.StringDtype)):
+        return False
+    if values.nunique(dropna=True) > CATEGORY_MAX_UNIQUE_RATIO * len(values):
+        return False
+    return pd.api.types.infer_dtype(values, skipna=True) == "string"
+
+
+def compact_column(values: pd.Series) -> pd.Series:
+    if pd.api.types.is_integer_dtype(values):
+        return pd.to_numeric(values, downcast="integer")
+    if is_low_cardinality_string(values):
+        return values.astype("category")
+    return values
+
+
+def compact_columns(df: pd.DataFrame, skip_columns=()) -> pd.DataFrame:
+    # Compacts each column that is not in skip_columns. PII columns are
+    # skipped because they are replaced by distinct hashes, and the timestamp
+    # column because it is parsed.
+    for column_name in df.columns:
+        if column_name not in skip_columns:
+            df[column_name] = compact_column(df[column_name])
+    return df
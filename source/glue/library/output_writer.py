@@ -0,0 +1,297 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###########################################################################
+# Streams output files of the Glue ETL job to S3.
+#
+# Output is encoded in batches of rows with the same encoders as
+# DataFrame.to_json and DataFrame.to_csv, so the text is identical to the
+# output of wr.s3.to_json and wr.s3.to_csv: NaN and None are null, strings
+# (hashed PII and timestamps formatted by convert_timestamp_format) are
+# escaped the same way, and numbers have the same precision. Each batch is
+# compressed and uploaded as soon as it is encoded, so only one batch of text
+# and one part of compressed bytes are held in memory, instead of the whole
+# partition.
+#
+# Output is gzip, as AMC requires. Compression uses the fastest available
+# backend: isa-l (python-isal), then zlib-ng (zlib-ng), then zlib. Set the
+# backend, level and number of threads with configure_compression. With
+# more than one thread, blocks are compressed in parallel: by the threaded
+# writers of python-isal and zlib-ng, which write one gzip member, or else by
+# ParallelGzipWriter, which writes one gzip member per block. gzip readers,
+# including AMC, decompress consecutive members as one file.
+#
+# Usage:
+#
+#   configure_compression(backend="auto", level=6, threads=4)
+#   write_json_lines(df, "s3://bucket/key.gz")
+#
+##########################################################################
+
+import gzip
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+import pandas as pd
+
+try:
+    from isal import igzip
+except ImportError:
+    igzip = None
+try:
+    from isal import igzip_threaded
+except ImportError:
+    igzip_threaded = None
+try:
+    from zlib_ng import gzip_ng
+except ImportError:
+    gzip_ng = None
+try:
+    from zlib_ng import gzip_ng_threaded
+except ImportError:
+    gzip_ng_threaded = None
+
+JSON_LINES_BATCH_ROWS = 20000
+CSV_BATCH_ROWS = 20000
+# S3 multipart uploads need parts of at least 5 MiB, except the last part.
+MULTIPART_PART_SIZE = 8 * 1024 * 1024
+
+COMPRESSION_BACKENDS = ["isal", "zlib-ng", "zlib"]
+# pandas compresses gzip output at level 9.
+DEFAULT_COMPRESSION_LEVEL = 9
+COMPRESSION_BLOCK_SIZE = 1024 * 1024
+
+compression = {"backend": "auto", "level": DEFAULT_COMPRESSION_LEVEL, "threads": 1}
+
+# Files are written from several threads. Clients are thread safe, but
+# creating them from the default boto3 session is not.
+s3_client_lock = threading.Lock()
+
+
+def s3_client():
+    with s3_client_lock:
+        return boto3.client("s3")
+
+
+def split_s3_path(path: str):
+    bucket, _, key = path.replace("s3://", "", 1).partition("/")
+    return bucket, key
+
+
+class S3Writer:
+    # Binary file-like object that uploads what is written to it to S3.
+    # Files smaller than one part are uploaded with put_object, larger files
+    # with a multipart upload. The upload is aborted if writing fails.
+    def __init__(self, path: str, part_size: int = None):
+        self.bucket, self.key = split_s3_path(path)
+        self.part_size = part_size or MULTIPART_PART_SIZE
+        self.s3 = s3_client()
+        self.buffer = bytearray()
+        self.upload_id = None
+        self.parts = []
+        self.closed = False
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self.buffer += data
+        if len(self.buffer) >= self.part_size:
+            self.upload_part()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def upload_part(self):
+        if self.upload_id is None:
+            self.upload_id = self.s3.create_multipart_upload(Bucket=self.bucket, Key=self.key)["UploadId"]
+        part_number = len(self.parts) + 1
+        response = self.s3.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            PartNumber=part_number,
+            Body=bytes(self.buffer),
+        )
+        self.parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self.buffer = bytearray()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        if self.upload_id is None:
+            self.s3.put_object(Bucket=self.bucket, Key=self.key, Body=bytes(self.buffer))
+            return
+        if self.buffer:
+            self.upload_part()
+        self.s3.complete_multipart_upload(
+            Bucket=self.bucket,
+            Key=self.key,
+            UploadId=self.upload_id,
+            MultipartUpload={"Parts": self.parts},
+        )
+
+    def abort(self):
+        self.closed = True
+        if self.upload_id is not None:
+            self.s3.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+###############################
+# COMPRESSION
+###############################
+
+
+def available_compression_backends() -> list:
+    available = {"isal": igzip is not None, "zlib-ng": gzip_ng is not None, "zlib": True}
+    return [backend for backend in COMPRESSION_BACKENDS if available[backend]]
+
+
+def configure_compression(backend: str = None, level: int = None, threads: int = None) -> None:
+    # Sets the compression of output files. Arguments that are None keep
+    # their current value.
+    if backend is not None:
+        if backend != "auto" and backend not in available_compression_backends():
+            raise ValueError(f"Compression backend {backend} is not available")
+        compression["backend"] = backend
+    if level is not None:
+        if not 1 <= int(level) <= 9:
+            raise ValueError("Compression level must be between 1 and 9")
+        compression["level"] = int(level)
+    if threads is not None:
+        if int(threads) < 1:
+            raise ValueError("Compression threads must be at least 1")
+        compression["threads"] = int(threads)
+
+
+def isal_level(level: int) -> int:
+    # isa-l has levels 0 to 3. Map zlib levels 1-2, 3-4, 5-6 and 7-9 to them.
+    return min(3, (level - 1) // 2)
+
+
+class ParallelGzipWriter:
+    # Compresses blocks of COMPRESSION_BLOCK_SIZE bytes as separate gzip
+    # members in a thread pool, and writes them to fileobj in order. zlib,
+    # isa-l and zlib-ng release the GIL while they compress, so blocks
+    # compress in parallel.
+    def __init__(self, fileobj, compress, level: int, threads: int):
+        self.fileobj = fileobj
+        self.compress = compress
+        self.level = level
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        self.max_pending = 2 * threads
+        self.pending = deque()
+        self.buffer = bytearray()
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= COMPRESSION_BLOCK_SIZE:
+            self.submit(bytes(self.buffer[:COMPRESSION_BLOCK_SIZE]))
+            del self.buffer[:COMPRESSION_BLOCK_SIZE]
+        return len(data)
+
+    def submit(self, block: bytes):
+        self.pending.append(self.executor.submit(self.compress, block, self.level))
+        while len(self.pending) > self.max_pending:
+            self.fileobj.write(self.pending.popleft().result())
+
+    def close(self):
+        if self.buffer or not self.pending:
+            # An empty file is still one gzip member.
+            self.submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        try:
+            while self.pending:
+                self.fileobj.write(self.pending.popleft().result())
+        finally:
+            self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            for future in self.pending:
+                future.cancel()
+            self.executor.shutdown(wait=False)
+        return False
+
+
+def open_gzip(fileobj, backend: str = None, level: int = None, threads: int = None):
+    # Returns a writable binary file that writes gzip to fileobj.
+    backend = backend or compression["backend"]
+    level = level or compression["level"]
+    threads = threads or compression["threads"]
+    if backend == "auto":
+        backend = available_compression_backends()[0]
+    # backend: (gzip module, threaded gzip module, compression level)
+    gzip_module, threaded_module, level = {
+        "isal": (igzip, igzip_threaded, isal_level(level)),
+        "zlib-ng": (gzip_ng, gzip_ng_threaded, level),
+        "zlib": (gzip, None, level),
+    }[backend]
+    if threads > 1 and threaded_module is not None:
+        return threaded_module.open(
+            fileobj, "wb", compresslevel=level, threads=threads, block_size=COMPRESSION_BLOCK_SIZE
+        )
+    if threads > 1:
+        return ParallelGzipWriter(fileobj, gzip_module.compress, level, threads)
+    return gzip_module.GzipFile(fileobj=fileobj, mode="wb", compresslevel=level)
+
+
+###############################
+# WRITERS
+###############################
+
+
+def json_lines_batches(df: pd.DataFrame, batch_rows: int = JSON_LINES_BATCH_ROWS):
+    # Yields the JSON Lines text of df in batches of rows, each ending with a
+    # newline so that batches can be concatenated. DataFrame.to_json only
+    # ends lines=True output with a newline since pandas 1.5.
+    for start in range(0, len(df), batch_rows):
+        batch = df.iloc[start:start + batch_rows].to_json(orient="records", lines=True)
+        yield batch if batch.endswith("\n") else batch + "\n"
+
+
+def csv_batches(df: pd.DataFrame, batch_rows: int = CSV_BATCH_ROWS):
+    # Yields the CSV text of df in batches of rows. Only the first batch has
+    # the header, which is written even if df has no rows.
+    yield df.iloc[:batch_rows].to_csv(index=False, header=True)
+    for start in range(batch_rows, len(df), batch_rows):
+        yield df.iloc[start:start + batch_rows].to_csv(index=False, header=False)
+
+
+def write_gzip(batches, fileobj) -> None:
+    # Compresses batches of text into fileobj with the configured compression.
+    with open_gzip(fileobj) as compressed:
+        for batch in batches:
+            compressed.write(batch.encode("utf-8"))
+
+
+def write_batches(batches, path: str) -> None:
+    with S3Writer(path) as output:
+        write_gzip(batches, output)
+
+
+def write_json_lines(df: pd.DataFrame, path: str, batch_rows: int = JSON_LINES_BATCH_ROWS) -> None:
+    write_batches(json_lines_batches(df, batch_rows), path)
+
+
+def write_csv(df: pd.DataFrame, path: str, batch_rows: int = CSV_BATCH_ROWS) -> None:
+    write_batches(csv_batches(df, batch_rows), path)
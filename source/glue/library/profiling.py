@@ -0,0 +1,134 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###########################################################################
+# Records the performance of each stage of the Glue ETL job (read, drop,
+# compact, normalize, hash, timestamp, partition, write, manifest), of each PII
+# column in the normalize and hash stages, and of the timestamp column.
+#
+# For each stage and column the profile holds the wall time, CPU time,
+# number of rows and the process peak RSS at the end of the stage. Columns
+# also count skipped records (null or already hashed) and records that
+# normalization invalidated (a value that normalized to an empty string) or
+# whose timestamp could not be parsed.
+#
+# Stages named in cprofile_stages are also run under cProfile.
+#
+# Usage:
+#
+#   profile = JobProfile(cprofile_stages=["normalize"])
+#   with profile.stage("read") as stage:
+#       ...
+#       stage["rows"] += len(data)
+#   with profile.column("hash", field, len(data)) as column:
+#       column["skipped"] += skipped
+#   report = profile.report()
+#
+##########################################################################
+
+import cProfile
+import contextlib
+import resource
+import sys
+import time
+
+STAGES = ["read", "drop", "compact", "normalize", "hash", "timestamp", "partition", "write", "manifest"]
+
+
+def peak_memory_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def new_stats() -> dict:
+    return {"calls": 0, "rows": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0, "peak_memory_mb": 0.0}
+
+
+def with_throughput(stats: dict) -> dict:
+    rows_per_second = stats["rows"] / stats["wall_seconds"] if stats["wall_seconds"] else None
+    return {**stats, "rows_per_second": rows_per_second}
+
+
+class JobProfile:
+    enabled = True
+
+    def __init__(self, cprofile_stages=None):
+        self.started = time.perf_counter()
+        self.started_cpu = time.process_time()
+        self.stages = {}
+        self.columns = {}
+        self.cprofile_stages = set(cprofile_stages or [])
+        # stage name -> cProfile.Profile
+        self.profilers = {}
+
+    @contextlib.contextmanager
+    def measure(self, stats, profiler=None):
+        # Adds the wall and CPU time of the block to stats.
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        if profiler:
+            profiler.enable()
+        try:
+            yield stats
+        finally:
+            if profiler:
+                profiler.disable()
+            stats["calls"] += 1
+            stats["wall_seconds"] += time.perf_counter() - wall
+            stats["cpu_seconds"] += time.process_time() - cpu
+            stats["peak_memory_mb"] = peak_memory_mb()
+
+    def stage(self, name):
+        # Stages may be entered more than once, e.g. once per partition, and
+        # their statistics add up.
+        stats = self.stages.setdefault(name, new_stats())
+        profiler = None
+        if name in self.cprofile_stages:
+            profiler = self.profilers.setdefault(name, cProfile.Profile())
+        return self.measure(stats, profiler)
+
+    def column(self, stage, field, rows):
+        key = (stage, field["column_name"])
+        if key not in self.columns:
+            self.columns[key] = {
+                "stage": stage,
+                "column_name": field["column_name"],
+                "pii_type": field.get("pii_type"),
+                **new_stats(),
+                "skipped": 0,
+                "invalidated": 0,
+            }
+        stats = self.columns[key]
+        stats["rows"] += rows
+        return self.measure(stats)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def report(self) -> dict:
+        stages = sorted(
+            self.stages.items(),
+            key=lambda item: STAGES.index(item[0]) if item[0] in STAGES else len(STAGES),
+        )
+        return {
+            "wall_seconds": self.elapsed(),
+            "cpu_seconds": time.process_time() - self.started_cpu,
+            "peak_memory_mb": peak_memory_mb(),
+            "stages": [{"stage": name, **with_throughput(stats)} for name, stats in stages],
+            "columns": [with_throughput(stats) for stats in self.columns.values()],
+        }
+
+
+class DisabledProfile:
+    # No-op stand-in for JobProfile used when the caller does not profile.
+    enabled = False
+
+    def stage(self, name):
+        return contextlib.nullcontext(new_stats())
+
+    def column(self, stage, field, rows):
+        return contextlib.nullcontext({**new_stats(), "skipped": 0, "invalidated": 0})
+
+
+DISABLED_PROFILE = DisabledProfile()
@@ -1,16 +1,20 @@
 # Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
 # SPDX-License-Identifier: Apache-2.0
 import json
+import marshal
+import pstats
 import re
 import sys
-from datetime import datetime
 import math
 import awswrangler as wr
 import boto3
 import pandas as pd
 import numpy as np
 import os
+import threading
 import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from library import arrow_engine, compaction, output_writer, profiling, timestamps
 
 ###############################
 # CONSTANTS
@@ -37,6 +41,24 @@ pandas_options_to_write_csv = {
 
 GZIPPED_OUTPUT_FILE_SIZE_IN_BYTES = 500.0 * 1000000
 
+# Rows per chunk when reading input files
+INPUT_CHUNK_SIZE = 2000
+
+# Rows with invalid timestamps listed in the job log
+INVALID_ROWS_TO_PRINT = 20
+
+# --timeseries_partition_size (an ISO 8601 duration): numpy datetime unit of
+# the time buckets
+TIMESERIES_PARTITION_UNITS = {"P1D": "D", "PT1H": "h"}
+# Output partitions that are written at the same time
+PARALLEL_WRITES = 4
+
+# Custom metrics of the job are put in this CloudWatch namespace.
+METRICS_NAMESPACE = "amcufa"
+PUT_METRIC_DATA_MAX_ITEMS = 1000
+# cProfile output is saved under this prefix of the output bucket.
+PROFILES_PREFIX = "profiles"
+
 
 ###############################
 # HELPER FUNCTIONS
@@ -44,18 +66,12 @@ GZIPPED_OUTPUT_FILE_SIZE_IN_BYTES = 500.0 * 1000000
 
 
 def write_to_s3(df: pd.DataFrame, filepath: str, file_format: str) -> None:
+    # Stream rows into gzip and the upload in batches, instead of building the
+    # whole file as one string.
     if file_format == "JSON":
-        wr.s3.to_json(
-            df=df,
-            path=filepath,
-            **pandas_options_to_write_json
-        )
+        output_writer.write_json_lines(df=df, path=filepath)
     elif file_format == "CSV":
-        wr.s3.to_csv(
-            df=df,
-            path=filepath,
-            **pandas_options_to_write_csv
-        )
+        output_writer.write_csv(df=df, path=filepath)
 
 
 ###############################
@@ -90,12 +106,17 @@ class DataFile:
         self.filename = self.key.split("/")[-1]
         self.num_rows = 0
         self.num_bytes = 0
-        self.partition_identifier = ""
+        # Guards num_rows while partitions are written in parallel
+        self.lock = threading.Lock()
 
         # optional params
         resolve_optional_params = [
             "timestamp_column",
-            "country_code"
+            "country_code",
+            "enable_job_metrics",
+            "profile_normalize",
+            "engine",
+            "timeseries_partition_size",
         ]
 
         for optional_param in resolve_optional_params:
@@ -103,6 +124,10 @@ class DataFile:
             if optional_param in args.keys():
                 setattr(self, optional_param, args[optional_param])
 
+        self.profile = profiling.JobProfile(
+            cprofile_stages=["normalize"] if self.profile_normalize == "true" else []
+        )
+
     def read_bucket(self) -> None:
         s3 = boto3.client("s3")
         response = s3.head_object(Bucket=self.source_bucket, Key=self.key)
@@ -112,7 +137,7 @@ class DataFile:
 
     def load_input_data(self) -> None:
         df = self.data
-        chunksize = 2000
+        chunksize = INPUT_CHUNK_SIZE
 
         # Configure all PII-designated fields to be read as strings
         # This avoids reading phone or zip values as floats and dropping data or requiring additional transformation before normalization
@@ -120,6 +145,13 @@ class DataFile:
         for field in self.pii_fields:
             pii_column_names[field["column_name"]] = str
 
+        if self.engine == "arrow" and self.file_format == "CSV":
+            arrow_df = arrow_engine.read_csv(self.source_bucket, self.key, self.pii_fields, chunksize)
+            if arrow_df is not None:
+                print(f"DATAFRAME ROWS: {len(arrow_df)}")
+                self.data = arrow_df
+                return
+
         if self.file_format == "JSON":
             df_chunks = wr.s3.read_json(
                 path=[S3_PREFIX + self.source_bucket + "/" + self.key],
@@ -138,27 +170,32 @@ class DataFile:
             sys.exit(1)
 
         for chunk in df_chunks:
+            if self.engine == "arrow":
+                chunk = arrow_engine.compact_strings(chunk)
             # Save each chunk
             df = pd.concat([chunk, df])
+        if self.engine == "arrow":
+            # Columns that are empty in some chunks are objects after concat.
+            df = arrow_engine.compact_strings(df)
 
         print(f"DATAFRAME ROWS: {len(df)}")
         self.data = df
 
+    def compact_columns(self) -> None:
+        # Hold the columns that are not PII or timestamps in compact types.
+        # Run after remove_deleted_fields, so deleted columns are not compacted.
+        skip_columns = [field["column_name"] for field in self.pii_fields]
+        if self.timestamp_column:
+            skip_columns.append(self.timestamp_column)
+        self.data = compaction.compact_columns(self.data, skip_columns=skip_columns)
+
     def remove_deleted_fields(self) -> None:
         # Delete the columns that were indicated by the user to be deleted.
         for column_name in self.deleted_fields:
             self.data.drop(column_name, axis=1, inplace=True)
 
     def save_performance_metrics(self) -> None:
-        glue_client = boto3.client("glue")
         lambda_client = boto3.client("lambda")
-        response = glue_client.get_job_run(
-            JobName=self.job_name,
-            RunId=self.job_run_id,
-            PredecessorsIncluded=True | False,
-        )
-        started_on = response["JobRun"]["StartedOn"].replace(tzinfo=None)
-        glue_job_duration = (datetime.now() - started_on).total_seconds()
         metrics = {
             "RequestType": "Workload",
             "Metrics": {
@@ -166,7 +203,7 @@ class DataFile:
                 "UUID": self.uuid,
                 "numBytes": self.num_bytes,
                 "numRows": self.num_rows,
-                "glueJobDuration": glue_job_duration,
+                "glueJobDuration": self.profile.elapsed(),
             },
         }
         lambda_client.invoke(
@@ -176,8 +213,65 @@ class DataFile:
         )
         print("Performance metrics:")
         print(metrics)
-    
-    def _format_output(self, amc_instance_id_user_id):
+
+    def log_performance_profile(self) -> None:
+        # Print the stage and column profile as one JSON line, so that it can
+        # be queried with CloudWatch Logs Insights, and optionally put it in
+        # CloudWatch metrics and save the cProfile output.
+        report = self.profile.report()
+        print(json.dumps({"performance_profile": {"job_run_id": self.job_run_id, **report}}))
+        if self.enable_job_metrics == "true":
+            self.put_job_metrics(report)
+        self.save_profiles()
+
+    def put_job_metrics(self, report: dict) -> None:
+        metric_data = []
+        for stage in report["stages"]:
+            dimensions = [{"Name": "Stage", "Value": stage["stage"]}]
+            metric_data.extend([
+                {"MetricName": "StageDuration", "Dimensions": dimensions, "Value": stage["wall_seconds"], "Unit": "Seconds"},
+                {"MetricName": "StageCpuTime", "Dimensions": dimensions, "Value": stage["cpu_seconds"], "Unit": "Seconds"},
+                {"MetricName": "StagePeakMemory", "Dimensions": dimensions, "Value": stage["peak_memory_mb"], "Unit": "Megabytes"},
+                {"MetricName": "StageRows", "Dimensions": dimensions, "Value": stage["rows"], "Unit": "Count"},
+            ])
+        # Column names are chosen by users, so column metrics are reported per
+        # PII type to bound the number of metrics.
+        for column in report["columns"]:
+            dimensions = [
+                {"Name": "Stage", "Value": column["stage"]},
+                {"Name": "PiiType", "Value": str(column["pii_type"])},
+            ]
+            metric_data.extend([
+                {"MetricName": "ColumnDuration", "Dimensions": dimensions, "Value": column["wall_seconds"], "Unit": "Seconds"},
+                {"MetricName": "SkippedRecords", "Dimensions": dimensions, "Value": column["skipped"], "Unit": "Count"},
+                {"MetricName": "InvalidatedRecords", "Dimensions": dimensions, "Value": column["invalidated"], "Unit": "Count"},
+            ])
+        try:
+            cloudwatch = boto3.client("cloudwatch")
+            for i in range(0, len(metric_data), PUT_METRIC_DATA_MAX_ITEMS):
+                cloudwatch.put_metric_data(
+                    Namespace=METRICS_NAMESPACE,
+                    MetricData=metric_data[i:i + PUT_METRIC_DATA_MAX_ITEMS],
+                )
+        except Exception as e:
+            # Metrics are diagnostic, so failing to put them does not fail the job.
+            print(f"Failed to put job metrics: {e}")
+
+    def save_profiles(self) -> None:
+        # Save the cProfile output of each profiled stage in the format of
+        # pstats.Stats.dump_stats, so it can be loaded with pstats or snakeviz.
+        s3 = boto3.client("s3")
+        for stage, profiler in self.profile.profilers.items():
+            stats = pstats.Stats(profiler, stream=sys.stdout)
+            key = f"{PROFILES_PREFIX}/{self.dataset_id}/{self.job_run_id}/{stage}.prof"
+            try:
+                s3.put_object(Bucket=self.output_bucket, Key=key, Body=marshal.dumps(stats.stats))
+                print(f"Saved {stage} profile: s3://{self.output_bucket}/{key}")
+            except Exception as e:
+                print(f"Failed to save {stage} profile: {e}")
+            stats.sort_stats("cumulative").print_stats(25)
+
+    def _format_output(self, amc_instance_id_user_id, partition_identifier):
         country_code = self.country_code
         if not country_code:
             country_code = json.dumps(country_code)
@@ -189,48 +283,63 @@ class DataFile:
             self.file_format,
             country_code,
             amc_instance_id_user_id,
-            f"{re.split('.gz', self.filename, 0)[0]}-{self.partition_identifier}.gz",
+            f"{re.split('.gz', self.filename, 0)[0]}-{partition_identifier}.gz",
         ]
         return "/".join(output)
     
     def timestamp_transform(self) -> None:
         df = self.data
 
-        try:
-            df[self.timestamp_column] = pd.to_datetime(
-                df[self.timestamp_column], utc=True
-            )
-        except ValueError as e:
-            print(e)
-            print(
-                "Failed to parse timeseries in column " + self.timestamp_column
-            )
-            print("Verify that timeseries is formatted according to ISO 8601.")
-            raise e
-        except Exception as e:
-            print(e)
+        with self.profile.column("timestamp", {"column_name": self.timestamp_column, "pii_type": "TIMESTAMP"}, len(df)) as column:
+            try:
+                non_null_rows = df[self.timestamp_column].notna().sum()
+                df[self.timestamp_column], invalid_positions = timestamps.parse_timestamps(df[self.timestamp_column])
+                # A column without any valid timestamp is not a timestamp column.
+                if non_null_rows and len(invalid_positions) == non_null_rows:
+                    raise ValueError(f"No timestamps in column {self.timestamp_column} could be parsed")
+            except ValueError as e:
+                print(e)
+                print(
+                    "Failed to parse timeseries in column " + self.timestamp_column
+                )
+                print("Verify that timeseries is formatted according to ISO 8601.")
+                raise e
+            except Exception as e:
+                print(e)
+                print(
+                    "Failed to parse timeseries in column " + self.timestamp_column
+                )
+                raise e
+            column["invalidated"] += len(invalid_positions)
+
+        if len(invalid_positions):
+            # Drop rows whose timestamp could not be parsed, instead of failing
+            # the job. The index of each row is its position in the input file.
+            invalid_rows = df.index[invalid_positions]
             print(
-                "Failed to parse timeseries in column " + self.timestamp_column
+                f"WARNING: Dropped {len(invalid_rows)} rows with timestamps that are not formatted according to ISO 8601 "
+                f"in column {self.timestamp_column}. Rows: {sorted(invalid_rows.tolist())[:INVALID_ROWS_TO_PRINT]}"
             )
-            raise e
+            df = df.drop(index=invalid_rows)
 
         self.data = df
 
-    def upload_dataset(self, df: pd.DataFrame) -> list:
+    def upload_dataset(self, df: pd.DataFrame, partition_identifier: str) -> list:
         uploads = []
         for amc_instance in self.amc_instances:
             # We're going to pass these amc_instance to the amc_uploader.py Lambda function
             # amc_instance is concatenated with user_id for Aws secret.
             amc_instance_id_user_id = f"{amc_instance}|{self.user_id}"
             # write the old df_partition to s3
-            output_file = self._format_output(amc_instance_id_user_id)
+            output_file = self._format_output(amc_instance_id_user_id, partition_identifier)
             print(WRITING + str(len(df)) + ROWS_TO + output_file)
-            self.num_rows += len(df)
+            with self.lock:
+                self.num_rows += len(df)
             write_to_s3(
                 df=df, filepath=output_file, file_format=self.file_format
             )
             s3key = output_file[output_file.find(self.output_bucket) + (len(self.output_bucket) + 1):]
-            s3 = boto3.client("s3")
+            s3 = output_writer.s3_client()
             s3.put_object_tagging(
                 Bucket=self.output_bucket,
                 Key=s3key,
@@ -256,17 +365,15 @@ class DataFile:
         # Get memory usage of sample data in bytes
         df_size = df_sample.memory_usage(index=True, deep=True).sum()
         tmp_compressed_filename = 'tmp_sample_data.gz'
-        # Generate a temporary gzipped file to get the compressed file size
+        # Generate a temporary gzipped file to get the compressed file size.
+        # Compress it like the output files, since the compression backend
+        # and level change the ratio.
         if self.file_format == "JSON":
-            df_sample.to_json(
-                tmp_compressed_filename,
-                **pandas_options_to_write_json
-            )
+            batches = output_writer.json_lines_batches(df_sample)
         elif self.file_format == "CSV":
-            df_sample.to_csv(
-                tmp_compressed_filename,
-                **pandas_options_to_write_csv
-            )
+            batches = output_writer.csv_batches(df_sample)
+        with open(tmp_compressed_filename, "wb") as tmp_compressed_file:
+            output_writer.write_gzip(batches, tmp_compressed_file)
         compressed_size = os.path.getsize(tmp_compressed_filename)
         # Delete the temporary gzipped file
         os.remove(tmp_compressed_filename)
@@ -296,7 +403,7 @@ class DataFile:
     def convert_timestamp_format(self, df: pd.DataFrame) -> None:
         try:
             # Convert TIMESTAMP and DATE columns to the accepted format.
-            df[self.timestamp_column] = df[self.timestamp_column].dt.strftime(DATETIME_FORMAT)
+            df[self.timestamp_column] = timestamps.format_timestamps(df[self.timestamp_column])
         except Exception as e:
             print(e)
             print(
@@ -304,59 +411,97 @@ class DataFile:
             )
             raise e
 
-    def save_output(self) -> None:
-        df = self.data
-        # Partition the dataset into separate files for file size, so that AMC is uploading files < 500MB (compressed)
-        output_files = []
+    def partition_dataset(self, df: pd.DataFrame) -> list:
+        # Returns the (partition identifier, DataFrame) of each output file.
         number_of_partitions = self.estimate_number_of_partitions()
-        dfs_partition = np.array_split(df, number_of_partitions)
+        if not (self.timestamp_column and self.timeseries_partition_size) or df.empty:
+            return [(str(i), df_partition) for i, df_partition in enumerate(np.array_split(df, number_of_partitions))]
+
+        # Partition time series by the day or hour of their timestamp, and
+        # split each day or hour into files of at most the size of the
+        # partitions above. Partitions are in time order and sorted by
+        # timestamp. Output files are named after their day or hour, so a
+        # re-upload of the same file that covers a few days only replaces the
+        # files of those days.
+        df = df.sort_values(by=self.timestamp_column, kind="stable", na_position="last")
+        labels = timestamps.time_buckets(df[self.timestamp_column], TIMESERIES_PARTITION_UNITS[self.timeseries_partition_size])
+        rows_per_partition = math.ceil(len(df) / number_of_partitions)
+        starts = np.flatnonzero(np.concatenate([[True], labels[1:] != labels[:-1]]))
+        ends = np.append(starts[1:], len(df))
+        partitions = []
+        for start, end in zip(starts, ends):
+            dfs_partition = np.array_split(df.iloc[start:end], math.ceil((end - start) / rows_per_partition))
+            partitions.extend((f"{labels[start]}_{i}", df_partition) for i, df_partition in enumerate(dfs_partition))
+        return partitions
+
+    def write_partitions(self, partitions: list) -> list:
+        # Writes PARALLEL_WRITES partitions at a time, and returns the output
+        # files in the order of partitions.
+        def write_partition(partition):
+            partition_identifier, df_partition = partition
+            print(f"PARTITION FILE {partition_identifier}, ROWS: {len(df_partition)}")
+            return self.upload_dataset(df=df_partition, partition_identifier=partition_identifier)
+
+        with ThreadPoolExecutor(max_workers=PARALLEL_WRITES) as executor:
+            uploads = list(executor.map(write_partition, partitions))
+        return [output_file for partition_uploads in uploads for output_file in partition_uploads]
 
-        for i, df_partition in enumerate(dfs_partition):
-            self.partition_identifier = str(i)
-            print(f"PARTITION FILE {self.partition_identifier}, ROWS: {len(dfs_partition)}")
-            if self.timestamp_column:
-                self.convert_timestamp_format(df=df_partition)
-            uploads = self.upload_dataset(df=df_partition)
-            output_files.extend(uploads)
+    def save_output(self) -> None:
+        df = self.data
+        # Partition the dataset into separate files for file size, so that AMC is uploading files < 500MB (compressed),
+        # and optionally by the day or hour of time series.
+        with self.profile.stage("partition") as stage:
+            partitions = self.partition_dataset(df)
+            stage["rows"] += len(df)
+
+        if self.timestamp_column:
+            with self.profile.stage("timestamp"):
+                for _, df_partition in partitions:
+                    self.convert_timestamp_format(df=df_partition)
+        with self.profile.stage("write") as stage:
+            output_files = self.write_partitions(partitions)
+            stage["rows"] += len(df)
 
         if not output_files:
             print("No output files to put in manifest")
         else:
-            s3 = boto3.client("s3")
-            # Each output_file is an s3Key in the following format:
-            #   amc/[dataset_id]/[update_strategy]/[country_code]/[instance_id|user_id]/[data_file]-[partition_number].gz
-            # The manifest file will have the same S3 key prefix as each output_file
-            # except it will not contain the partition number, and it will have suffix .txt instead of .gz.
-            # Parse the S3 key prefix for each output_file, so we can construct the S3 key for the manifest file.
-            _, dataset_id, update_strategy, file_format, country_code, instance_id_user_id, filename_quoted = output_files[0].replace(f's3://{self.output_bucket}/', '').split('/')
-            instance_id, user_id = instance_id_user_id.split("|")
-            filename = urllib.parse.unquote_plus(filename_quoted)
-            filename_base = filename.rsplit('-', 1)[0].rsplit('.', 1)[0]
-
-            for amc_instance in self.amc_instances:
-                # Generate separate manifest files for each user-specified AMC instance
-                manifest_file = f"amc/{dataset_id}/{update_strategy}/{file_format}/{country_code}/{amc_instance}|{user_id}/{filename_base}.txt"
-                data = "\n".join([line for line in output_files if amc_instance in line])
-                # Save the manifest file to the S3 key derived above.
-                response = s3.put_object(Bucket=self.output_bucket, Key=manifest_file, Body=data)
-                # Check if that operation was successful.
-                if response['ResponseMetadata']['HTTPStatusCode'] == 200:
-                    print(f"Created manifest file: s3://{self.output_bucket}{manifest_file}\n")
-                    # Tag the manifest file to the target AMC instance, as required by AMC.
-                    s3.put_object_tagging(
-                        Bucket=self.output_bucket,
-                        Key=manifest_file,
-                        Tagging={
-                            'TagSet': [
-                                {
-                                    'Key': 'instanceId',
-                                    'Value': amc_instance
-                                },
-                            ]
-                        },
-                    )
-                else:
-                    print(f"Error creating manifest file: {response}")
+            with self.profile.stage("manifest") as stage:
+                s3 = boto3.client("s3")
+                # Each output_file is an s3Key in the following format:
+                #   amc/[dataset_id]/[update_strategy]/[country_code]/[instance_id|user_id]/[data_file]-[partition_number].gz
+                # The manifest file will have the same S3 key prefix as each output_file
+                # except it will not contain the partition number, and it will have suffix .txt instead of .gz.
+                # Parse the S3 key prefix for each output_file, so we can construct the S3 key for the manifest file.
+                _, dataset_id, update_strategy, file_format, country_code, instance_id_user_id, filename_quoted = output_files[0].replace(f's3://{self.output_bucket}/', '').split('/')
+                instance_id, user_id = instance_id_user_id.split("|")
+                filename = urllib.parse.unquote_plus(filename_quoted)
+                filename_base = filename.rsplit('-', 1)[0].rsplit('.', 1)[0]
+
+                for amc_instance in self.amc_instances:
+                    # Generate separate manifest files for each user-specified AMC instance
+                    manifest_file = f"amc/{dataset_id}/{update_strategy}/{file_format}/{country_code}/{amc_instance}|{user_id}/{filename_base}.txt"
+                    data = "\n".join([line for line in output_files if amc_instance in line])
+                    # Save the manifest file to the S3 key derived above.
+                    response = s3.put_object(Bucket=self.output_bucket, Key=manifest_file, Body=data)
+                    # Check if that operation was successful.
+                    if response['ResponseMetadata']['HTTPStatusCode'] == 200:
+                        print(f"Created manifest file: s3://{self.output_bucket}{manifest_file}\n")
+                        # Tag the manifest file to the target AMC instance, as required by AMC.
+                        s3.put_object_tagging(
+                            Bucket=self.output_bucket,
+                            Key=manifest_file,
+                            Tagging={
+                                'TagSet': [
+                                    {
+                                        'Key': 'instanceId',
+                                        'Value': amc_instance
+                                    },
+                                ]
+                            },
+                        )
+                    else:
+                        print(f"Error creating manifest file: {response}")
+                stage["rows"] += len(output_files)
 
         output = {
             "output files": output_files,
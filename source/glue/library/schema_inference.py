@@ -0,0 +1,197 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+import re
+from datetime import datetime
+
+import phonenumbers
+from library.email_normalizer import is_valid_email
+from library.state_normalizer import StateNormalizer
+from library.zip_normalizer import ZipNormalizer
+
+###############################
+# CONSTANTS
+###############################
+
+# Sha256 hash codes are 64 consecutive hexadecimal digits, a-f and 0-9.
+SHA256_PATTERN = re.compile(r"^[a-f0-9]{64}$")
+
+# Minimum share of non-null sample values that must pass a validator before
+# a column is reported as that PII type.
+MATCH_THRESHOLD = 0.8
+
+# Column name hints, in the order they are checked. FIRST_NAME, LAST_NAME,
+# ADDRESS and CITY have no validator, so they are only inferred from names.
+COLUMN_NAME_HINTS = [
+    ("EMAIL", re.compile(r"e[_-]?mail")),
+    ("PHONE", re.compile(r"phone|mobile|msisdn|^tel")),
+    ("ZIP", re.compile(r"zip|postal|post_?code")),
+    ("STATE", re.compile(r"state|province|region")),
+    ("CITY", re.compile(r"city|town")),
+    ("FIRST_NAME", re.compile(r"first[_ -]?name|given[_ -]?name|fname")),
+    ("LAST_NAME", re.compile(r"last[_ -]?name|sur[_ -]?name|family[_ -]?name|lname")),
+    ("ADDRESS", re.compile(r"address|street")),
+]
+
+US_ZIP_PLUS_FOUR_PATTERN = re.compile(r"^\d{5}-?\d{4}$")
+
+
+###############################
+# VALIDATORS
+###############################
+
+
+def is_hashed(value):
+    return bool(SHA256_PATTERN.match(value))
+
+
+def is_phone(value):
+    # Phone numbers must begin with a country code, as required by
+    # PhoneNormalizer.
+    if not value.startswith("+"):
+        value = "+" + value
+    try:
+        return phonenumbers.is_valid_number(phonenumbers.parse(value, None))
+    except phonenumbers.phonenumberutil.NumberParseException:
+        return False
+
+
+class ZipValidator:
+    def __init__(self, country_code):
+        self.normalizer = ZipNormalizer(country_code)
+        self.country_code = country_code
+
+    def __call__(self, value):
+        stripped = re.sub(self.normalizer.normalize_regex, "", value)
+        # ZipNormalizer truncates long values, so require the exact length
+        # here to avoid reporting every long number as a ZIP code.
+        if len(stripped) != self.normalizer.zip_length:
+            return self.country_code in ("US", None, "") and bool(
+                US_ZIP_PLUS_FOUR_PATTERN.match(value.strip())
+            )
+        return bool(self.normalizer.regex.match(stripped))
+
+
+class StateValidator:
+    def __init__(self, country_code):
+        state_map = StateNormalizer(country_code).state_abbreviation_map
+        self.states = set(state_map) | set(state_map.values())
+
+    def __call__(self, value):
+        return re.sub(r"[^A-Z]", "", value.upper()) in self.states
+
+
+###############################
+# TYPE INFERENCE
+###############################
+
+
+def infer_value_type(value):
+    # Returns the data type of one sample value. Values from CSV files are
+    # always strings, so numbers are also recognized from their text.
+    # Data types match the options offered for dataset columns in the UI, so
+    # booleans are reported as strings.
+    if isinstance(value, bool):
+        return "STRING"
+    if isinstance(value, int):
+        return "LONG"
+    if isinstance(value, float):
+        return "DECIMAL"
+    if not isinstance(value, str):
+        return "STRING"
+    if re.match(r"^[+-]?\d+$", value):
+        # Leading zeros would be lost if the value were read as a number.
+        if len(value.lstrip("+-")) > 1 and value.lstrip("+-").startswith("0"):
+            return "STRING"
+        return "LONG"
+    if re.match(r"^[+-]?(\d+\.\d*|\.\d+)([eE][+-]?\d+)?$", value):
+        return "DECIMAL"
+    if re.match(r"^\d{4}-\d{2}-\d{2}$", value):
+        return "DATE"
+    try:
+        datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return "STRING"
+    return "TIMESTAMP"
+
+
+def infer_data_type(values):
+    data_types = {infer_value_type(value) for value in values}
+    if not data_types:
+        return "STRING"
+    if len(data_types) == 1:
+        return data_types.pop()
+    if data_types == {"LONG", "DECIMAL"}:
+        return "DECIMAL"
+    return "STRING"
+
+
+def match_ratio(validator, values):
+    if not values:
+        return 0.0
+    return sum(1 for value in values if validator(value)) / len(values)
+
+
+def column_name_hint(column_name):
+    name = column_name.lower()
+    for pii_type, pattern in COLUMN_NAME_HINTS:
+        if pattern.search(name):
+            return pii_type
+    return None
+
+
+def infer_pii_type(column_name, values, validators):
+    # Returns (pii_type, match_ratio). Values that pass a validator take
+    # precedence over the column name, except when the column name points to
+    # a type whose validator also passes, because phone numbers and ZIP codes
+    # can look alike.
+    hint = column_name_hint(column_name)
+    if hint in validators:
+        ratio = match_ratio(validators[hint], values)
+        if ratio >= MATCH_THRESHOLD:
+            return hint, ratio
+    for pii_type, validator in validators.items():
+        ratio = match_ratio(validator, values)
+        if ratio >= MATCH_THRESHOLD:
+            return pii_type, ratio
+    if hint and hint not in validators:
+        return hint, None
+    return None, None
+
+
+def infer_schema(columns, rows, country_code=None):
+    # Returns a description of each column in the sample rows. Each row is a
+    # dict of column name to value. Columns that are already hashed are
+    # reported with hashed set to True so that normalization can be skipped.
+    validators = {
+        "EMAIL": is_valid_email,
+        "PHONE": is_phone,
+        "ZIP": ZipValidator(country_code),
+    }
+    state_validator = StateValidator(country_code)
+    if state_validator.states:
+        validators["STATE"] = state_validator
+
+    schema = []
+    for column_name in columns:
+        values = [
+            row.get(column_name)
+            for row in rows
+            if row.get(column_name) not in (None, "")
+        ]
+        text_values = [str(value).strip() for value in values]
+        hashed = bool(text_values) and all(is_hashed(value) for value in text_values)
+        if hashed:
+            pii_type, ratio = column_name_hint(column_name), 1.0
+        else:
+            pii_type, ratio = infer_pii_type(column_name, text_values, validators)
+        schema.append(
+            {
+                "column_name": column_name,
+                "data_type": "STRING" if pii_type or hashed else infer_data_type(values),
+                "pii_type": pii_type,
+                "hashed": hashed,
+                "match_ratio": ratio,
+                "null_count": len(rows) - len(values),
+            }
+        )
+    return schema
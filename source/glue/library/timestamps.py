@@ -0,0 +1,133 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###########################################################################
+# Parses and formats the timestamp column of time series (FACT) datasets.
+#
+# Parsing:
+#   - The dominant ISO 8601 layout of the column is detected from a sample
+#     of its distinct values, and every value is parsed with that explicit
+#     format, which pandas parses in C instead of inferring the format of
+#     each value.
+#   - Each distinct value is parsed once. Time series repeat timestamps, so
+#     there are usually far fewer distinct values than rows.
+#   - Values that do not match the dominant layout are parsed with the
+#     dominant layout of the rest, and values in no known layout are parsed
+#     one by one, as pd.to_datetime would without a format. Values that still
+#     do not parse are invalid: they are returned by position instead of
+#     failing the job.
+#
+# Formatting:
+#   - Timestamps are rendered as %Y-%m-%dT%H:%M:%SZ in UTC with
+#     numpy.datetime_as_string, instead of dt.strftime, which formats each
+#     value in Python.
+#
+# Usage:
+#
+#   parsed, invalid_positions = parse_timestamps(df["timestamp"])
+#   days = time_buckets(parsed, "D")
+#   df["timestamp"] = format_timestamps(parsed)
+#
+##########################################################################
+
+import numpy as np
+import pandas as pd
+
+# ISO 8601 layouts, most common first. %z matches Z as well as offsets.
+ISO_8601_FORMATS = [
+    "%Y-%m-%dT%H:%M:%S%z",
+    "%Y-%m-%dT%H:%M:%S.%f%z",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S%z",
+    "%Y-%m-%d %H:%M:%S.%f%z",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M%z",
+    "%Y-%m-%dT%H:%M",
+    "%Y-%m-%d",
+    "%Y%m%dT%H%M%S%z",
+]
+
+# Distinct values sampled to detect the layout
+FORMAT_SAMPLE_SIZE = 1000
+
+
+def detect_format(values) -> str:
+    # Returns the format of ISO_8601_FORMATS that parses the most values of an
+    # evenly spaced sample, or None if none parses any.
+    values = pd.Series(values, dtype=object)
+    if len(values) > FORMAT_SAMPLE_SIZE:
+        values = values.iloc[np.linspace(0, len(values) - 1, FORMAT_SAMPLE_SIZE).astype(int)]
+    best_format, best_count = None, 0
+    for timestamp_format in ISO_8601_FORMATS:
+        count = pd.to_datetime(values, format=timestamp_format, utc=True, errors="coerce").notna().sum()
+        if count > best_count:
+            best_format, best_count = timestamp_format, count
+        if count == len(values):
+            break
+    return best_format
+
+
+def parse_value(value):
+    # Parses one value in any layout that pd.to_datetime understands.
+    try:
+        return pd.to_datetime(value, utc=True)
+    except (ValueError, TypeError, OverflowError):
+        return pd.NaT
+
+
+def parse_timestamps(values: pd.Series):
+    # Returns the values as UTC timestamps, and the positions of the values
+    # that are not null but could not be parsed. Invalid values are NaT.
+    if pd.api.types.is_datetime64_any_dtype(values):
+        # The JSON reader parses columns named like timestamps.
+        return pd.to_datetime(values, utc=True), np.array([], dtype=int)
+    if pd.api.types.is_numeric_dtype(values):
+        return pd.to_datetime(values, utc=True), np.array([], dtype=int)
+
+    codes, uniques = pd.factorize(values)
+    uniques = pd.Series(np.asarray(uniques, dtype=object))
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype="datetime64[ns, UTC]")
+    # Parse with the dominant layout, then with the dominant layout of the
+    # values that are left, until no layout parses any of them.
+    unparsed = uniques
+    while len(unparsed):
+        timestamp_format = detect_format(unparsed)
+        if timestamp_format is None:
+            break
+        parsed[unparsed.index] = pd.to_datetime(unparsed, format=timestamp_format, utc=True, errors="coerce")
+        unparsed = uniques[parsed.isna()]
+    # Parse values in other layouts one by one.
+    if len(unparsed):
+        parsed[unparsed.index] = pd.to_datetime(unparsed.map(parse_value), utc=True)
+
+    # Null values have code -1 and stay null.
+    timestamps = parsed.dt.tz_localize(None).to_numpy().take(codes)
+    timestamps[codes == -1] = np.datetime64("NaT")
+    result = pd.Series(timestamps, index=values.index).dt.tz_localize("UTC")
+    invalid_positions = np.flatnonzero((codes != -1) & np.isnat(timestamps))
+    return result, invalid_positions
+
+
+def format_timestamps(values: pd.Series) -> pd.Series:
+    # Returns UTC timestamps as %Y-%m-%dT%H:%M:%SZ strings. NaT is NaN, as
+    # with dt.strftime.
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+    timestamps = values.to_numpy(dtype="datetime64[ns]")
+    formatted = np.char.add(np.datetime_as_string(timestamps, unit="s"), "Z").astype(object)
+    formatted[np.isnat(timestamps)] = np.nan
+    return pd.Series(formatted, index=values.index)
+
+
+def time_buckets(values: pd.Series, unit: str) -> np.ndarray:
+    # Returns the day ("D") or hour ("h") of UTC timestamps as strings in the
+    # ISO 8601 basic format, e.g. 20240101 or 20240101T13, which sort in time
+    # order. NaT is "undated".
+    if values.dt.tz is not None:
+        values = values.dt.tz_convert("UTC").dt.tz_localize(None)
+    buckets = values.to_numpy(dtype="datetime64[ns]").astype(f"datetime64[{unit}]")
+    labels = np.char.replace(np.char.replace(np.datetime_as_string(buckets, unit=unit), "-", ""), ":", "")
+    labels[np.isnat(buckets)] = "undated"
+    return labels
@@ -9,6 +9,7 @@ from library.city_normalizer import CityNormalizer
 from library.default_normalizer import DefaultNormalizer
 from library.email_normalizer import EmailNormalizer
 from library.phone_normalizer import PhoneNormalizer
+from library.profiling import DISABLED_PROFILE
 from library.state_normalizer import StateNormalizer
 from library.zip_normalizer import ZipNormalizer
 
@@ -27,6 +28,21 @@ def skip_record_flag(text):
         return True
 
 
+# Vectorized skip_record_flag, used to count skipped records.
+def skip_record_mask(values: pd.Series) -> pd.Series:
+    return values.isna() | values.astype(str).str.match("^[a-f0-9]{64}$")
+
+
+# Use this function to skip columns that are already hashed.
+# Only columns flagged as hashed in pii_fields are checked, and they are
+# skipped only if every non-null value is a sha256 hash.
+def skip_column_flag(data, field):
+    if not field.get("hashed"):
+        return False
+    values = data[field["column_name"]].dropna().astype(str)
+    return bool(values.str.fullmatch("[a-f0-9]{64}").all())
+
+
 class NormalizationPatterns:
     def __init__(self, field, country_code):
         field_map = {
@@ -50,23 +66,33 @@ class NormalizationPatterns:
 
 
 def transform_data(
-    data: pd.DataFrame, pii_fields: dict, country_code: str
+    data: pd.DataFrame, pii_fields: dict, country_code: str, profile=DISABLED_PROFILE
 ) -> pd.DataFrame:
     for field in pii_fields:
-        column_name = field["column_name"]
-        pii_type = field["pii_type"]
-        field_normalizer = NormalizationPatterns(
-            field=pii_type, country_code=country_code
-        )
-        data[column_name] = (
-            data[column_name]
-            .copy()
-            .apply(
-                lambda x, field_normalizer=field_normalizer: x
-                if skip_record_flag(x)
-                else field_normalizer.text_transformations(text=x)
+        with profile.column("normalize", field, len(data)) as column:
+            if skip_column_flag(data, field):
+                column["skipped"] += len(data)
+                continue
+            column_name = field["column_name"]
+            pii_type = field["pii_type"]
+            field_normalizer = NormalizationPatterns(
+                field=pii_type, country_code=country_code
+            )
+            values = data[column_name]
+            data[column_name] = (
+                values
+                .copy()
+                .apply(
+                    lambda x, field_normalizer=field_normalizer: x
+                    if skip_record_flag(x)
+                    else field_normalizer.text_transformations(text=x)
+                )
             )
-        )
+            if profile.enabled:
+                # Normalizers return an empty string for invalid values.
+                skipped = skip_record_mask(values)
+                column["skipped"] += int(skipped.sum())
+                column["invalidated"] += int(((data[column_name] == "") & ~skipped).sum())
     return data
 
 
@@ -75,16 +101,22 @@ def transform_data(
 ###############################
 
 
-def hash_data(data: pd.DataFrame, pii_fields: dict) -> pd.DataFrame:
+def hash_data(data: pd.DataFrame, pii_fields: dict, profile=DISABLED_PROFILE) -> pd.DataFrame:
     for field in pii_fields:
-        column_name = field["column_name"]
-        data[column_name] = (
-            data[column_name]
-            .copy()
-            .apply(
-                lambda x: x
-                if skip_record_flag(x)
-                else hashlib.sha256(x.encode()).hexdigest()
+        with profile.column("hash", field, len(data)) as column:
+            if skip_column_flag(data, field):
+                column["skipped"] += len(data)
+                continue
+            column_name = field["column_name"]
+            if profile.enabled:
+                column["skipped"] += int(skip_record_mask(data[column_name]).sum())
+            data[column_name] = (
+                data[column_name]
+                .copy()
+                .apply(
+                    lambda x: x
+                    if skip_record_flag(x)
+                    else hashlib.sha256(x.encode()).hexdigest()
+                )
             )
-        )
     return data
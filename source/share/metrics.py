@@ -0,0 +1,118 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###########################################################################
+# This file contains helpers for recording latency and count metrics in
+# CloudWatch Embedded Metric Format (EMF). EMF lines are written to stdout,
+# and CloudWatch Logs extracts them as metrics in the METRICS_NAMESPACE
+# namespace.
+# Reference:
+# https://docs.aws.amazon.com/AmazonCloudWatch/latest/monitoring/CloudWatch_Embedded_Metric_Format_Specification.html
+#
+# Metrics are only recorded when ENABLE_LATENCY_METRICS is "true". When it is
+# not, timed() used as a decorator returns the decorated function unchanged
+# and timed() used as a context manager does nothing.
+#
+# Usage:
+#
+#   @metrics.timed("StartUpload")
+#   def _start_upload(**kwargs):
+#       ...
+#
+#   with metrics.timed("TokenExchange"):
+#       response = send_request(...)
+#
+#   metrics.count("Throttles", 2, Phase="AmcRequest")
+#
+##########################################################################
+
+import json
+import os
+import sys
+import time
+from contextlib import ContextDecorator
+
+METRICS_ENABLED = os.environ.get("ENABLE_LATENCY_METRICS", "false").lower() == "true"
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "amcufa")
+
+
+def emit(metrics, dimensions):
+    # Writes one EMF line.
+    #
+    # Inputs:
+    #  - metrics: dict of metric name to (value, unit)
+    #  - dimensions: dict of dimension name to value
+    record = {
+        "_aws": {
+            "Timestamp": int(time.time() * 1000),
+            "CloudWatchMetrics": [
+                {
+                    "Namespace": METRICS_NAMESPACE,
+                    "Dimensions": [sorted(dimensions)],
+                    "Metrics": [
+                        {"Name": name, "Unit": unit}
+                        for name, (_, unit) in metrics.items()
+                    ],
+                }
+            ],
+        },
+        **dimensions,
+        **{name: value for name, (value, _) in metrics.items()},
+    }
+    # Write directly to stdout so that the log formatter does not prefix the
+    # JSON document, which would stop CloudWatch from parsing it.
+    sys.stdout.write(json.dumps(record) + "\n")
+    sys.stdout.flush()
+
+
+def count(name, value=1, **dimensions):
+    if not METRICS_ENABLED:
+        return
+    emit({name: (value, "Count")}, dimensions)
+
+
+class PhaseTimer(ContextDecorator):
+    # Emits the wall-clock duration of a block or function call as a
+    # "Latency" metric with a Phase dimension.
+    def __init__(self, phase, dimensions):
+        self.phase = phase
+        self.dimensions = dimensions
+        self.start = None
+
+    def _recreate_cm(self):
+        # Use a new timer for each call of a decorated function so that
+        # concurrent or recursive calls do not share a start time.
+        return PhaseTimer(self.phase, self.dimensions)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        elapsed_ms = (time.perf_counter() - self.start) * 1000
+        metrics = {"Latency": (round(elapsed_ms, 3), "Milliseconds")}
+        if exc_type is not None:
+            metrics["Errors"] = (1, "Count")
+        emit(metrics, {"Phase": self.phase, **self.dimensions})
+        return False
+
+
+class DisabledTimer:
+    # No-op stand-in for PhaseTimer used when metrics are disabled.
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+    def __call__(self, func):
+        return func
+
+
+DISABLED_TIMER = DisabledTimer()
+
+
+def timed(phase, **dimensions):
+    if not METRICS_ENABLED:
+        return DISABLED_TIMER
+    return PhaseTimer(phase, dimensions)
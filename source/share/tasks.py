@@ -11,17 +11,21 @@
 #
 ##########################################################################
 
+import asyncio
 import json
 import logging
 import os
+import threading
 import urllib.parse
-from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial, wraps
 from chalice import Response
 import boto3
 import requests
 from botocore import config
 from botocore.exceptions import ClientError
 from requests.adapters import HTTPAdapter, Retry
+from share import metrics
 
 # format log messages like this:
 formatter = logging.Formatter(
@@ -37,17 +41,56 @@ logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 logger.addHandler(handler)
 
-# Environment variables
-AMC_API_ROLE = os.environ["AMC_API_ROLE_ARN"]
-SOLUTION_NAME = os.environ["SOLUTION_NAME"]
-SOLUTION_VERSION = os.environ.get(
-    "VERSION", os.environ.get("SOLUTION_VERSION")
-)
-solution_config = json.loads(os.environ["botoConfig"])
-config = config.Config(**solution_config)
 NO_ACCESS_KEY_ERROR = "No access key is available."
 DELETE_STRING = "TOKEN_DELETED"
 ADS_SCOPE = "profile%20advertising::campaign_management"
+# Maximum number of AMC requests that may be in flight at once when fanning
+# out requests with gather_amc_requests().
+AMC_MAX_CONCURRENCY = int(os.environ.get("AMC_MAX_CONCURRENCY", "10"))
+# Maximum number of retries for AMC and LwA requests
+MAX_RETRY = 10
+
+
+# The botocore config, clients and resources are created on first use, so
+# that importing this module neither reads the environment nor loads service
+# models. They are then reused across invocations of the Lambda container.
+# The default boto3 session is not thread safe, so clients and resources are
+# created under a lock, and worker threads may call these functions.
+boto3_lock = threading.Lock()
+
+
+@lru_cache(maxsize=None)
+def get_boto_config():
+    return config.Config(**json.loads(os.environ["botoConfig"]))
+
+
+def get_boto3_client(service_name, config_override=None):
+    # config_override is merged into the solution config. Pass the same
+    # Config object each time so that the client is created once.
+    with boto3_lock:
+        return create_boto3_client(service_name, config_override)
+
+
+def get_boto3_resource(service_name):
+    with boto3_lock:
+        return create_boto3_resource(service_name)
+
+
+@lru_cache(maxsize=None)
+def create_boto3_client(service_name, config_override=None):
+    boto_config = get_boto_config()
+    if config_override is not None:
+        boto_config = boto_config.merge(config_override)
+    return boto3.client(
+        service_name, region_name=os.environ["AWS_REGION"], config=boto_config
+    )
+
+
+@lru_cache(maxsize=None)
+def create_boto3_resource(service_name):
+    return boto3.resource(
+        service_name, region_name=os.environ["AWS_REGION"], config=get_boto_config()
+    )
 
 
 def safe_json_loads(obj):
@@ -57,50 +100,87 @@ def safe_json_loads(obj):
         return obj
 
 
+def create_request_session(pool_maxsize=10):
+    # Returns a requests session that retries requests that receive server
+    # errors (5xx) or throttling errors (429). Its connection pool holds up to
+    # pool_maxsize connections per host, so one session can be shared by that
+    # many concurrent requests.
+    session_request = requests.Session()
+    retries = Retry(
+        total=MAX_RETRY,
+        backoff_factor=0.5,
+        status_forcelist=[504, 500, 429],
+        allowed_methods=frozenset(["GET", "DELETE", "POST", "PUT"]),
+    )
+    session_request.mount(
+        "https://",
+        HTTPAdapter(max_retries=retries, pool_maxsize=pool_maxsize),
+    )
+    return session_request
+
+
 def send_request(
-    request_url, headers, http_method, data=None, params=None
+    request_url, headers, http_method, data=None, params=None, session=None
 ):
     logger.info("\nBEGIN REQUEST+++++++++++++++++++++++++++++++++++")
     logger.info(f"Request URL = {request_url}")
     logger.info(f"HTTP_METHOD: {http_method}")
+    logger.info(f"Retry: {MAX_RETRY}")
 
-    # Retry requests that receive server error (5xx) or throttling errors 429.
-    with (requests.Session() as session_request):
-        max_retry = 10
-        retries = Retry(
-            total=max_retry,
-            backoff_factor=0.5,
-            status_forcelist=[504, 500, 429],
-            allowed_methods=frozenset(["GET", "DELETE", "POST", "PUT"]),
-        )
-        session_request.mount("https://", HTTPAdapter(max_retries=retries))
-        logger.info(f"Retry: {max_retry}")
-
-        response = session_request.request(
-            method=http_method,
-            url=request_url,
-            headers=headers,
-            data=data,
-            params=params
+    # Use the caller's session to reuse its connections. Otherwise use a new
+    # session for this request only.
+    if session is not None:
+        response = _send_request(
+            session, request_url, headers, http_method, data, params
         )
+    else:
+        with create_request_session() as session_request:
+            response = _send_request(
+                session_request, request_url, headers, http_method, data, params
+            )
 
-        logger.info("\nRESPONSE+++++++++++++++++++++++++++++++++++")
-        logger.info(f"Response code: {response.status_code}\n")
-        logger.info(f"Response keys: {response.json().keys()}\n")
-        return response
+    logger.info("\nRESPONSE+++++++++++++++++++++++++++++++++++")
+    logger.info(f"Response code: {response.status_code}\n")
+    logger.info(f"Response keys: {response.json().keys()}\n")
+    if metrics.METRICS_ENABLED:
+        record_retry_metrics(response, request_url)
+    return response
+
+
+def _send_request(session_request, request_url, headers, http_method, data, params):
+    return session_request.request(
+        method=http_method,
+        url=request_url,
+        headers=headers,
+        data=data,
+        params=params
+    )
+
+
+def record_retry_metrics(response, request_url):
+    # Count the retries and throttles (HTTP 429) which urllib3 performed
+    # before this response was returned.
+    retries = getattr(response.raw, "retries", None)
+    history = getattr(retries, "history", None) or ()
+    host = urllib.parse.urlparse(request_url).netloc
+    metrics.count("Retries", len(history), Host=host)
+    metrics.count(
+        "Throttles",
+        sum(1 for attempt in history if attempt.status == 429),
+        Host=host,
+    )
 
 
 def create_update_secret(secret_id, secret_string):
-    session = boto3.session.Session(region_name=os.environ["AWS_REGION"])
-    client = session.client(service_name="secretsmanager", config=config)
+    client = get_boto3_client("secretsmanager")
     if isinstance(secret_string, dict):
         secret_string = json.dumps(secret_string)
     client.update_secret(SecretId=secret_id, SecretString=secret_string)
 
 
+@metrics.timed("SecretsManagerRead")
 def get_secret(secret_id):
-    session = boto3.session.Session(region_name=os.environ["AWS_REGION"])
-    client = session.client(service_name="secretsmanager", config=config)
+    client = get_boto3_client("secretsmanager")
     res = client.get_secret_value(
         SecretId=secret_id,
     )
@@ -175,17 +255,18 @@ def get_ads_token(**kwargs):
             "code": auth_code,
         }
 
-    response = send_request(
-        http_method="POST",
-        request_url="https://api.amazon.com/auth/o2/token",
-        headers=None,
-        data={
-            **code_payload,
-            "redirect_uri": redirect_uri,
-            "client_id": client_id,
-            "client_secret": client_secret,
-        },
-    )
+    with metrics.timed("TokenExchange"):
+        response = send_request(
+            http_method="POST",
+            request_url="https://api.amazon.com/auth/o2/token",
+            headers=None,
+            data={
+                **code_payload,
+                "redirect_uri": redirect_uri,
+                "client_id": client_id,
+                "client_secret": client_secret,
+            },
+        )
 
     if "refresh_token" in response.json():
         secret_value = {
@@ -254,8 +335,8 @@ class AMCRequests:
         self.request_parameters = kwargs.get("request_parameters")
         self.is_amc_report = kwargs.get("is_amc_report", True)
 
-    def process_request(self, **kwargs):
-
+    def prepare_request(self, **kwargs):
+        # Returns the request url and headers for an AMC request.
         amc_path = self.amc_path
         if self.is_amc_report:
             amc_path = f"/amc/advertiserData/{kwargs['instance_id']}{self.amc_path}"
@@ -285,67 +366,184 @@ class AMCRequests:
         logger.debug(f"AMC_REQUEST_PAYLOAD: {self.payload}")
         logger.debug(f"AMC_HTTP_METHOD: {self.http_method}")
 
-        return send_request(
-            request_url=base_url,
-            headers=headers,
-            http_method=self.http_method,
-            data=self.payload,
-            params=self.request_parameters,
+        return base_url, headers
+
+    def process_request(self, **kwargs):
+        base_url, headers = self.prepare_request(**kwargs)
+        with metrics.timed("AmcRequest"):
+            return send_request(
+                request_url=base_url,
+                headers=headers,
+                http_method=self.http_method,
+                data=self.payload,
+                params=self.request_parameters,
+            )
+
+
+class AsyncAMCRequests(AMCRequests):
+    #
+    # asyncio variant of AMCRequests. Requests are built exactly like
+    # AMCRequests requests and are sent on a worker thread so that many
+    # of them can be awaited concurrently, e.g. with gather_amc_requests().
+    #
+    async def process_request_async(self, executor=None, session=None, **kwargs):
+        base_url, headers = self.prepare_request(**kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            executor,
+            partial(
+                metrics.timed("AmcRequest")(send_request),
+                request_url=base_url,
+                headers=headers,
+                http_method=self.http_method,
+                data=self.payload,
+                params=self.request_parameters,
+                session=session,
+            ),
         )
 
 
-def apply_amc_bucket_permission():
+async def gather_amc_requests(amc_requests, max_concurrency=AMC_MAX_CONCURRENCY):
+    #
+    # Sends AMC requests concurrently and returns their responses in the
+    # order they were given.
+    #
+    # Inputs:
+    #  - amc_requests: list of (AsyncAMCRequests, kwargs) tuples, where kwargs
+    #    are the values passed to process_request (client_id, access_token,
+    #    instance_id, advertiser_id, marketplace_id, ...).
+    #  - max_concurrency: maximum number of requests in flight at once.
+    #
+    # Outputs:
+    #  - list with one item per request. Each item is either the response or
+    #    the exception raised while sending that request, so that one failed
+    #    request does not discard the results of the others.
+    #
+    if not amc_requests:
+        return []
+    max_concurrency = max(1, min(max_concurrency, len(amc_requests)))
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    # All requests share one connection pool, so that connections to AMC
+    # are reused instead of opened for every request.
+    with (
+        ThreadPoolExecutor(max_workers=max_concurrency) as executor,
+        create_request_session(pool_maxsize=max_concurrency) as session_request,
+    ):
+        async def bounded_request(amc_request, request_kwargs):
+            async with semaphore:
+                return await amc_request.process_request_async(
+                    executor=executor, session=session_request, **request_kwargs
+                )
+
+        return await asyncio.gather(
+            *[
+                bounded_request(amc_request, request_kwargs)
+                for amc_request, request_kwargs in amc_requests
+            ],
+            return_exceptions=True,
+        )
+
+
+def fan_out_amc_requests(amc_requests, max_concurrency=AMC_MAX_CONCURRENCY):
+    # Synchronous entry point to gather_amc_requests() for Lambda handlers.
+    return asyncio.run(
+        gather_amc_requests(amc_requests, max_concurrency=max_concurrency)
+    )
+
+
+def apply_amc_bucket_permission(amc_instances=None):
+    # Allows the data upload account of each AMC instance to read the
+    # ArtifactBucket. The bucket policy is only saved when the set of data
+    # upload accounts has changed.
+    #
+    # Inputs:
+    #  - amc_instances: the AMC instances system configuration. It is read
+    #    from the system table when not provided.
+    #
+    # Returns a dict with the principals that were "added" and "removed",
+    # and whether the bucket policy was "updated".
     artifact_bucket = os.environ["ARTIFACT_BUCKET"]
-    system_table_name = os.environ["SYSTEM_TABLE_NAME"]
+    changes = {"added": [], "removed": [], "updated": False}
 
-    dynamo_resource = boto3.resource("dynamodb", config=config)
-    system_table = dynamo_resource.Table(system_table_name)
+    if amc_instances is None:
+        system_table = get_boto3_resource("dynamodb").Table(os.environ["SYSTEM_TABLE_NAME"])
+        # Get the AMC instances system configuration
+        response = system_table.get_item(
+            Key={"Name": "AmcInstances"}, ConsistentRead=True
+        )
+        amc_instances = response.get("Item", {}).get("Value", [])
+    # If there are no AMC instances then leave the bucket policy unchanged.
+    if not amc_instances:
+        return changes
 
-    s3_client = boto3.client("s3", config=config)
+    s3_client = get_boto3_client("s3")
     logger.info("reading bucket policy")
     # Get the bucket policy for the ArtifactBucket.
     result = s3_client.get_bucket_policy(Bucket=artifact_bucket)
     policy = json.loads(result["Policy"])
-    # Get the AMC instances system configuration
-    response = system_table.get_item(
-        Key={"Name": "AmcInstances"}, ConsistentRead=True
+    # Construct a bucket policy statement with a principal that includes
+    # each data upload account id. Use set type to avoid duplicates.
+    data_upload_accounts = sorted(
+        {f"arn:aws:iam::{item['data_upload_account_id']}:root" for item in amc_instances}
     )
-    # If there is at least one AMC instance...
-    if "Item" in response and len(response["Item"]["Value"]) > 0:
-        amc_instances = response["Item"]["Value"]
-        # Get the list of data upload account ids associated with each AMC instance.
-        # Use set type to avoid duplicates
-        data_upload_account_ids = set([item["data_upload_account_id"] for item in amc_instances])
-        # Construct a bucket policy statement with a principal that includes
-        # each data upload account id.
-        data_upload_accounts = [f"arn:aws:iam::{account_id}:root" for account_id in data_upload_account_ids]
-        data_upload_statement = {
-            "Sid": "AllowDataUploadFromAmc",
-            "Effect": "Allow",
-            "Principal": {"AWS": data_upload_accounts},
-            "Action": ["s3:GetObject", "s3:GetObjectVersion", "s3:ListBucket", "s3:GetObjectTagging", "s3:GetBucketTagging"],
-            "Resource": [f"arn:aws:s3:::{artifact_bucket}/*", f"arn:aws:s3:::{artifact_bucket}"]
-        }
-        # Remove the old "AllowDataUploadFromAmc" statement from the bucket policy.
-        other_statements = [
-            x
-            for x in policy["Statement"]
-            if not ("Sid" in x and x["Sid"] == "AllowDataUploadFromAmc")
-        ]
-        # Add the new "AllowDataUploadFromAmc" statement to the bucket policy
-        policy["Statement"] = [data_upload_statement] + other_statements
-        # Save the new bucket policy
-        logger.info("new bucket policy:")
-        logger.info(json.dumps(policy))
-        logger.info("saving bucket policy")
-        try:
-            result = s3_client.put_bucket_policy(
-                Bucket=artifact_bucket, Policy=json.dumps(policy)
-            )
-            logger.info(json.dumps(result))
-        except ClientError as e:
-            error_code = e.response['Error']['Code']
-            if error_code == 'MalformedPolicy':
-                print("Error: Invalid principal in policy. Please check the policy and try again.")
-            else:
-                print(f"An error occurred: {e}")
+    data_upload_statement = {
+        "Sid": "AllowDataUploadFromAmc",
+        "Effect": "Allow",
+        "Principal": {"AWS": data_upload_accounts},
+        "Action": ["s3:GetObject", "s3:GetObjectVersion", "s3:ListBucket", "s3:GetObjectTagging", "s3:GetBucketTagging"],
+        "Resource": [f"arn:aws:s3:::{artifact_bucket}/*", f"arn:aws:s3:::{artifact_bucket}"]
+    }
+    # Find the current "AllowDataUploadFromAmc" statement, if any.
+    current_statement = next(
+        (x for x in policy["Statement"] if x.get("Sid") == "AllowDataUploadFromAmc"),
+        None,
+    )
+    current_accounts = set()
+    if current_statement:
+        # S3 returns a single principal as a string rather than a list.
+        principals = current_statement.get("Principal", {}).get("AWS", [])
+        current_accounts = {principals} if isinstance(principals, str) else set(principals)
+    changes["added"] = sorted(set(data_upload_accounts) - current_accounts)
+    changes["removed"] = sorted(current_accounts - set(data_upload_accounts))
+    logger.info("bucket policy principal changes: " + json.dumps(changes))
+    if (
+        current_statement
+        and not changes["added"]
+        and not changes["removed"]
+        and statement_values(current_statement, "Action") == statement_values(data_upload_statement, "Action")
+        and statement_values(current_statement, "Resource") == statement_values(data_upload_statement, "Resource")
+    ):
+        logger.info("bucket policy is unchanged")
+        return changes
+    # Replace the old "AllowDataUploadFromAmc" statement in the bucket policy.
+    other_statements = [
+        x
+        for x in policy["Statement"]
+        if x.get("Sid") != "AllowDataUploadFromAmc"
+    ]
+    policy["Statement"] = [data_upload_statement] + other_statements
+    # Save the new bucket policy
+    logger.info("new bucket policy:")
+    logger.info(json.dumps(policy))
+    logger.info("saving bucket policy")
+    try:
+        result = s3_client.put_bucket_policy(
+            Bucket=artifact_bucket, Policy=json.dumps(policy)
+        )
+        logger.info(json.dumps(result))
+        changes["updated"] = True
+    except ClientError as e:
+        error_code = e.response['Error']['Code']
+        if error_code == 'MalformedPolicy':
+            print("Error: Invalid principal in policy. Please check the policy and try again.")
+        else:
+            print(f"An error occurred: {e}")
+    return changes
+
+
+def statement_values(statement, name):
+    # Returns the values of a policy statement element as a set, since
+    # elements with one value may be a string rather than a list.
+    values = statement.get(name, [])
+    return {values} if isinstance(values, str) else set(values)
@@ -0,0 +1,156 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# ###############################################################################
+# PURPOSE:
+#   * Measure the import time of the Lambda handlers, which dominates their
+#     cold start latency. Each handler is imported in a fresh interpreter with
+#     "python -X importtime", and the slowest modules it imports are reported.
+# USAGE:
+#   python tests/benchmark/cold_start.py [--handler api] [--repeat 5] [--top 15] [--json]
+#   (run from the source directory)
+###############################################################################
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SOURCE_DIR = Path(__file__).resolve().parents[2]
+
+# Handler name: (directory the Lambda code runs from, module to import)
+HANDLERS = {
+    "api": ("api", "app"),
+    "amc_uploader": ("amc_uploader", "amc_uploader"),
+    "upload_tracker": ("amc_uploader", "upload_tracker"),
+}
+
+# Environment variables that the handlers read at import time
+HANDLER_ENVIRONMENT = {
+    "AWS_REGION": "us-east-1",
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_XRAY_SDK_ENABLED": "false",
+    "botoConfig": '{"region_name": "us-east-1"}',
+    "VERSION": "0.0.0",
+    "SOLUTION_NAME": "amcufa",
+    "AMC_API_ROLE_ARN": "arn:aws:iam::123456789012:role/amcufa",
+    "AMC_GLUE_JOB_NAME": "amcufa-glue-job",
+    "ARTIFACT_BUCKET": "amcufa-artifacts",
+    "SYSTEM_TABLE_NAME": "amcufa-system",
+    "UPLOAD_FAILURES_TABLE_NAME": "amcufa-upload-failures",
+    "UPLOADS_TABLE_NAME": "amcufa-uploads",
+    "UPLOAD_LEDGER_TABLE_NAME": "amcufa-upload-ledger",
+    "CUSTOMER_MANAGED_KEY": "",
+    "STACK_NAME": "amcufa",
+    "ACCOUNT_ID": "123456789012",
+}
+
+
+def parse_import_times(stderr):
+    # Returns a list of (depth, module, self_us, cumulative_us) tuples parsed
+    # from the output of "python -X importtime".
+    import_times = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        import_times.append((depth, name.strip(), int(self_us), int(cumulative_us)))
+    return import_times
+
+
+def import_handler(handler):
+    directory, module = HANDLERS[handler]
+    env = {**HANDLER_ENVIRONMENT, **os.environ}
+    env["PYTHONPATH"] = os.pathsep.join(
+        [str(SOURCE_DIR), str(SOURCE_DIR / "glue"), str(SOURCE_DIR / directory)]
+    )
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SOURCE_DIR / directory,
+        env=env,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    if result.returncode != 0:
+        raise RuntimeError(f"Failed to import {module}:\n{result.stderr[-2000:]}")
+    import_times = parse_import_times(result.stderr)
+    # The handler module is the last top-level import in the output, and its
+    # direct dependencies are the imports one level below it.
+    handler_index = max(
+        index
+        for index, (depth, name, _, _) in enumerate(import_times)
+        if depth == 0 and name == module
+    )
+    dependencies = {}
+    for depth, name, _, cumulative_us in reversed(import_times[:handler_index]):
+        if depth == 0:
+            break
+        if depth == 1:
+            dependencies[name] = cumulative_us / 1000
+    return {
+        "wall_ms": wall_ms,
+        "import_ms": import_times[handler_index][3] / 1000,
+        "dependencies_ms": dependencies,
+    }
+
+
+def benchmark(handler, repeat):
+    runs = [import_handler(handler) for _ in range(repeat)]
+    dependencies = {name for run in runs for name in run["dependencies_ms"]}
+    return {
+        "handler": handler,
+        "repeat": repeat,
+        "wall_ms": statistics.median(run["wall_ms"] for run in runs),
+        "import_ms": statistics.median(run["import_ms"] for run in runs),
+        "dependencies_ms": {
+            name: statistics.median(
+                run["dependencies_ms"].get(name, 0.0) for run in runs
+            )
+            for name in dependencies
+        },
+    }
+
+
+def print_result(result, top):
+    print(
+        f"{result['handler']}: import {result['import_ms']:.1f} ms, "
+        f"interpreter total {result['wall_ms']:.1f} ms "
+        f"(median of {result['repeat']})"
+    )
+    slowest = sorted(
+        result["dependencies_ms"].items(), key=lambda item: item[1], reverse=True
+    )
+    for name, import_ms in slowest[:top]:
+        print(f"  {import_ms:9.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the Lambda handlers.")
+    parser.add_argument(
+        "--handler", choices=sorted(HANDLERS), action="append",
+        help="Handler to measure. May be repeated. Defaults to all handlers.",
+    )
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+
+    results = [
+        benchmark(handler, args.repeat) for handler in args.handler or sorted(HANDLERS)
+    ]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for result in results:
+        print_result(result, args.top)
+
+
+if __name__ == "__main__":
+    main()
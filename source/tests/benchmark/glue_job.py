@@ -0,0 +1,222 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# ###############################################################################
+# PURPOSE:
+#   * Run the Glue ETL job, glue/amc_transformations.py, end to end on this
+#     machine and report how long each stage takes.
+#   * awsglue.utils is replaced by a stand-in that parses job arguments the
+#     way Glue does, and S3 is replaced by moto, so no AWS account is needed.
+#   * The input file is either a local CSV or JSON Lines file, or is made by
+#     synthetic_data.py.
+#   * Reports the performance profile that the job records: the wall time,
+#     rows per second and resident set size (RSS) high-water mark after each
+#     stage that ran, the peak RSS of the job, and the number and total size
+#     of the files it writes.
+# USAGE:
+#   python tests/benchmark/glue_job.py --country US --rows 100000 [--format jsonl]
+#       [--input data.csv.gz --pii-fields '[...]'] [--timestamp-column timestamp [--timeseries-partition-size P1D]]
+#       [--engine arrow] [--output-file-size 500000000] [--json]
+#   (run from the source directory)
+###############################################################################
+
+import argparse
+import contextlib
+import json
+import os
+import runpy
+import sys
+import tempfile
+import types
+from pathlib import Path
+from unittest.mock import patch
+
+SOURCE_DIR = Path(__file__).resolve().parents[2]
+GLUE_DIR = SOURCE_DIR / "glue"
+JOB_SCRIPT = GLUE_DIR / "amc_transformations.py"
+sys.path.insert(0, str(GLUE_DIR))
+
+# moto intercepts every request, but boto3 still needs credentials and a region.
+for name, value in {
+    "AWS_ACCESS_KEY_ID": "testing",
+    "AWS_SECRET_ACCESS_KEY": "testing",
+    "AWS_DEFAULT_REGION": "us-east-1",
+}.items():
+    os.environ.setdefault(name, value)
+
+import boto3  # noqa: E402
+import synthetic_data  # noqa: E402
+from library import read_write as rw  # noqa: E402
+from moto import mock_aws  # noqa: E402
+
+SOURCE_BUCKET = "amcufa-benchmark-source"
+OUTPUT_BUCKET = "amcufa-benchmark-output"
+
+
+###############################
+# AWSGLUE STAND-IN
+###############################
+
+
+class GlueArgumentError(Exception):
+    pass
+
+
+def get_resolved_options(args, options):
+    # Returns the requested --options from args, like
+    # awsglue.utils.getResolvedOptions. Glue always passes JOB_RUN_ID.
+    values = {}
+    for index, arg in enumerate(args[:-1]):
+        if arg.startswith("--"):
+            values[arg[2:]] = args[index + 1]
+    missing = [option for option in options if option not in values]
+    if missing:
+        raise GlueArgumentError(f"the following arguments are required: {', '.join('--' + option for option in missing)}")
+    resolved = {option: values[option] for option in options}
+    if "JOB_RUN_ID" in values:
+        resolved["JOB_RUN_ID"] = values["JOB_RUN_ID"]
+    return resolved
+
+
+def awsglue_modules():
+    awsglue = types.ModuleType("awsglue")
+    awsglue_utils = types.ModuleType("awsglue.utils")
+    awsglue_utils.GlueArgumentError = GlueArgumentError
+    awsglue_utils.getResolvedOptions = get_resolved_options
+    awsglue.utils = awsglue_utils
+    return {"awsglue": awsglue, "awsglue.utils": awsglue_utils}
+
+
+###############################
+# JOB
+###############################
+
+
+def job_arguments(args, source_key, pii_fields):
+    job_arguments = {
+        "JOB_NAME": "amcufa-benchmark",
+        "JOB_RUN_ID": "jr_benchmark",
+        "solution_id": "SO0222",
+        "uuid": "benchmark",
+        "enable_anonymous_data": "false",
+        "anonymous_data_logger": "none",
+        "source_bucket": SOURCE_BUCKET,
+        "source_key": source_key,
+        "output_bucket": OUTPUT_BUCKET,
+        "pii_fields": json.dumps(pii_fields),
+        "deleted_fields": json.dumps(args.deleted_fields),
+        "dataset_id": "benchmark",
+        "user_id": "benchmark",
+        "file_format": "JSON" if args.format == "jsonl" else "CSV",
+        "amc_instances": json.dumps(args.amc_instances),
+        "update_strategy": "ADDITIVE",
+        "country_code": args.country,
+        "engine": args.engine,
+    }
+    if args.timestamp_column:
+        job_arguments["timestamp_column"] = args.timestamp_column
+    if args.timeseries_partition_size:
+        job_arguments["timeseries_partition_size"] = args.timeseries_partition_size
+    return [str(JOB_SCRIPT), *[item for name, value in job_arguments.items() for item in (f"--{name}", value)]]
+
+
+def put_input_file(s3, args):
+    # Uploads the input file and returns its key and PII fields.
+    if args.input:
+        source_key = Path(args.input).name
+        s3.upload_file(args.input, SOURCE_BUCKET, source_key)
+        return source_key, json.loads(args.pii_fields)
+    source_key = f"synthetic_{args.country.lower()}.{args.format}.gz"
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, source_key)
+        rows = synthetic_data.generate_rows(args.country, args.rows, seed=args.seed)
+        with synthetic_data.open_output(path, compress=True) as output:
+            synthetic_data.write_rows(rows, output, args.format, synthetic_data.columns(args.country))
+        s3.upload_file(path, SOURCE_BUCKET, source_key)
+    return source_key, synthetic_data.pii_fields(args.country)
+
+
+def run_job(args):
+    with mock_aws():
+        s3 = boto3.client("s3")
+        s3.create_bucket(Bucket=SOURCE_BUCKET)
+        s3.create_bucket(Bucket=OUTPUT_BUCKET)
+        source_key, pii_fields = put_input_file(s3, args)
+        input_bytes = s3.head_object(Bucket=SOURCE_BUCKET, Key=source_key)["ContentLength"]
+
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(patch.dict(sys.modules, awsglue_modules()))
+            stack.enter_context(patch.object(sys, "argv", job_arguments(args, source_key, pii_fields)))
+            if args.output_file_size:
+                stack.enter_context(patch.object(rw, "GZIPPED_OUTPUT_FILE_SIZE_IN_BYTES", float(args.output_file_size)))
+            # The job writes a temporary file to the working directory.
+            directory = stack.enter_context(tempfile.TemporaryDirectory())
+            stack.enter_context(contextlib.chdir(directory))
+            if not args.verbose:
+                devnull = stack.enter_context(open(os.devnull, "w"))
+                stack.enter_context(contextlib.redirect_stdout(devnull))
+            job_globals = runpy.run_path(str(JOB_SCRIPT), run_name="__main__")
+
+        outputs = s3.list_objects_v2(Bucket=OUTPUT_BUCKET).get("Contents", [])
+    # The job records the performance of each stage that it runs.
+    report = job_globals["file"].profile.report()
+    rows = next((stage["rows"] for stage in report["stages"] if stage["stage"] == "read"), 0)
+    return {
+        "input_bytes": input_bytes,
+        "rows": rows,
+        "rows_per_second": rows / report["wall_seconds"] if report["wall_seconds"] else 0.0,
+        "output_files": len(outputs),
+        "output_bytes": sum(output["Size"] for output in outputs),
+        **report,
+    }
+
+
+def print_result(result):
+    print(
+        f"{result['rows']} rows, {result['input_bytes']:,} input bytes, "
+        f"{result['wall_seconds']:.2f} s, {result['rows_per_second']:,.0f} rows/s, "
+        f"peak RSS {result['peak_memory_mb']:.0f} MB"
+    )
+    print(f"{result['output_files']} output files, {result['output_bytes']:,} output bytes")
+    for stage in result["stages"]:
+        rows_per_second = f"{stage['rows_per_second']:>12,.0f} rows/s" if stage["rows_per_second"] else " " * 19
+        print(
+            f"  {stage['stage']:<10} {stage['wall_seconds']:9.3f} s  {rows_per_second}  "
+            f"RSS high-water {stage['peak_memory_mb']:.0f} MB"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Glue ETL job locally and report how long each stage takes.")
+    parser.add_argument("--country", choices=synthetic_data.COUNTRY_CODES, default="US")
+    parser.add_argument("--rows", type=int, default=100000, help="Rows of synthetic input.")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--input", help="Local input file to use instead of synthetic data.")
+    parser.add_argument("--pii-fields", help="--pii_fields argument of the job. Required with --input.")
+    parser.add_argument("--deleted-fields", type=json.loads, default=[], help="JSON list of columns to delete.")
+    parser.add_argument("--engine", choices=["pandas", "arrow"], default="pandas")
+    parser.add_argument("--timestamp-column", help="Timestamp column of FACT datasets, e.g. timestamp.")
+    parser.add_argument(
+        "--timeseries-partition-size", choices=["P1D", "PT1H"],
+        help="Partition FACT datasets by day or hour. Requires --timestamp-column.",
+    )
+    parser.add_argument("--amc-instances", type=json.loads, default=["amc12345678"], help="JSON list of AMC instance IDs.")
+    parser.add_argument(
+        "--output-file-size", type=int,
+        help="Override the maximum output file size in bytes, to exercise partitioning with small inputs.",
+    )
+    parser.add_argument("--verbose", action="store_true", help="Show the output of the job.")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+    if args.input and not args.pii_fields:
+        parser.error("--pii-fields is required with --input")
+
+    result = run_job(args)
+    if args.json:
+        print(json.dumps(result, indent=2))
+    else:
+        print_result(result)
+
+
+if __name__ == "__main__":
+    main()
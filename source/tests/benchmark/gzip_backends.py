@@ -0,0 +1,150 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# ###############################################################################
+# PURPOSE:
+#   * Measure the throughput and output size of each gzip backend of the Glue
+#     ETL job (glue/library/output_writer.py) at each compression level and
+#     number of threads.
+#   * The data is typical output of the job: rows made by synthetic_data.py
+#     whose PII columns are hashed by transform.hash_data, encoded as JSON
+#     Lines or CSV the way output files are.
+#   * Reports MB of uncompressed text compressed per second and the
+#     compression ratio. Backends that are not installed are skipped.
+# USAGE:
+#   python tests/benchmark/gzip_backends.py [--country US] [--rows 100000] [--format jsonl]
+#       [--backend isal] [--level 1 --level 6] [--threads 1 --threads 4] [--repeat 3] [--json]
+#   (run from the source directory)
+###############################################################################
+
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+SOURCE_DIR = Path(__file__).resolve().parents[2]
+sys.path.insert(0, str(SOURCE_DIR / "glue"))
+
+import pandas as pd  # noqa: E402
+import synthetic_data  # noqa: E402
+from library import output_writer, transform  # noqa: E402
+
+DEFAULT_LEVELS = [1, 6, 9]
+DEFAULT_THREADS = [1, 4]
+
+
+class CountingWriter:
+    # Binary file-like object that counts the bytes written to it and
+    # discards them, so that only compression is measured.
+    def __init__(self):
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data) -> int:
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+def hashed_batches(country_code, rows, seed, file_format):
+    # Returns the output text of the job for synthetic rows, in the batches
+    # that output_writer compresses.
+    df = pd.DataFrame(synthetic_data.generate_rows(country_code, rows, seed=seed), dtype=str)
+    df = transform.hash_data(df, synthetic_data.pii_fields(country_code))
+    if file_format == "jsonl":
+        return list(output_writer.json_lines_batches(df))
+    return list(output_writer.csv_batches(df))
+
+
+def compress(batches, backend, level, threads):
+    # Returns the compressed size of batches.
+    output = CountingWriter()
+    with output_writer.open_gzip(output, backend=backend, level=level, threads=threads) as compressed:
+        for batch in batches:
+            compressed.write(batch)
+    return output.size
+
+
+def run_benchmarks(batches, backends, levels, threads_counts, repeat):
+    batches = [batch.encode("utf-8") for batch in batches]
+    input_bytes = sum(len(batch) for batch in batches)
+    results = []
+    for backend in backends:
+        for level in levels:
+            for threads in threads_counts:
+                elapsed = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    output_bytes = compress(batches, backend, level, threads)
+                    elapsed.append(time.perf_counter() - start)
+                seconds = statistics.median(elapsed)
+                results.append(
+                    {
+                        "backend": backend,
+                        "level": level,
+                        "threads": threads,
+                        "input_bytes": input_bytes,
+                        "output_bytes": output_bytes,
+                        "seconds": seconds,
+                        "mb_per_second": input_bytes / seconds / 1000000 if seconds else 0.0,
+                        "compression_ratio": input_bytes / output_bytes,
+                    }
+                )
+    return results
+
+
+def print_results(results):
+    if results:
+        print(f"{results[0]['input_bytes']:,} bytes of uncompressed text")
+    for result in results:
+        print(
+            f"{result['backend']:<8} level {result['level']}  {result['threads']:>2} threads  "
+            f"{result['mb_per_second']:>8,.1f} MB/s  ratio {result['compression_ratio']:5.2f}  "
+            f"({result['output_bytes']:,} bytes in {result['seconds']:.3f} s)"
+        )
+
+
+def main():
+    available = output_writer.available_compression_backends()
+    parser = argparse.ArgumentParser(description="Measure the throughput and compression ratio of each gzip backend.")
+    parser.add_argument("--country", choices=synthetic_data.COUNTRY_CODES, default="US")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="jsonl")
+    parser.add_argument(
+        "--backend", choices=output_writer.COMPRESSION_BACKENDS, action="append",
+        help="Backend to measure. May be repeated. Defaults to all installed backends.",
+    )
+    parser.add_argument(
+        "--level", type=int, choices=range(1, 10), action="append",
+        help=f"Compression level. May be repeated. Defaults to {DEFAULT_LEVELS}.",
+    )
+    parser.add_argument(
+        "--threads", type=int, action="append",
+        help=f"Compression threads. May be repeated. Defaults to {DEFAULT_THREADS}.",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON.")
+    args = parser.parse_args()
+    backends = args.backend or available
+    missing = [backend for backend in backends if backend not in available]
+    if missing:
+        parser.error(f"not installed: {', '.join(missing)}")
+
+    batches = hashed_batches(args.country, args.rows, args.seed, args.format)
+    results = run_benchmarks(
+        batches, backends, args.level or DEFAULT_LEVELS, args.threads or DEFAULT_THREADS, args.repeat
+    )
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print_results(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# ###############################################################################
+# PURPOSE:
+#   * Measure the throughput, in records per second, of each PII normalizer
+#     and of transform.hash_data for each supported country code.
+#   * Each country is measured on a fixed corpus that is sampled with a fixed
+#     seed from the mock records in tests/unit_test/amc_transformation/sample_data,
+#     so results are comparable between runs and machines.
+#   * With --baseline, results are compared with a previous --output file and
+#     the script exits with status 1 when any throughput regresses by more
+#     than --threshold.
+# USAGE:
+#   python tests/benchmark/normalizers.py [--country US] [--benchmark PhoneNormalizer]
+#       [--records 20000] [--repeat 3] [--corpus {sample,synthetic}] [--output results.json]
+#       [--baseline baseline.json] [--threshold 0.2]
+#   (run from the source directory)
+###############################################################################
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+SOURCE_DIR = Path(__file__).resolve().parents[2]
+SAMPLE_DATA_DIR = SOURCE_DIR / "tests" / "unit_test" / "amc_transformation" / "sample_data"
+sys.path.insert(0, str(SOURCE_DIR / "glue"))
+
+import pandas as pd  # noqa: E402
+import phonenumbers  # noqa: E402
+import synthetic_data  # noqa: E402
+from library import transform  # noqa: E402
+
+COUNTRY_CODES = ["US", "GB", "JP", "IN", "IT", "ES", "CA", "DE", "FR"]
+
+# Benchmark name: (pii_type passed to transform.NormalizationPatterns, sample column)
+NORMALIZER_BENCHMARKS = {
+    "AddressNormalizer": ("ADDRESS", "address"),
+    "PhoneNormalizer": ("PHONE", "phone"),
+    "EmailNormalizer": ("EMAIL", "email"),
+    "ZipNormalizer": ("ZIP", "zip"),
+    "StateNormalizer": ("STATE", "state"),
+    "CityNormalizer": ("CITY", "city"),
+    "DefaultNormalizer": ("FIRST_NAME", "first_name"),
+}
+HASH_BENCHMARK = "hash_data"
+BENCHMARKS = [*NORMALIZER_BENCHMARKS, HASH_BENCHMARK]
+
+DEFAULT_RECORDS = 20000
+DEFAULT_SEED = 42
+
+
+def load_corpus(country_code, records, seed, corpus="sample"):
+    # Returns a DataFrame with the given number of records sampled from the
+    # sample data of the country. Values are varied the way real input
+    # varies (case and surrounding whitespace) so that the normalizers do
+    # the same work they do in production.
+    #
+    # With corpus "synthetic", records are made by synthetic_data.py
+    # instead, which also varies the formats of addresses and phone numbers.
+    if corpus == "synthetic":
+        rows = synthetic_data.generate_rows(country_code, records, seed=seed)
+        return pd.DataFrame(rows, dtype=str)
+    sample_file = SAMPLE_DATA_DIR / f"test_{country_code.lower()}" / f"{country_code.lower()}_raw.json"
+    sample = json.loads(sample_file.read_text())
+    rng = random.Random(f"{seed}-{country_code}")
+    calling_code = str(phonenumbers.country_code_for_region(country_code))
+
+    def vary(value):
+        return rng.choice([value, value.upper(), value.lower(), f" {value} "])
+
+    rows = []
+    for _ in range(records):
+        row = {
+            column: vary(value)
+            for column, value in rng.choice(sample).items()
+            if column not in ("id", "timestamp") and value is not None
+        }
+        # Phone numbers must begin with a country code.
+        if "phone" in row:
+            row["phone"] = calling_code + row["phone"].strip()
+        rows.append(row)
+    return pd.DataFrame(rows, dtype=str)
+
+
+def time_function(function, repeat):
+    # Returns the median elapsed seconds of repeat calls of function.
+    # AddressNormalizer prints progress messages, which are discarded so
+    # that they do not flood the results.
+    elapsed = []
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            elapsed.append(time.perf_counter() - start)
+    return statistics.median(elapsed)
+
+
+def benchmark_normalizer(corpus, country_code, pii_type, column, repeat):
+    normalizer = transform.NormalizationPatterns(field=pii_type, country_code=country_code)
+    values = corpus[column].dropna().tolist()
+
+    def normalize():
+        for value in values:
+            normalizer.text_transformations(text=value)
+
+    return len(values), time_function(normalize, repeat)
+
+
+def benchmark_hash_data(corpus, repeat):
+    pii_fields = [
+        {"column_name": column, "pii_type": pii_type}
+        for pii_type, column in NORMALIZER_BENCHMARKS.values()
+        if column in corpus.columns
+    ]
+    # hash_data replaces columns in place, so hash a new copy each time.
+    copies = iter([corpus.copy() for _ in range(repeat)])
+    return len(corpus), time_function(
+        lambda: transform.hash_data(next(copies), pii_fields), repeat
+    )
+
+
+def run_benchmarks(country_codes, benchmarks, records, repeat, seed, corpus="sample"):
+    results = []
+    for country_code in country_codes:
+        data = load_corpus(country_code, records, seed, corpus)
+        for benchmark in benchmarks:
+            if benchmark == HASH_BENCHMARK:
+                count, seconds = benchmark_hash_data(data, repeat)
+            else:
+                pii_type, column = NORMALIZER_BENCHMARKS[benchmark]
+                # Not every country has a value for every column.
+                if column not in data.columns:
+                    continue
+                count, seconds = benchmark_normalizer(data, country_code, pii_type, column, repeat)
+            results.append(
+                {
+                    "benchmark": benchmark,
+                    "country_code": country_code,
+                    "records": count,
+                    "seconds": seconds,
+                    "records_per_second": count / seconds if seconds else 0.0,
+                }
+            )
+    return results
+
+
+def compare_results(results, baseline, threshold):
+    # Returns a list of (result, baseline records_per_second, change) for
+    # each result that is also in the baseline, and whether any of them
+    # regressed by more than threshold.
+    baseline_throughput = {
+        (result["benchmark"], result["country_code"]): result["records_per_second"]
+        for result in baseline["results"]
+    }
+    comparisons = []
+    regressed = False
+    for result in results:
+        previous = baseline_throughput.get((result["benchmark"], result["country_code"]))
+        if not previous:
+            continue
+        change = result["records_per_second"] / previous - 1
+        regressed = regressed or change < -threshold
+        comparisons.append((result, previous, change))
+    return comparisons, regressed
+
+
+def print_results(results):
+    for result in results:
+        print(
+            f"{result['benchmark']:<18} {result['country_code']}  "
+            f"{result['records_per_second']:>12,.0f} records/s  "
+            f"({result['records']} records in {result['seconds']:.3f} s)"
+        )
+
+
+def print_comparisons(comparisons, threshold):
+    for result, previous, change in comparisons:
+        status = "REGRESSED" if change < -threshold else "ok"
+        print(
+            f"{result['benchmark']:<18} {result['country_code']}  "
+            f"{previous:>12,.0f} -> {result['records_per_second']:>12,.0f} records/s  "
+            f"{change:+7.1%}  {status}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the throughput of the PII normalizers and of hash_data.")
+    parser.add_argument(
+        "--country", choices=COUNTRY_CODES, action="append",
+        help="Country code to measure. May be repeated. Defaults to all countries.",
+    )
+    parser.add_argument(
+        "--benchmark", choices=BENCHMARKS, action="append",
+        help="Benchmark to run. May be repeated. Defaults to all benchmarks.",
+    )
+    parser.add_argument("--records", type=int, default=DEFAULT_RECORDS)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument(
+        "--corpus", choices=["sample", "synthetic"], default="sample",
+        help="Sample records from the unit test sample data, or generate them with synthetic_data.py.",
+    )
+    parser.add_argument("--output", help="Save results as JSON to this file.")
+    parser.add_argument("--baseline", help="Compare results with this JSON results file.")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2,
+        help="Largest allowed drop in throughput relative to the baseline. Default is 0.2 (20%%).",
+    )
+    args = parser.parse_args()
+
+    results = run_benchmarks(
+        args.country or COUNTRY_CODES, args.benchmark or BENCHMARKS,
+        args.records, args.repeat, args.seed, args.corpus,
+    )
+    print_results(results)
+    if args.output:
+        output = {
+            "metadata": {
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "records": args.records,
+                "repeat": args.repeat,
+                "seed": args.seed,
+                "corpus": args.corpus,
+            },
+            "results": results,
+        }
+        Path(args.output).write_text(json.dumps(output, indent=2))
+    if args.baseline:
+        baseline = json.loads(Path(args.baseline).read_text())
+        if (
+            baseline["metadata"]["records"] != args.records
+            or baseline["metadata"]["seed"] != args.seed
+            or baseline["metadata"].get("corpus", "sample") != args.corpus
+        ):
+            print("Warning: the baseline was measured on a different corpus.")
+        comparisons, regressed = compare_results(results, baseline, args.threshold)
+        print_comparisons(comparisons, args.threshold)
+        if regressed:
+            print(f"Throughput regressed by more than {args.threshold:.0%}.")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# ###############################################################################
+# PURPOSE:
+#   * Generate synthetic datasets with PII columns in the formats of each
+#     supported country, for testing the Glue ETL job at scale.
+#   * Output is deterministic for a given seed, and rows are written one at a
+#     time, so files of any size are generated in constant memory.
+#   * Names, cities, streets, states and email domains are drawn from the mock
+#     records in tests/unit_test/amc_transformation/sample_data. Addresses and
+#     phone numbers are written in several messy variants, and a share of the
+#     PII values can be replaced by sha256 hashes or nulls.
+# USAGE:
+#   python tests/benchmark/synthetic_data.py --country US --rows 1000000
+#       [--format {csv,jsonl}] [--gzip] [--output data.csv.gz] [--seed 42]
+#       [--cardinality email=10000] [--hashed-fraction 0.05] [--null-fraction 0.02]
+#       [--start 2024-01-01T00:00:00Z] [--days 30] [--print-pii-fields]
+#   (run from the source directory)
+###############################################################################
+
+import argparse
+import contextlib
+import csv
+import gzip
+import hashlib
+import io
+import json
+import random
+import re
+import sys
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from pathlib import Path
+
+SOURCE_DIR = Path(__file__).resolve().parents[2]
+SAMPLE_DATA_DIR = SOURCE_DIR / "tests" / "unit_test" / "amc_transformation" / "sample_data"
+
+COUNTRY_CODES = ["US", "GB", "JP", "IN", "IT", "ES", "CA", "DE", "FR"]
+
+# Column name: pii_type, as passed to the Glue job in --pii_fields
+PII_COLUMNS = {
+    "first_name": "FIRST_NAME",
+    "last_name": "LAST_NAME",
+    "email": "EMAIL",
+    "phone": "PHONE",
+    "address": "ADDRESS",
+    "city": "CITY",
+    "state": "STATE",
+    "zip": "ZIP",
+}
+OTHER_COLUMNS = ["id", "timestamp", "amount", "quantity", "category"]
+CATEGORIES = ["apparel", "beauty", "books", "electronics", "grocery", "home", "sports", "toys"]
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+# Country calling code and number of digits in national phone numbers
+PHONE_FORMATS = {
+    "US": ("1", 10),
+    "CA": ("1", 10),
+    "GB": ("44", 10),
+    "JP": ("81", 10),
+    "IN": ("91", 10),
+    "IT": ("39", 10),
+    "ES": ("34", 9),
+    "DE": ("49", 11),
+    "FR": ("33", 9),
+}
+
+# Patterns of postal codes, where "9" is a digit and "A" is a letter.
+ZIP_PATTERNS = {
+    "US": ["99999", "99999-9999"],
+    "CA": ["A9A 9A9", "A9A9A9"],
+    "GB": ["A9 9AA", "A99 9AA", "AA9 9AA", "AA99 9AA", "A9A 9AA", "AA9A 9AA"],
+    "JP": ["999-9999", "9999999"],
+    "IN": ["999999", "999 999"],
+    "IT": ["99999"],
+    "ES": ["99999"],
+    "DE": ["99999"],
+    "FR": ["99999", "99 999"],
+}
+
+UNIT_DESIGNATORS = ["Apt", "Unit", "#", "Suite", "Flat", "No."]
+DIGITS = "0123456789"
+LETTERS = "ABCDEFGHJKLMNPRSTUVWXYZ"
+
+
+@lru_cache(maxsize=None)
+def load_pools(country_code):
+    # Returns lists of the distinct values of each sample data column, with
+    # street names separated from house numbers, and email domains.
+    sample_file = SAMPLE_DATA_DIR / f"test_{country_code.lower()}" / f"{country_code.lower()}_raw.json"
+    sample = json.loads(sample_file.read_text())
+
+    def distinct(column):
+        return sorted({record[column] for record in sample if record.get(column)})
+
+    return {
+        "first_name": distinct("first_name"),
+        "last_name": distinct("last_name"),
+        "city": distinct("city"),
+        "state": distinct("state"),
+        "street": sorted({re.sub(r"^\d+\s+", "", record["address"]) for record in sample}),
+        "domain": sorted({record["email"].split("@")[-1] for record in sample}),
+    }
+
+
+def pii_fields(country_code):
+    # Returns the --pii_fields argument of the Glue job for generated files.
+    return [
+        {"column_name": column, "pii_type": pii_type}
+        for column, pii_type in PII_COLUMNS.items()
+        if column != "state" or load_pools(country_code)["state"]
+    ]
+
+
+def columns(country_code):
+    return ["id", *[field["column_name"] for field in pii_fields(country_code)], *OTHER_COLUMNS[1:]]
+
+
+###############################
+# VALUE GENERATORS
+###############################
+
+
+def messy(rng, value):
+    # Varies the case and spacing of a value the way hand-entered data does.
+    return rng.choice([value, value, value.upper(), value.lower(), f" {value}", f"{value}  "])
+
+
+def generate_name(rng, pools, column):
+    return messy(rng, rng.choice(pools[column]))
+
+
+def generate_email(rng, pools, country_code):
+    first_name = re.sub(r"\W", "", rng.choice(pools["first_name"])).lower()
+    last_name = re.sub(r"\W", "", rng.choice(pools["last_name"])).lower()
+    local_part = rng.choice(
+        [f"{first_name}.{last_name}", f"{first_name[:1]}{last_name}", f"{first_name}{rng.randint(1, 999)}"]
+    )
+    email = f"{local_part}@{rng.choice(pools['domain'])}"
+    return rng.choice([email, email, email.upper(), f" {email} "])
+
+
+def generate_phone(rng, pools, country_code):
+    calling_code, length = PHONE_FORMATS[country_code]
+    digits = str(rng.randrange(2 * 10 ** (length - 1), 10 ** length))
+    head, middle, tail = digits[:3], digits[3:6], digits[6:]
+    return rng.choice(
+        [
+            f"+{calling_code}{digits}",
+            f"{calling_code}{digits}",
+            f"+{calling_code} {head} {middle} {tail}",
+            f"+{calling_code}-{head}-{middle}-{tail}",
+            f"+{calling_code} ({head}) {middle}-{tail}",
+            f"{calling_code}.{head}.{middle}.{tail}",
+        ]
+    )
+
+
+def generate_address(rng, pools, country_code):
+    street = rng.choice(pools["street"])
+    number = str(rng.randint(1, 9999))
+    if country_code in ("DE", "IT", "ES", "FR") and rng.random() < 0.5:
+        # Many European addresses put the house number after the street.
+        address = f"{street} {number}"
+    else:
+        address = f"{number} {street}"
+    variant = rng.random()
+    if variant < 0.2:
+        address += f" {rng.choice(UNIT_DESIGNATORS)} {rng.randint(1, 999)}"
+    elif variant < 0.3:
+        address = address.replace(" ", "  ", 1)
+    elif variant < 0.4:
+        address = re.sub(r"^(\d+) ", r"\1-", address)
+    elif variant < 0.5:
+        address += ","
+    return messy(rng, address)
+
+
+def generate_zip(rng, pools, country_code):
+    pattern = rng.choice(ZIP_PATTERNS[country_code])
+    random = rng.random
+    return "".join(
+        DIGITS[int(random() * len(DIGITS))] if character == "9"
+        else LETTERS[int(random() * len(LETTERS))] if character == "A"
+        else character
+        for character in pattern
+    )
+
+
+def generate_value(rng, pools, country_code, column):
+    if column in ("first_name", "last_name", "city", "state"):
+        return generate_name(rng, pools, column)
+    return {
+        "email": generate_email,
+        "phone": generate_phone,
+        "address": generate_address,
+        "zip": generate_zip,
+    }[column](rng, pools, country_code)
+
+
+###############################
+# ROWS
+###############################
+
+
+def generate_rows(
+    country_code,
+    rows,
+    seed=42,
+    cardinality=None,
+    hashed_fraction=0.0,
+    null_fraction=0.0,
+    start=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    days=30,
+):
+    # Yields rows as dicts of column name to string value, or None for nulls.
+    #
+    # Inputs:
+    #  - cardinality: dict of column name to the number of distinct values
+    #    generated for that column. Other columns have no limit.
+    #  - hashed_fraction: share of PII values replaced by their sha256 hash
+    #  - null_fraction: share of PII values replaced by null
+    #  - start, days: timestamps are spread uniformly over this period
+    pools = load_pools(country_code)
+    cardinality = cardinality or {}
+    rng = random.Random(f"{seed}:{country_code}")
+    period_seconds = int(timedelta(days=days).total_seconds())
+    pii_columns = [field["column_name"] for field in pii_fields(country_code)]
+
+    # Values of columns with limited cardinality are generated from their own
+    # seed, so value N of a column is the same wherever it appears.
+    @lru_cache(maxsize=65536)
+    def limited_value(column, index):
+        value_rng = random.Random(f"{seed}:{country_code}:{column}:{index}")
+        return generate_value(value_rng, pools, country_code, column)
+
+    for row_number in range(rows):
+        row = {"id": str(row_number + 1)}
+        for column in pii_columns:
+            if column in cardinality:
+                value = limited_value(column, rng.randrange(cardinality[column]))
+            else:
+                value = generate_value(rng, pools, country_code, column)
+            draw = rng.random()
+            if draw < null_fraction:
+                value = None
+            elif draw < null_fraction + hashed_fraction:
+                value = hashlib.sha256(value.strip().lower().encode()).hexdigest()
+            row[column] = value
+        timestamp = start + timedelta(seconds=rng.randrange(period_seconds))
+        row["timestamp"] = timestamp.strftime(TIMESTAMP_FORMAT)
+        row["amount"] = f"{rng.lognormvariate(3, 1):.2f}"
+        row["quantity"] = str(rng.randint(1, 10))
+        row["category"] = rng.choice(CATEGORIES)
+        yield row
+
+
+###############################
+# OUTPUT
+###############################
+
+
+@contextlib.contextmanager
+def open_output(path, compress):
+    # Opens a text stream to the output file, or stdout when path is "-".
+    # Gzip output has no file name or timestamp in its header so that it is
+    # deterministic.
+    with contextlib.ExitStack() as stack:
+        if path == "-":
+            binary = sys.stdout.buffer
+        else:
+            binary = stack.enter_context(open(path, "wb"))
+        if compress:
+            binary = stack.enter_context(gzip.GzipFile(filename="", fileobj=binary, mode="wb", mtime=0))
+        text = io.TextIOWrapper(binary, encoding="utf-8", newline="")
+        try:
+            yield text
+        finally:
+            text.flush()
+            text.detach()
+
+
+def write_rows(rows, output, file_format, column_names):
+    if file_format == "csv":
+        writer = csv.writer(output)
+        writer.writerow(column_names)
+        for row in rows:
+            writer.writerow(["" if row[column] is None else row[column] for column in column_names])
+    else:
+        for row in rows:
+            output.write(json.dumps(row, ensure_ascii=False))
+            output.write("\n")
+
+
+def parse_cardinality(values):
+    cardinality = {}
+    for value in values or []:
+        column, _, count = value.partition("=")
+        if column not in PII_COLUMNS or not count.isdigit() or int(count) < 1:
+            raise argparse.ArgumentTypeError(f"Invalid cardinality {value}. Use COLUMN=COUNT.")
+        cardinality[column] = int(count)
+    return cardinality
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic datasets with PII columns for each country.")
+    parser.add_argument("--country", choices=COUNTRY_CODES, default="US")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--format", choices=["csv", "jsonl"], default="csv")
+    parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip.")
+    parser.add_argument("--output", default="-", help="Output file. Default is stdout.")
+    parser.add_argument(
+        "--cardinality", action="append", metavar="COLUMN=COUNT",
+        help="Number of distinct values of a PII column. May be repeated.",
+    )
+    parser.add_argument("--hashed-fraction", type=float, default=0.0)
+    parser.add_argument("--null-fraction", type=float, default=0.0)
+    parser.add_argument("--start", default="2024-01-01T00:00:00Z", help="ISO-8601 time of the first timestamp.")
+    parser.add_argument("--days", type=int, default=30, help="Number of days the timestamps span.")
+    parser.add_argument(
+        "--print-pii-fields", action="store_true",
+        help="Print the --pii_fields argument of the Glue job for the output and exit.",
+    )
+    args = parser.parse_args()
+
+    if args.print_pii_fields:
+        print(json.dumps(pii_fields(args.country)))
+        return
+    try:
+        cardinality = parse_cardinality(args.cardinality)
+    except argparse.ArgumentTypeError as ex:
+        parser.error(str(ex))
+    start = datetime.fromisoformat(args.start.replace("Z", "+00:00"))
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=timezone.utc)
+    compress = args.gzip or args.output.endswith(".gz")
+
+    rows = generate_rows(
+        args.country, args.rows, seed=args.seed, cardinality=cardinality,
+        hashed_fraction=args.hashed_fraction, null_fraction=args.null_fraction,
+        start=start, days=args.days,
+    )
+    with open_output(args.output, compress) as output:
+        write_rows(rows, output, args.format, columns(args.country))
+
+
+if __name__ == "__main__":
+    main()
@@ -492,14 +492,44 @@ def test_version(test_configs):
 
 @pytest.mark.dependency(depends=["test_test_configs"])
 def test_list_bucket(test_configs):
-    with Client(app.app) as client:
-        response = client.http.post(
-            "/list_bucket",
-            headers={"Content-Type": test_configs["content_type"]},
-            body=json.dumps({"data_bucket_name": test_configs["data_bucket_name"]}),
-        )
+    prefix = f"integ_test_list_bucket_{random.randint(1000, 9999)}/"
+    keys = [f"{prefix}file_{index}.json" for index in range(3)] + [f"{prefix}folder/file.json"]
+    s3 = boto3.resource("s3", region_name=test_configs["region"])
+    bucket = s3.Bucket(test_configs["data_bucket_name"])
+    for key in keys:
+        bucket.put_object(Key=key, Body=b"{}\n")
+
+    def list_bucket(**kwargs):
+        with Client(app.app) as client:
+            response = client.http.post(
+                "/list_bucket",
+                headers={"Content-Type": test_configs["content_type"]},
+                body=json.dumps({"s3bucket": test_configs["data_bucket_name"], **kwargs}),
+            )
         assert response.status_code == 200
-        assert len(response.json_body) > 0
+        assert set(response.json_body) == {"objects", "common_prefixes", "next_continuation_token"}
+        return response.json_body
+
+    try:
+        page = list_bucket(prefix=prefix, delimiter="/")
+        assert [item["key"] for item in page["objects"]] == keys[:3]
+        assert page["common_prefixes"] == [f"{prefix}folder/"]
+        assert page["next_continuation_token"] is None
+
+        # Pages are returned in order until next_continuation_token is null.
+        listed_keys = []
+        continuation_token = None
+        for _ in keys:
+            page = list_bucket(prefix=prefix, page_size=1, continuation_token=continuation_token)
+            assert len(page["objects"]) == 1
+            listed_keys += [item["key"] for item in page["objects"]]
+            continuation_token = page["next_continuation_token"]
+            if continuation_token is None:
+                break
+        assert listed_keys == sorted(keys)
+        assert continuation_token is None
+    finally:
+        bucket.delete_objects(Delete={"Objects": [{"Key": key} for key in keys]})
 
 
 @pytest.mark.dependency(depends=["test_setup_amc_instance"])
@@ -138,6 +138,8 @@ then
     export SYSTEM_TABLE_NAME="test_table"
     export ARTIFACT_BUCKET="test-etl-artifact"
     export UPLOAD_FAILURES_TABLE_NAME="upload_failures_test_table"
+    export UPLOADS_TABLE_NAME="uploads_test_table"
+    export UPLOAD_LEDGER_TABLE_NAME="upload_ledger_test_table"
     export CLIENT_ID="123456sdgdg"
     export CLIENT_SECRET="fdvaed4535gd"
     export STACK_NAME="amcufa-stack-name"
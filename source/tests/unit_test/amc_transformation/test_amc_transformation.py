@@ -7,20 +7,29 @@
 #   ./run_test.sh --run_unit_test --test-file-name amc_transformation/test_amc_transformation.py
 ###############################################################################
 
+import gzip
+import hashlib
+import io
+import json
+import marshal
 import os
 import shutil
 from unittest.mock import ANY, patch, Mock, MagicMock
 from unittest import TestCase
 from pathlib import Path
 import pandas as pd
+import pyarrow as pa
 import pytest
 from glue.library import read_write as rw
-from glue.library import transform
+from glue.library import arrow_engine, compaction, schema_inference, timestamps, transform
 from glue.library.address_normalizer import load_address_map_helper
 from moto import mock_aws
 import boto3
 import sys
 
+# SHA-256 hash of a normalized email, which the job passes through unchanged
+HASHED_EMAIL = hashlib.sha256(b"jane@example.com").hexdigest()
+
 
 ###############################
 # TEST NORMALIZER UTILS
@@ -373,16 +382,335 @@ test_args = {
 }
 
 
-@patch("awswrangler.s3.to_json")
-def test_write_to_s3_json(mock_to_json):
+@patch.object(rw.output_writer, "write_json_lines")
+def test_write_to_s3_json(mock_write_json_lines):
     rw.write_to_s3(df="test", filepath="test", file_format="JSON")
-    mock_to_json.assert_called()
+    mock_write_json_lines.assert_called_once_with(df="test", path="test")
+
+
+@mock_aws
+def test_write_json_lines():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="test")
+    df = pd.DataFrame(
+        {
+            "email": [HASHED_EMAIL, None, "a/b", "é"],
+            "timestamp": ["2024-01-01T00:00:00Z"] * 4,
+            "amount": [1.5, float("nan"), 0.1 + 0.2, 3.0],
+            "quantity": [1, 2, 3, 4],
+        }
+    )
+    rw.output_writer.write_json_lines(df=df, path="s3://test/small.gz", batch_rows=3)
+    body = s3.get_object(Bucket="test", Key="small.gz")["Body"].read()
+    assert gzip.decompress(body).decode() == df.to_json(orient="records", lines=True)
+
+    # Files larger than one part are uploaded in several parts.
+    df = pd.DataFrame({"value": [hashlib.sha256(str(i).encode()).hexdigest() for i in range(200000)]})
+    with patch.object(rw.output_writer, "MULTIPART_PART_SIZE", 5 * 1024 * 1024):
+        rw.output_writer.write_json_lines(df=df, path="s3://test/large.gz")
+    body = s3.get_object(Bucket="test", Key="large.gz")["Body"].read()
+    assert s3.head_object(Bucket="test", Key="large.gz", PartNumber=1)["PartsCount"] == 2
+    assert gzip.decompress(body).decode() == df.to_json(orient="records", lines=True)
+
+
+def test_json_lines_batches_without_trailing_newline():
+    # pandas before 1.5 does not end to_json(lines=True) with a newline.
+    df = pd.DataFrame({"id": [1, 2, 3]})
+    to_json = pd.DataFrame.to_json
+    with patch.object(pd.DataFrame, "to_json", lambda self, **kwargs: to_json(self, **kwargs).rstrip("\n")):
+        batches = list(rw.output_writer.json_lines_batches(df, batch_rows=2))
+    assert "".join(batches) == '{"id":1}\n{"id":2}\n{"id":3}\n'
+
+
+@mock_aws
+def test_write_csv():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="test")
+    df = pd.DataFrame(
+        {
+            "email": [HASHED_EMAIL, None, "a,b", 'say "hi"'],
+            "amount": [1.5, float("nan"), 0.1 + 0.2, 3.0],
+        }
+    )
+    rw.output_writer.write_csv(df=df, path="s3://test/small.gz", batch_rows=3)
+    body = s3.get_object(Bucket="test", Key="small.gz")["Body"].read()
+    assert gzip.decompress(body).decode() == df.to_csv(index=False)
+
+    # Empty files still have a header.
+    rw.output_writer.write_csv(df=df.iloc[:0], path="s3://test/empty.gz")
+    body = s3.get_object(Bucket="test", Key="empty.gz")["Body"].read()
+    assert gzip.decompress(body).decode() == "email,amount\n"
+
+
+def test_open_gzip():
+    data = "".join(hashlib.sha256(str(i).encode()).hexdigest() + "\n" for i in range(100000)).encode()
+    for backend in rw.output_writer.available_compression_backends():
+        for threads in (1, 4):
+            output = io.BytesIO()
+            with patch.object(rw.output_writer, "COMPRESSION_BLOCK_SIZE", 256 * 1024):
+                with rw.output_writer.open_gzip(output, backend=backend, level=1, threads=threads) as compressed:
+                    compressed.write(data[:1000])
+                    compressed.write(data[1000:])
+            # Output is standard gzip, possibly of several members.
+            assert gzip.decompress(output.getvalue()) == data, (backend, threads)
+
+    # Empty input is one empty gzip member.
+    output = io.BytesIO()
+    with rw.output_writer.open_gzip(output, backend="zlib", level=6, threads=2):
+        pass
+    assert gzip.decompress(output.getvalue()) == b""
+
+
+def test_configure_compression():
+    compression = dict(rw.output_writer.compression)
+    try:
+        rw.output_writer.configure_compression(backend="zlib", level="3", threads="2")
+        assert rw.output_writer.compression == {"backend": "zlib", "level": 3, "threads": 2}
+        # Arguments that are None keep their value.
+        rw.output_writer.configure_compression(level="5")
+        assert rw.output_writer.compression == {"backend": "zlib", "level": 5, "threads": 2}
+        with pytest.raises(ValueError):
+            rw.output_writer.configure_compression(level=0)
+        with pytest.raises(ValueError):
+            rw.output_writer.configure_compression(backend="brotli")
+    finally:
+        rw.output_writer.compression.update(compression)
+    assert [rw.output_writer.isal_level(level) for level in range(1, 10)] == [0, 0, 1, 1, 2, 2, 3, 3, 3]
+
+
+def test_hash_data_skips_hashed_columns():
+    data = pd.DataFrame(
+        {
+            "email": [HASHED_EMAIL, None],
+            "mixed": [HASHED_EMAIL, "jane@example.com"],
+        }
+    )
+    pii_fields = [
+        {"column_name": "email", "pii_type": "EMAIL", "hashed": True},
+        {"column_name": "mixed", "pii_type": "EMAIL", "hashed": True},
+    ]
+    assert transform.skip_column_flag(data, pii_fields[0])
+    # Columns that contain any unhashed values are still hashed.
+    assert not transform.skip_column_flag(data, pii_fields[1])
+    assert not transform.skip_column_flag(data, {"column_name": "email"})
+
+    data = transform.hash_data(data=data, pii_fields=pii_fields)
+    assert data["email"].tolist() == [HASHED_EMAIL, None]
+    assert data["mixed"].tolist() == [HASHED_EMAIL, HASHED_EMAIL]
 
 
-@patch("awswrangler.s3.to_csv")
-def test_write_to_s3_csv(mock_to_csv):
+def test_transform_data_profile():
+    data = pd.DataFrame(
+        {
+            "email": ["Jane@Example.com", "not an email", HASHED_EMAIL, None],
+            "first_name": ["Jane", "John", None, None],
+        }
+    )
+    pii_fields = [
+        {"column_name": "email", "pii_type": "EMAIL"},
+        {"column_name": "first_name", "pii_type": "FIRST_NAME"},
+    ]
+    profile = rw.profiling.JobProfile()
+    data = transform.transform_data(data=data, pii_fields=pii_fields, country_code="US", profile=profile)
+    data = transform.hash_data(data=data, pii_fields=pii_fields, profile=profile)
+
+    columns = {(column["stage"], column["column_name"]): column for column in profile.report()["columns"]}
+    assert columns[("normalize", "email")]["rows"] == 4
+    assert columns[("normalize", "email")]["skipped"] == 2
+    assert columns[("normalize", "email")]["invalidated"] == 1
+    assert columns[("normalize", "first_name")]["skipped"] == 2
+    assert columns[("normalize", "first_name")]["invalidated"] == 0
+    # The invalidated email is an empty string, which is hashed.
+    assert columns[("hash", "email")]["skipped"] == 2
+    assert columns[("hash", "email")]["pii_type"] == "EMAIL"
+    assert data["email"][0] == HASHED_EMAIL
+
+
+def test_arrow_engine_matches_pandas():
+    data = pd.DataFrame(
+        {
+            "first_name": ["Jane", "JÖRG", None, HASHED_EMAIL, "Jane"],
+            "city": ["New York", "São Paulo", "Paris", None, "New York"],
+            "email": ["Jane@Example.com", "not an email", "josé@example.com", None, ""],
+            "zip": ["98101-1234", "9810", "abcde", None, "98101"],
+            "state": ["Washington", "wa", "ZZZ", None, "New York"],
+            "phone": ["12065550100", "1206", "+44 20 7946 0958", None, "12065550100"],
+            "address": ["123 Main Street", "1 Rue de Rivoli", None, "123 Main Street", "PO Box 1"],
+        }
+    )
+    pii_fields = [
+        {"column_name": "first_name", "pii_type": "FIRST_NAME"},
+        {"column_name": "city", "pii_type": "CITY"},
+        {"column_name": "email", "pii_type": "EMAIL"},
+        {"column_name": "zip", "pii_type": "ZIP"},
+        {"column_name": "state", "pii_type": "STATE"},
+        {"column_name": "phone", "pii_type": "PHONE"},
+        {"column_name": "address", "pii_type": "ADDRESS"},
+    ]
+    pandas_data = transform.transform_data(data=data.copy(), pii_fields=pii_fields, country_code="US")
+    arrow_data = arrow_engine.transform_data(
+        data=data.astype(arrow_engine.STRING_DTYPE), pii_fields=pii_fields, country_code="US"
+    )
+    assert arrow_data.to_csv(index=False) == pandas_data.to_csv(index=False)
+    assert arrow_data.to_json(orient="records", lines=True) == pandas_data.to_json(orient="records", lines=True)
+
+    pandas_data = transform.hash_data(data=pandas_data, pii_fields=pii_fields)
+    arrow_data = arrow_engine.hash_data(data=arrow_data, pii_fields=pii_fields)
+    assert arrow_data.to_csv(index=False) == pandas_data.to_csv(index=False)
+    assert arrow_data["first_name"].dtype == arrow_engine.STRING_DTYPE
+
+
+def test_arrow_engine_string_type():
+    # pandas before 2.2, which Glue 3.0 runs, only holds string storage in
+    # Arrow string columns, not large_string.
+    values = arrow_engine.to_arrow(pd.Series(["a", None, "b"], dtype=arrow_engine.STRING_DTYPE))
+    assert values.type == arrow_engine.STRING_TYPE == pa.string()
+    assert arrow_engine.to_arrow(pd.Series(["a", None], dtype=object)).type == pa.string()
+    skipped = arrow_engine.skip_record_mask(values)
+    assert arrow_engine.map_unique(values, skipped, str.upper).type == pa.string()
+    assert arrow_engine.to_series(values, pd.RangeIndex(3)).tolist() == ["a", pd.NA, "b"]
+
+
+@mock_aws
+def test_arrow_engine_read_csv():
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="test")
+    s3.put_object(
+        Bucket="test",
+        Key="test.csv",
+        Body=(
+            "id,email,timestamp,amount,flag,note,customer_id,total\n"
+            "1,jane@example.com,2024-01-01T00:00:00Z,1.50,true,a,9007199254740993,10.0\n"
+            "2,NA,2024-01-02T00:00:00Z,,false,,,\n"
+            '3,00123,2024-01-03T00:00:00Z,3,TRUE,"b, ""c""",7,12.0\n'
+        ),
+    )
+    args = {
+        **test_args,
+        "source_key": "test.csv",
+        "pii_fields": '[{"column_name": "email", "pii_type": "EMAIL"}]',
+        "file_format": "CSV",
+    }
+    with patch.object(rw, "INPUT_CHUNK_SIZE", 2):
+        pandas_file = rw.DataFile(args)
+        pandas_file.load_input_data()
+        arrow_file = rw.DataFile({**args, "engine": "arrow"})
+        arrow_file.load_input_data()
+
+    assert arrow_file.data["email"].dtype == arrow_engine.STRING_DTYPE
+    assert arrow_file.data["id"].tolist() == [3, 1, 2]
+    # Both engines index rows by their position in the input.
+    assert arrow_file.data.index.tolist() == pandas_file.data.index.tolist() == [2, 0, 1]
+    # Integers with missing values are not rounded by float64.
+    assert arrow_file.data["customer_id"].tolist() == [7, 9007199254740993, pd.NA]
+    # Decimals with missing values stay decimals.
+    assert pandas_file.data["total"].tolist()[:2] == [12.0, 10.0]
+    assert pandas_file.data["total"].dtype == arrow_file.data["total"].dtype == "float64"
+    arrow_file.data["customer_id"] = pandas_file.data["customer_id"]
+    assert arrow_file.data.to_csv(index=False) == pandas_file.data.to_csv(index=False)
+    # Files compressed in formats that pyarrow does not read fall back to pandas.
+    assert arrow_engine.read_csv("test", "test.csv.zip", arrow_file.pii_fields, 2) is None
+
+
+def test_compact_columns():
+    df = pd.DataFrame(
+        {
+            "email": ["a", "a", "a", "a"],
+            "channel": ["web", "app", None, "web"],
+            "note": ["w", "x", "y", "z"],
+            "quantity": [1, 2, 3, 300],
+            "customer_id": pd.array([101, None, 103, 104], dtype="Int64"),
+            "amount": [10.0, None, 12.0, 13.0],
+            "price": [1.0, 2.0, 3.0, 4.0],
+        }
+    )
+    expected_json = df.to_json(orient="records", lines=True)
+    expected_csv = df.to_csv(index=False)
+    compacted = compaction.compact_columns(df.copy(), skip_columns=["email"])
+
+    assert compacted["email"].dtype == object
+    assert compacted["channel"].dtype == "category"
+    # Strings with many distinct values are not categorical.
+    assert compacted["note"].dtype == object
+    assert compacted["quantity"].dtype == "int16"
+    assert compacted["customer_id"].dtype == "Int8"
+    # Floats may be decimals in the source, even if their values are integers.
+    assert compacted["amount"].dtype == "float64"
+    assert compacted["price"].dtype == "float64"
+    assert compacted.to_json(orient="records", lines=True) == expected_json
+    assert compacted.to_csv(index=False) == expected_csv
+
+
+def test_data_file_compact_columns():
+    test_file = rw.DataFile(test_args)
+    test_file.data = pd.DataFrame(
+        {
+            "address": ["1 Main St", "1 Main St", "1 Main St", "1 Main St"],
+            "phone": ["12065550100", "12065550100", None, "12065550100"],
+            "timestamp": ["2024-01-01", "2024-01-01", "2024-01-01", "2024-01-01"],
+            "channel": ["web", "web", "app", "web"],
+        }
+    )
+    test_file.remove_deleted_fields()
+    test_file.compact_columns()
+    # PII and timestamp columns are not compacted.
+    assert test_file.data.dtypes.astype(str).to_dict() == {"phone": "object", "timestamp": "object", "channel": "category"}
+
+
+def test_infer_schema():
+    columns = ["email", "phone", "zip", "state", "first_name", "hashed_email", "quantity", "price", "purchased_on", "sku"]
+    rows = [
+        {
+            "email": "jane@example.com",
+            "phone": "+1 206 555 0100",
+            "zip": "98101",
+            "state": "Washington",
+            "first_name": "Jane",
+            "hashed_email": HASHED_EMAIL,
+            "quantity": 2,
+            "price": "1.5",
+            "purchased_on": "2021-06-23T19:53:58Z",
+            "sku": "00123",
+        },
+        {
+            "email": "john@example.com",
+            "phone": "12065550101",
+            "zip": "98101-1234",
+            "state": "WA",
+            "first_name": "John",
+            "hashed_email": None,
+            "quantity": 3,
+            "price": "2",
+            "purchased_on": "2021-06-24T19:53:58Z",
+            "sku": "00124",
+        },
+    ]
+    schema = {
+        column["column_name"]: column
+        for column in schema_inference.infer_schema(columns, rows, "US")
+    }
+    assert schema["email"]["pii_type"] == "EMAIL"
+    assert schema["phone"]["pii_type"] == "PHONE"
+    assert schema["zip"]["pii_type"] == "ZIP"
+    assert schema["state"]["pii_type"] == "STATE"
+    assert schema["first_name"]["pii_type"] == "FIRST_NAME"
+    assert schema["first_name"]["match_ratio"] is None
+    assert schema["hashed_email"]["hashed"]
+    assert schema["hashed_email"]["pii_type"] == "EMAIL"
+    assert schema["hashed_email"]["null_count"] == 1
+    assert not schema["email"]["hashed"]
+    assert schema["quantity"]["data_type"] == "LONG"
+    assert schema["quantity"]["pii_type"] is None
+    assert schema["price"]["data_type"] == "DECIMAL"
+    assert schema["purchased_on"]["data_type"] == "TIMESTAMP"
+    # Leading zeros would be lost if the value were read as a number.
+    assert schema["sku"]["data_type"] == "STRING"
+
+
+@patch.object(rw.output_writer, "write_csv")
+def test_write_to_s3_csv(mock_write_csv):
     rw.write_to_s3(df="test", filepath="test", file_format="CSV")
-    mock_to_csv.assert_called()
+    mock_write_csv.assert_called_once_with(df="test", path="test")
 
 
 def test_remove_deleted_fields():
@@ -428,32 +756,47 @@ def test_timestamp_transform():
         test_file.timestamp_transform()
 
 
+@mock_aws
 @patch("glue.library.read_write.write_to_s3")
 def test_save_output(mock_write_to_s3):
     test_file = rw.DataFile(test_args)
-    test_file.data = "test"
     test_file.file_format = "JSON"
-
-    df = "test"
-    filepath = (
-        "s3://"
-        + "test"
-        + "/"
-        + "amc"
-        + "/"
-        + "test"
-        + "/"
-        + "ADDITIVE"
-        + "/US/dimension/"
-        + "amc12345678|us-east-1_Z85CJEZK1"
-        + "/"
-        + "test"
-        + ".gz"
+    test_file.amc_instances = [
+        "amc12345678",
+        "amc12345679",
+    ]
+    test_file.data = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(["2020-04-12T20:00:00Z", "2020-04-10T20:00:00Z", "2020-04-11T20:00:00Z"], utc=True),
+            "address": ["test1", "test2", "test3"],
+        }
     )
+
+    # Without a timeseries partition size, files are only split by size.
+    expected_filepaths = [
+        f"s3://test/amc/test/ADDITIVE/JSON/US/{amc_instance}|us-east-1_Z85CJEZK1/test-0.gz"
+        for amc_instance in ["amc12345678", "amc12345679"]
+    ]
+
+    s3 = boto3.resource("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket=test_args["output_bucket"])
+    # write_to_s3 is mocked, so create the files that are tagged.
+    for filepath in expected_filepaths:
+        s3.Object(test_args["output_bucket"], filepath.replace("s3://test/", "")).put(Body="{}", ContentType="application/json")
     test_file.save_output()
-    mock_write_to_s3.assert_called_once_with(
-        df=df, filepath=filepath, file_format=test_file.file_format
-    )
+    manifest = s3.Object(
+        test_args["output_bucket"],
+        "amc/test/ADDITIVE/JSON/US/amc12345678|us-east-1_Z85CJEZK1/test.txt",
+    ).get()["Body"].read().decode()
+
+    filepaths = [call.kwargs["filepath"] for call in mock_write_to_s3.call_args_list]
+    assert sorted(filepaths) == expected_filepaths
+    assert manifest == expected_filepaths[0]
+    # Rows keep their order, and timestamps are formatted.
+    df = mock_write_to_s3.call_args_list[0].kwargs["df"]
+    assert df["address"].tolist() == ["test1", "test2", "test3"]
+    assert df["timestamp"].tolist() == ["2020-04-12T20:00:00Z", "2020-04-10T20:00:00Z", "2020-04-11T20:00:00Z"]
+
 
 def test_estimate_number_of_partitions():
     test_file = rw.DataFile(test_args)
@@ -486,6 +829,43 @@ def test_estimate_compression_ratio(mock_memory_usage_sum, mock_getsize):
     assert not Path('tmp_sample_data.gz').exists()
 
 
+def test_timestamp_transform_drops_invalid_rows():
+    test_file = rw.DataFile(test_args)
+    test_file.data = pd.DataFrame(
+        {
+            "timestamp": ["2020-04-01T20:50:00Z", "not a time", None, "2020-04-01 22:50:00+02:00", "2020-04-01"],
+            "id": [0, 1, 2, 3, 4],
+        },
+        index=[4, 3, 2, 1, 0],
+    )
+
+    test_file.timestamp_transform()
+    # Null timestamps are kept, and invalid ones are dropped and counted.
+    assert test_file.data["id"].tolist() == [0, 2, 3, 4]
+    assert test_file.profile.columns[("timestamp", "timestamp")]["invalidated"] == 1
+    test_file.convert_timestamp_format(test_file.data)
+    assert test_file.data["timestamp"].tolist() == [
+        "2020-04-01T20:50:00Z", ANY, "2020-04-01T20:50:00Z", "2020-04-01T00:00:00Z"
+    ]
+    assert pd.isna(test_file.data["timestamp"].iloc[1])
+
+
+def test_parse_timestamps():
+    values = pd.Series(
+        ["2024-01-01T00:00:00Z", "2024-01-01T00:00:00Z", "2024-01-01T01:00:00.5-01:00", "20240102T000000Z", "1/3/2024", "x", None]
+    )
+    parsed, invalid_positions = timestamps.parse_timestamps(values)
+    assert parsed.dt.tz is not None
+    assert timestamps.format_timestamps(parsed).tolist()[:5] == [
+        "2024-01-01T00:00:00Z", "2024-01-01T00:00:00Z", "2024-01-01T02:00:00Z", "2024-01-02T00:00:00Z", "2024-01-03T00:00:00Z"
+    ]
+    assert invalid_positions.tolist() == [5]
+    assert timestamps.detect_format(values) == "%Y-%m-%dT%H:%M:%S%z"
+    # Formatting matches dt.strftime, including for times before 1970.
+    times = pd.to_datetime(pd.Series(["1969-12-31T23:59:59.5Z", "2024-02-29T12:34:56.999Z", None]), utc=True)
+    assert timestamps.format_timestamps(times).equals(times.dt.strftime(rw.DATETIME_FORMAT))
+
+
 def test_convert_timestamp_format():
     df = pd.DataFrame({'timestamp': range(10), 'B': range(10, 20)})
     test_file = rw.DataFile(test_args)
@@ -497,7 +877,7 @@ def test_convert_timestamp_format():
 
 @mock_aws
 @patch("glue.library.read_write.write_to_s3")
-def test_save_output(mock_write_to_s3):
+def test_save_output_by_day(mock_write_to_s3):
 
     test_file = rw.DataFile(test_args)
     test_file.file_format = "JSON"
@@ -554,53 +934,112 @@ def test_save_output(mock_write_to_s3):
         columns=["timestamp", "address", "timestamp_full_precision"],
     )
 
-    expected_arguments = [
-        {
-            "df": ANY,
-            "filepath": "s3://test/amc/test/ADDITIVE/JSON/US/amc12345679|us-east-1_Z85CJEZK1/test-2020_04_12-00:00:00.gz",
-            "file_format": "JSON",
-        },
-        {
-            "df": ANY,
-            "filepath": "s3://test/amc/test/ADDITIVE/JSON/US/amc12345679|us-east-1_Z85CJEZK1/test-2020_04_11-00:00:00.gz",
-            "file_format": "JSON",
-        },
-        {
-            "df": ANY,
-            "filepath": "s3://test/amc/test/ADDITIVE/JSON/US/amc12345679|us-east-1_Z85CJEZK1/test-2020_04_10-00:00:00.gz",
-            "file_format": "JSON",
-        },
-        {
-            "df": ANY,
-            "filepath": "s3://test/amc/test/ADDITIVE/JSON/US/INVALID_amc12345679|us-east-1_Z85CJEZK1/test-2020_04_10-00:00:00.gz",
-            "file_format": "JSON",
-        },
+    # Rows are out of order, so that sorting is tested.
+    test_file.data = test_file.data.iloc[[4, 2, 0, 3, 1]]
+
+    # One file per day and AMC instance, named after the day.
+    expected_filepaths = [
+        f"s3://test/amc/test/ADDITIVE/JSON/US/{amc_instance}|us-east-1_Z85CJEZK1/test-{day}_0.gz"
+        for day in ["20200410", "20200411", "20200412"]
+        for amc_instance in ["amc12345678", "amc12345679"]
     ]
 
     with mock_aws():
         s3 = boto3.client("s3", region_name="us-east-1")
         s3.create_bucket(Bucket=test_args["output_bucket"])
         s3 = boto3.resource("s3", region_name="us-east-1")
-        s3_object = s3.Object(
-            test_args["output_bucket"],
-            'amc/test/ADDITIVE/JSON/US/amc12345678|us-east-1_Z85CJEZK1/test-0.gz'
-        )
-        s3_object.put(Body="{}", ContentType="application/json")
-        s3_object = s3.Object(
+        # write_to_s3 is mocked, so create the files that are tagged.
+        for filepath in expected_filepaths:
+            s3_object = s3.Object(test_args["output_bucket"], filepath.replace("s3://test/", ""))
+            s3_object.put(Body="{}", ContentType="application/json")
+        test_file.save_output()
+        manifest = s3.Object(
             test_args["output_bucket"],
-            'amc/test/ADDITIVE/JSON/US/amc12345679|us-east-1_Z85CJEZK1/test-0.gz'
+            "amc/test/ADDITIVE/JSON/US/amc12345679|us-east-1_Z85CJEZK1/test.txt",
+        ).get()["Body"].read().decode()
+
+    assert mock_write_to_s3.call_count == 6
+    filepaths = [call.kwargs["filepath"] for call in mock_write_to_s3.call_args_list]
+    assert sorted(filepaths) == sorted(expected_filepaths)
+    # The manifest lists files in time order.
+    assert manifest.split("\n") == [filepath for filepath in expected_filepaths if "amc12345679" in filepath]
+    # Each file holds the rows of its day, sorted and formatted.
+    for call in mock_write_to_s3.call_args_list:
+        df = call.kwargs["df"]
+        day = call.kwargs["filepath"].rsplit("-", 1)[1][:8]
+        assert df["timestamp"].str.replace("-", "").str.startswith(day).all()
+        assert df["timestamp"].is_monotonic_increasing
+    assert mock_write_to_s3.call_args_list[0].kwargs["df"]["address"].tolist() == ["test1", "test2"]
+
+
+def test_partition_dataset():
+    test_file = rw.DataFile({**test_args, "timeseries_partition_size": "PT1H"})
+    test_file.estimate_number_of_partitions = Mock(return_value=3)
+    test_file.data = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(
+                ["2024-01-01T01:30:00Z", None, "2024-01-01T00:10:00Z", "2024-01-01T01:00:00Z", "2024-01-01T01:59:59Z", "2024-01-01T00:00:00Z"],
+                utc=True,
+            ),
+            "id": [0, 1, 2, 3, 4, 5],
+        }
+    )
+    partitions = test_file.partition_dataset(test_file.data)
+    # Hours with more rows than a size partition are split, and rows without
+    # a timestamp are last.
+    assert [(identifier, df["id"].tolist()) for identifier, df in partitions] == [
+        ("20240101T00_0", [5, 2]),
+        ("20240101T01_0", [3, 0]),
+        ("20240101T01_1", [4]),
+        ("undated_0", [1]),
+    ]
+    # Without a partition size, datasets are only split by size.
+    test_file.timeseries_partition_size = None
+    partitions = test_file.partition_dataset(test_file.data)
+    assert [(identifier, df["id"].tolist()) for identifier, df in partitions] == [("0", [0, 1]), ("1", [2, 3]), ("2", [4, 5])]
+
+
+@mock_aws
+def test_log_performance_profile(capsys):
+    args = {**test_args, "enable_job_metrics": "true", "profile_normalize": "true"}
+    test_file = rw.DataFile(args)
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket=args["output_bucket"])
+    test_file.data = pd.DataFrame({"city": ["Seattle", None]})
+    with test_file.profile.stage("normalize") as stage:
+        test_file.data = transform.transform_data(
+            data=test_file.data,
+            pii_fields=[{"column_name": "city", "pii_type": "CITY"}],
+            country_code="US",
+            profile=test_file.profile,
         )
-        s3_object.put(Body="{}", ContentType="application/json")
-        test_file.save_output()
+        stage["rows"] += len(test_file.data)
 
-    assert mock_write_to_s3.call_count == 2
+    with patch("boto3.client", wraps=boto3.client) as mock_client:
+        test_file.log_performance_profile()
+    profile_line = next(
+        line for line in capsys.readouterr().out.splitlines() if line.startswith('{"performance_profile"')
+    )
+    profile = json.loads(profile_line)["performance_profile"]
+    assert profile["job_run_id"] == "test"
+    assert profile["stages"][0]["stage"] == "normalize"
+    assert profile["stages"][0]["rows"] == 2
+    assert profile["columns"][0]["skipped"] == 1
+    mock_client.assert_any_call("cloudwatch")
 
-    try:
-        check = expected_arguments[0]
-        mock_write_to_s3.assert_any_call(**check)
-        check = expected_arguments[1]
-        mock_write_to_s3.assert_any_call(**check)
-        check = expected_arguments[2]
-        mock_write_to_s3.assert_any_call(**check)
-    except ValueError as e:
-        print(e)
+    profile_key = "profiles/test/test/normalize.prof"
+    body = s3.get_object(Bucket=args["output_bucket"], Key=profile_key)["Body"].read()
+    assert marshal.loads(body)
+
+
+@patch("boto3.client")
+def test_save_performance_metrics(mock_client):
+    test_file = rw.DataFile(test_args)
+    test_file.num_bytes = 100
+    test_file.num_rows = 2
+    test_file.save_performance_metrics()
+    # The job times itself, so it does not look up its own job run.
+    mock_client.assert_called_once_with("lambda")
+    payload = json.loads(mock_client.return_value.invoke.call_args.kwargs["Payload"])
+    assert payload["Metrics"]["numRows"] == 2
+    assert payload["Metrics"]["glueJobDuration"] >= 0
@@ -92,21 +92,27 @@ def test_lambda_handler(
     mock_start_upload.assert_called_with(
         bucket=test_configs["s3_bucket"],
         key=fake_event["Records"][0]["s3"]["object"]["key"],
+        sequencer=None,
     )
 
     fake_event["Records"][0]["s3"].update(
-        {"object": {"key": test_configs["s3_fact_key"]}}
+        {"object": {"key": test_configs["s3_fact_key"], "sequencer": "0055AED6DCD90281E5"}}
     )
 
     lambda_handler(fake_event, fake_context)
     mock_start_upload.assert_called_with(
         bucket=test_configs["s3_bucket"],
         key=fake_event["Records"][0]["s3"]["object"]["key"],
+        sequencer="0055AED6DCD90281E5",
     )
 
 
 @contextlib.contextmanager
 def stub_system_table(test_configs):
+    from amc_uploader.amc_uploader import instance_registry
+
+    # Drop instances cached by earlier tests.
+    instance_registry.clear()
     with mock_aws():
         dynamodb = boto3.resource(
             "dynamodb", region_name=os.environ["AWS_REGION"]
@@ -319,4 +325,208 @@ def test_start_upload_unauthorized_amc_request(test_configs):
         data = _start_upload(
             bucket=test_configs["s3_bucket"], key=s3_fact_key
         )
-        assert str(data["Message"]) == "Unauthorized AMC request."
\ No newline at end of file
+        assert str(data["Message"]) == "Unauthorized AMC request."
+
+
+def test_amc_instance_registry(test_configs):
+    from amc_uploader.amc_uploader import AmcInstanceRegistry
+
+    instance = {
+        "instance_id": test_configs["instance_id"],
+        "advertiser_id": test_configs["advertiser_id"],
+        "marketplace_id": test_configs["marketplace_id"],
+    }
+    mock_table = MagicMock()
+    mock_table.get_item.return_value = {
+        "Item": {"Name": "AmcInstances", "Value": [instance], "Version": "v1"}
+    }
+
+    with patch(
+        "amc_uploader.amc_uploader.get_dynamo_table",
+        return_value=(mock_table, MagicMock()),
+    ), patch("amc_uploader.amc_uploader.time.monotonic") as mock_monotonic:
+        mock_monotonic.return_value = 1000
+        registry = AmcInstanceRegistry(ttl_seconds=60)
+
+        # The instance list is loaded once and then served from memory.
+        assert registry.get(test_configs["instance_id"]) == instance
+        assert registry.get(test_configs["instance_id"]) == instance
+        assert mock_table.get_item.call_count == 1
+
+        # An unknown instance forces a single reload.
+        assert registry.get("unknown_instance") is None
+        assert mock_table.get_item.call_count == 2
+
+        # The miss is cached for the TTL.
+        assert registry.get("unknown_instance") is None
+        assert mock_table.get_item.call_count == 2
+
+        # After the TTL only the version is checked while it is unchanged.
+        mock_monotonic.return_value = 1100
+        mock_table.get_item.return_value = {"Item": {"Version": "v1"}}
+        assert registry.get(test_configs["instance_id"]) == instance
+        assert mock_table.get_item.call_count == 3
+        assert "ProjectionExpression" in mock_table.get_item.call_args.kwargs
+
+        # A new version reloads the instance list.
+        mock_monotonic.return_value = 1200
+        new_instance = {**instance, "advertiser_id": "advertiser456"}
+        mock_table.get_item.return_value = {
+            "Item": {"Name": "AmcInstances", "Value": [new_instance], "Version": "v2"}
+        }
+        assert registry.get(test_configs["instance_id"]) == new_instance
+        assert registry.version == "v2"
+
+
+@patch("amc_uploader.amc_uploader.instance_registry")
+def test_get_amc_instance(mock_registry, test_configs):
+    from amc_uploader.amc_uploader import get_amc_instance
+
+    mock_registry.get.return_value = None
+    with pytest.raises(ValueError, match="not found"):
+        get_amc_instance(test_configs["instance_id"])
+
+    mock_registry.get.return_value = {"instance_id": test_configs["instance_id"]}
+    with pytest.raises(ValueError, match="marketplace_id and advertiser_id required"):
+        get_amc_instance(test_configs["instance_id"])
+
+
+@contextlib.contextmanager
+def stub_upload_ledger_table():
+    with mock_aws():
+        dynamodb = boto3.resource(
+            "dynamodb", region_name=os.environ["AWS_REGION"]
+        )
+        table = dynamodb.create_table(
+            TableName=os.environ["UPLOAD_LEDGER_TABLE_NAME"],
+            KeySchema=[{"AttributeName": "manifest_id", "KeyType": "HASH"}],
+            AttributeDefinitions=[
+                {"AttributeName": "manifest_id", "AttributeType": "S"}
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield table
+
+
+def test_upload_ledger(test_configs):
+    from amc_uploader.amc_uploader import (
+        claim_manifest,
+        complete_manifest,
+        format_manifest_id,
+        release_manifest,
+    )
+
+    assert format_manifest_id(test_configs["s3_bucket"], "manifest.txt", None) is None
+    manifest_id = format_manifest_id(test_configs["s3_bucket"], "manifest.txt", "seq123")
+    assert manifest_id == f"{test_configs['s3_bucket']}/manifest.txt/seq123"
+
+    with stub_upload_ledger_table() as table:
+        assert claim_manifest(manifest_id) is True
+        # A manifest that is being submitted cannot be claimed again.
+        assert claim_manifest(manifest_id) is False
+
+        # A failed submission releases the manifest so that it can be retried.
+        release_manifest(manifest_id)
+        assert claim_manifest(manifest_id) is True
+
+        complete_manifest(manifest_id)
+        item = table.get_item(Key={"manifest_id": manifest_id})["Item"]
+        assert item["ledger_status"] == "SUBMITTED"
+        assert "lease_expires_at" not in item
+        assert item["expires_at"] > 0
+        assert claim_manifest(manifest_id) is False
+
+        # Submissions that never finished can be claimed once their lease expires.
+        stale_manifest_id = format_manifest_id(test_configs["s3_bucket"], "manifest.txt", "seq456")
+        table.put_item(
+            Item={
+                "manifest_id": stale_manifest_id,
+                "ledger_status": "IN_PROGRESS",
+                "lease_expires_at": 1,
+                "expires_at": 4102444800,
+            }
+        )
+        assert claim_manifest(stale_manifest_id) is True
+
+
+@responses.activate
+@patch("amc_uploader.amc_uploader.verify_amc_request")
+def test_start_upload_duplicate_manifest(mock_verify_amc_request, test_configs):
+    from amc_uploader.amc_uploader import _start_upload, format_manifest_id
+
+    key = test_configs["s3_dimension_key"]
+    with stub_upload_ledger_table() as table:
+        table.put_item(
+            Item={
+                "manifest_id": format_manifest_id(test_configs["s3_bucket"], key, "seq123"),
+                "ledger_status": "SUBMITTED",
+                "expires_at": 4102444800,
+            }
+        )
+        result = _start_upload(bucket=test_configs["s3_bucket"], key=key, sequencer="seq123")
+        assert result["Status"] == "Warning"
+        assert "already submitted" in result["Message"]
+        mock_verify_amc_request.assert_not_called()
+        assert len(responses.calls) == 0
+
+        # A failed submission is removed from the ledger.
+        mock_verify_amc_request.side_effect = RuntimeError("Unauthorized AMC request.")
+        result = _start_upload(bucket=test_configs["s3_bucket"], key=key, sequencer="seq456")
+        assert str(result["Message"]) == "Unauthorized AMC request."
+        assert "Item" not in table.get_item(
+            Key={"manifest_id": format_manifest_id(test_configs["s3_bucket"], key, "seq456")}
+        )
+
+        # A submitted manifest stays submitted when a later step fails.
+        mock_verify_amc_request.side_effect = None
+        with patch("amc_uploader.amc_uploader.get_amc_instance"), patch(
+            "amc_uploader.amc_uploader.tasks.AMCRequests"
+        ) as mock_amc_requests, patch(
+            "amc_uploader.amc_uploader.update_upload_failures_table",
+            side_effect=RuntimeError("Table not found"),
+        ):
+            mock_amc_requests.return_value.process_request.return_value = MagicMock(
+                status_code=200, text="{}"
+            )
+            result = _start_upload(bucket=test_configs["s3_bucket"], key=key, sequencer="seq789")
+        assert str(result["Message"]) == "Table not found"
+        item = table.get_item(
+            Key={"manifest_id": format_manifest_id(test_configs["s3_bucket"], key, "seq789")}
+        )["Item"]
+        assert item["ledger_status"] == "SUBMITTED"
+
+
+def test_update_upload_failures_table(test_configs):
+    from amc_uploader.amc_uploader import update_upload_failures_table
+
+    item_key = {
+        "dataset_id": test_configs["data_set_id"],
+        "instance_id": test_configs["instance_id"],
+    }
+    with mock_aws():
+        dynamodb = boto3.resource("dynamodb", region_name=os.environ["AWS_REGION"])
+        table = dynamodb.create_table(
+            TableName=os.environ["UPLOAD_FAILURES_TABLE_NAME"],
+            KeySchema=[
+                {"AttributeName": "instance_id", "KeyType": "HASH"},
+                {"AttributeName": "dataset_id", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "instance_id", "AttributeType": "S"},
+                {"AttributeName": "dataset_id", "AttributeType": "S"},
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        update_upload_failures_table(
+            MagicMock(status_code=400, text="first error"), **item_key
+        )
+        update_upload_failures_table(
+            MagicMock(status_code=400, text="second error"), **item_key
+        )
+        assert table.get_item(Key=item_key)["Item"]["Value"] == "second error"
+
+        update_upload_failures_table(MagicMock(status_code=200, text="{}"), **item_key)
+        assert "Item" not in table.get_item(Key=item_key)
+        # Successful uploads with no recorded failure leave the table as it is.
+        update_upload_failures_table(MagicMock(status_code=200, text="{}"), **item_key)
+        assert table.scan()["Items"] == []
@@ -0,0 +1,257 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+# ###############################################################################
+# PURPOSE:
+#   * Regression test for upload_tracker.
+# USAGE:
+#   ./run_test.sh --run_unit_test --test-file-name amc_uploader/test_upload_tracker.py
+###############################################################################
+
+import contextlib
+import os
+import time
+from datetime import datetime, timezone
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+import responses
+from moto import mock_aws
+
+
+@pytest.fixture
+def test_configs():
+    return {
+        "s3_bucket": "fake_s3_bucket",
+        "instance_id": "instance123",
+        "advertiser_id": "advertiser123",
+        "marketplace_id": "marketplace123",
+        "data_set_id": "dataset123",
+        "user_id": "us-east-1_Z85CJEZK1",
+    }
+
+
+@contextlib.contextmanager
+def stub_uploads_table():
+    with mock_aws():
+        dynamodb = boto3.resource(
+            "dynamodb", region_name=os.environ["AWS_REGION"]
+        )
+        table = dynamodb.create_table(
+            TableName=os.environ["UPLOADS_TABLE_NAME"],
+            KeySchema=[
+                {"AttributeName": "dataset_id", "KeyType": "HASH"},
+                {"AttributeName": "upload_id", "KeyType": "RANGE"},
+            ],
+            AttributeDefinitions=[
+                {"AttributeName": "dataset_id", "AttributeType": "S"},
+                {"AttributeName": "upload_id", "AttributeType": "S"},
+                {"AttributeName": "tracking_status", "AttributeType": "S"},
+                {"AttributeName": "next_poll_at", "AttributeType": "N"},
+            ],
+            GlobalSecondaryIndexes=[
+                {
+                    "IndexName": "tracking_status-next_poll_at-index",
+                    "KeySchema": [
+                        {"AttributeName": "tracking_status", "KeyType": "HASH"},
+                        {"AttributeName": "next_poll_at", "KeyType": "RANGE"},
+                    ],
+                    "Projection": {"ProjectionType": "ALL"},
+                }
+            ],
+            BillingMode="PAY_PER_REQUEST",
+        )
+        yield table
+
+
+def test_record_upload(test_configs):
+    from amc_uploader.amc_uploader import record_upload
+
+    upload_kwargs = {
+        "bucket": test_configs["s3_bucket"],
+        "key": "amc/dataset123/ADDITIVE/JSON/US/instance123|user/manifest.txt",
+        "dataset_id": test_configs["data_set_id"],
+        "instance_id": test_configs["instance_id"],
+        "user_id": test_configs["user_id"],
+        "advertiser_id": test_configs["advertiser_id"],
+        "marketplace_id": test_configs["marketplace_id"],
+    }
+    with stub_uploads_table() as table:
+        record_upload(MagicMock(text='{"uploadId": "upload123"}'), **upload_kwargs)
+        item = table.get_item(
+            Key={"dataset_id": test_configs["data_set_id"], "upload_id": "upload123"}
+        )["Item"]
+        assert item["tracking_status"] == "PENDING"
+        assert item["manifest_key"] == upload_kwargs["key"]
+        assert item["poll_count"] == 0
+
+        # Responses without an uploadId are not tracked.
+        record_upload(MagicMock(text="{}"), **upload_kwargs)
+        assert table.scan()["Count"] == 1
+
+
+def test_next_poll_interval():
+    from amc_uploader.upload_tracker import (
+        MAX_POLL_INTERVAL,
+        MIN_POLL_INTERVAL,
+        next_poll_interval,
+    )
+
+    assert next_poll_interval(0) == MIN_POLL_INTERVAL
+    assert next_poll_interval(1) == MIN_POLL_INTERVAL * 2
+    assert next_poll_interval(100) == MAX_POLL_INTERVAL
+
+
+def test_is_terminal_status():
+    from amc_uploader.upload_tracker import is_terminal_status
+
+    assert is_terminal_status("Succeeded")
+    assert is_terminal_status("FAILED")
+    assert is_terminal_status("PARTIAL_SUCCESS")
+    assert not is_terminal_status("Pending")
+    assert not is_terminal_status("")
+
+
+@responses.activate
+@patch("amc_uploader.upload_tracker.tasks.get_ads_token")
+def test_lambda_handler(mock_get_ads_token, test_configs):
+    from amc_uploader.upload_tracker import lambda_handler
+
+    mock_get_ads_token.return_value = {
+        "client_id": "client_id",
+        "access_token": "access_token",
+    }
+    submitted_at = int(time.time()) - 1000
+    updated_time = datetime.fromtimestamp(submitted_at + 100, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")
+    upload_statuses = {
+        "upload_succeeded": "Succeeded",
+        "upload_failed": "Failed",
+        "upload_pending": "Pending",
+    }
+    for upload_id, status in upload_statuses.items():
+        responses.get(
+            url=f"https://advertising-api.amazon.com/amc/advertiserData/{test_configs['instance_id']}/uploads/{test_configs['data_set_id']}/{upload_id}",
+            json={"uploadId": upload_id, "status": status, "updatedTime": updated_time},
+            status=200,
+        )
+    responses.get(
+        url=f"https://advertising-api.amazon.com/amc/advertiserData/{test_configs['instance_id']}/uploads/{test_configs['data_set_id']}/upload_error",
+        json={"message": "Service unavailable"},
+        status=503,
+    )
+    responses.get(
+        url=f"https://advertising-api.amazon.com/amc/advertiserData/{test_configs['instance_id']}/uploads/{test_configs['data_set_id']}/upload_not_found",
+        json={"message": "Not found"},
+        status=404,
+    )
+
+    with stub_uploads_table() as table:
+        for upload_id in list(upload_statuses) + ["upload_error", "upload_not_found", "upload_not_due"]:
+            table.put_item(
+                Item={
+                    "dataset_id": test_configs["data_set_id"],
+                    "upload_id": upload_id,
+                    "instance_id": test_configs["instance_id"],
+                    "user_id": test_configs["user_id"],
+                    "advertiser_id": test_configs["advertiser_id"],
+                    "marketplace_id": test_configs["marketplace_id"],
+                    "bucket": test_configs["s3_bucket"],
+                    "manifest_key": f"{upload_id}.txt",
+                    "tracking_status": "PENDING",
+                    "submitted_at": submitted_at,
+                    "next_poll_at": 4102444800 if upload_id == "upload_not_due" else 1,
+                    "poll_count": 0,
+                }
+            )
+
+        summary = lambda_handler({}, MagicMock())
+        assert summary == {"polled": 5, "completed": 2, "pending": 1, "errors": 1, "abandoned": 1}
+        # The token is requested once for all uploads of a user.
+        mock_get_ads_token.assert_called_once()
+
+        def get_upload(upload_id):
+            return table.get_item(
+                Key={"dataset_id": test_configs["data_set_id"], "upload_id": upload_id}
+            )["Item"]
+
+        succeeded = get_upload("upload_succeeded")
+        assert succeeded["tracking_status"] == "COMPLETE"
+        assert succeeded["upload_status"] == "Succeeded"
+        # The duration ends when AMC last updated the upload, not when it was
+        # polled.
+        assert succeeded["duration_seconds"] == 100
+        assert get_upload("upload_failed")["upload_status"] == "Failed"
+
+        pending = get_upload("upload_pending")
+        assert pending["tracking_status"] == "PENDING"
+        assert pending["poll_count"] == 1
+        assert pending["next_poll_at"] > pending["submitted_at"]
+        assert "Service unavailable" in get_upload("upload_error")["last_error"]
+        assert get_upload("upload_error")["tracking_status"] == "PENDING"
+        assert get_upload("upload_not_found")["tracking_status"] == "ABANDONED"
+        assert get_upload("upload_not_due")["poll_count"] == 0
+
+        # Unauthorized users are rescheduled without calling AMC.
+        mock_get_ads_token.return_value = {"authorize_url": "https://example.com"}
+        table.update_item(
+            Key={"dataset_id": test_configs["data_set_id"], "upload_id": "upload_pending"},
+            UpdateExpression="SET next_poll_at = :zero",
+            ExpressionAttributeValues={":zero": 0},
+        )
+        summary = lambda_handler({}, MagicMock())
+        assert summary == {"polled": 0, "completed": 0, "pending": 0, "errors": 1, "abandoned": 0}
+        assert get_upload("upload_pending")["last_error"] == "Unauthorized AMC request."
+
+
+@patch("amc_uploader.upload_tracker.tasks.fan_out_amc_requests")
+@patch("amc_uploader.upload_tracker.tasks.get_ads_token")
+def test_poll_uploads(mock_get_ads_token, mock_fan_out_amc_requests, test_configs):
+    from amc_uploader.upload_tracker import UPLOAD_TRACKER_MAX_AGE, poll_uploads
+
+    def get_ads_token(user_id, redirect_uri):
+        if user_id == "broken_user":
+            raise ValueError("Secret not found")
+        return {"client_id": "client_id", "access_token": "access_token"}
+
+    mock_get_ads_token.side_effect = get_ads_token
+    mock_fan_out_amc_requests.side_effect = lambda amc_requests, max_concurrency: [
+        MagicMock(status_code=200, json=lambda: {"status": "Pending"}) for _ in amc_requests
+    ]
+    now = UPLOAD_TRACKER_MAX_AGE + 1000
+    uploads = {
+        "upload_broken_user": {"user_id": "broken_user", "submitted_at": now},
+        "upload_recent": {"user_id": test_configs["user_id"], "submitted_at": now - 100},
+        "upload_expired": {"user_id": test_configs["user_id"], "submitted_at": 1},
+    }
+    with stub_uploads_table() as table:
+        for upload_id, upload in uploads.items():
+            upload.update(
+                {
+                    "dataset_id": test_configs["data_set_id"],
+                    "upload_id": upload_id,
+                    "instance_id": test_configs["instance_id"],
+                    "advertiser_id": test_configs["advertiser_id"],
+                    "marketplace_id": test_configs["marketplace_id"],
+                    "tracking_status": "PENDING",
+                    "next_poll_at": 0,
+                    "poll_count": 0,
+                }
+            )
+            table.put_item(Item=upload)
+
+        # A failure for one user does not stop the uploads of other users
+        # from being polled, and uploads pending for too long are abandoned.
+        summary = poll_uploads(list(uploads.values()), now)
+        assert summary == {"polled": 2, "completed": 0, "pending": 1, "errors": 1, "abandoned": 1}
+
+        def get_upload(upload_id):
+            return table.get_item(
+                Key={"dataset_id": test_configs["data_set_id"], "upload_id": upload_id}
+            )["Item"]
+
+        assert get_upload("upload_broken_user")["poll_count"] == 0
+        assert get_upload("upload_recent")["tracking_status"] == "PENDING"
+        expired = get_upload("upload_expired")
+        assert expired["tracking_status"] == "ABANDONED"
+        assert expired["upload_status"] == "Pending"
+        assert expired["poll_count"] == 1
@@ -10,10 +10,12 @@
 ###############################################################################
 
 import contextlib
+import gzip
 import json
 import os
 import urllib.parse
 import uuid
+from datetime import datetime, timezone
 from unittest.mock import patch, MagicMock
 
 import app
@@ -25,6 +27,12 @@ from moto import mock_aws
 from responses import matchers
 
 
+@pytest.fixture(autouse=True)
+def clear_response_cache():
+    app.response_cache.clear()
+    app.etl_job_runs_cache.clear()
+
+
 @pytest.fixture
 def test_configs():
     return {
@@ -240,8 +248,41 @@ def test_list_bucket(test_configs):
             body=json.dumps({"s3bucket": test_configs["s3bucket"]}),
         )
         assert response.status_code == 200
-        assert response.json_body[0]["key"] == test_configs["source_key"]
-        assert response.json_body[0]["size"] == 2
+        assert response.json_body["objects"][0]["key"] == test_configs["source_key"]
+        assert response.json_body["objects"][0]["size"] == 2
+        assert response.json_body["next_continuation_token"] is None
+
+    for key in ["landing/a.csv", "landing/b.json", "landing/c.txt", "landing/sub/d.csv"]:
+        s3.Object(test_configs["s3bucket"], key).put(Body="{}")
+
+    def list_bucket(**kwargs):
+        with Client(app.app) as client:
+            return client.http.post(
+                "/list_bucket",
+                headers={"Content-Type": test_configs["content_type"]},
+                body=json.dumps({"s3bucket": test_configs["s3bucket"], **kwargs}),
+            ).json_body
+
+    # Folder view with a suffix filter
+    page = list_bucket(prefix="landing/", delimiter="/", suffixes=[".csv", ".JSON"])
+    assert [obj["key"] for obj in page["objects"]] == ["landing/a.csv", "landing/b.json"]
+    assert page["common_prefixes"] == ["landing/sub/"]
+
+    # Pages are returned one at a time
+    keys = []
+    page = list_bucket(prefix="landing/", page_size=3)
+    keys.extend(obj["key"] for obj in page["objects"])
+    assert len(keys) == 3
+    page = list_bucket(
+        prefix="landing/",
+        page_size=3,
+        continuation_token=page["next_continuation_token"],
+    )
+    keys.extend(obj["key"] for obj in page["objects"])
+    assert page["next_continuation_token"] is None
+    assert keys == sorted(
+        ["landing/a.csv", "landing/b.json", "landing/c.txt", "landing/sub/d.csv"]
+    )
 
 @mock_aws
 def test_get_data_columns(test_configs, get_amc_json, test_data):
@@ -271,6 +312,124 @@ def test_get_data_columns(test_configs, get_amc_json, test_data):
             assert expected_key in response.json_body["columns"]
 
 
+@mock_aws
+def test_get_data_columns_multiple_files(test_configs, get_amc_json, test_data):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket=test_configs["s3bucket"])
+    csv_header = ",".join(test_data[0].keys())
+    # The first line is longer than one ranged read.
+    long_line = json.dumps({"long_field": "x" * (app.HEADER_SNIFF_BYTES + 10)})
+    objects = {
+        "data1.json": (get_amc_json.encode(), app.JSON_CONTENT_TYPE),
+        "data2.json.gz": (gzip.compress(get_amc_json.encode()), "application/x-gzip"),
+        "data3.csv": (f"{csv_header}\r\nCaroline,Crane\r\n".encode(), "text/csv"),
+        "data4.csv.gz": (gzip.compress(f"{csv_header}\n".encode()), "application/x-gzip"),
+        "long.json": (f"{long_line}\n".encode(), app.JSON_CONTENT_TYPE),
+    }
+    for key, (body, content_type) in objects.items():
+        s3.put_object(
+            Bucket=test_configs["s3bucket"], Key=key, Body=body, ContentType=content_type
+        )
+
+    def get_data_columns(keys):
+        with Client(app.app) as client:
+            return client.http.post(
+                "/get_data_columns",
+                headers={"Content-Type": app.JSON_CONTENT_TYPE},
+                body=json.dumps(
+                    {"s3bucket": test_configs["s3bucket"], "s3key": ", ".join(keys)}
+                ),
+            )
+
+    response = get_data_columns(["data1.json", "data2.json.gz"])
+    assert response.status_code == 200
+    assert response.json_body == {
+        "columns": list(test_data[0].keys()),
+        "content_type": app.JSON_CONTENT_TYPE,
+    }
+
+    response = get_data_columns(["data3.csv", "data4.csv.gz"])
+    assert response.status_code == 200
+    assert response.json_body == {
+        "columns": list(test_data[0].keys()),
+        "content_type": "text/csv",
+    }
+
+    response = get_data_columns(["long.json"])
+    assert response.status_code == 200
+    assert response.json_body["columns"] == ["long_field"]
+
+    response = get_data_columns(["data1.json", "long.json", "data2.json.gz"])
+    assert response.status_code == 400
+    assert response.json_body["Message"] == "Every file must have the same format and data fields."
+
+
+@mock_aws
+def test_infer_data_schema(test_configs):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket=test_configs["s3bucket"])
+    rows = "email,zip,quantity\r\n" + "jane@example.com,98101,2\r\n" * 50
+    s3.put_object(
+        Bucket=test_configs["s3bucket"],
+        Key="data.csv.gz",
+        Body=gzip.compress(rows.encode()),
+        ContentType="application/x-gzip",
+    )
+    app.schema_cache.clear()
+
+    def infer_data_schema():
+        with Client(app.app) as client:
+            return client.http.post(
+                "/infer_data_schema",
+                headers={"Content-Type": app.JSON_CONTENT_TYPE},
+                body=json.dumps(
+                    {
+                        "s3bucket": test_configs["s3bucket"],
+                        "s3key": "data.csv.gz",
+                        "countryCode": "US",
+                        "sampleRows": 10,
+                    }
+                ),
+            )
+
+    response = infer_data_schema()
+    assert response.status_code == 200
+    assert response.json_body["content_type"] == "text/csv"
+    assert response.json_body["sampled_rows"] == 10
+    columns = {column["column_name"]: column for column in response.json_body["columns"]}
+    assert columns["email"]["pii_type"] == "EMAIL"
+    assert columns["zip"]["pii_type"] == "ZIP"
+    assert columns["quantity"]["data_type"] == "LONG"
+    assert len(app.schema_cache) == 1
+
+    # Unchanged files are served from the cache.
+    with patch("library.schema_inference.infer_schema") as mock_infer_schema:
+        assert infer_data_schema().json_body == response.json_body
+        mock_infer_schema.assert_not_called()
+
+        # A new version of the file is sampled again.
+        s3.put_object(
+            Bucket=test_configs["s3bucket"],
+            Key="data.csv.gz",
+            Body=gzip.compress(b"email\r\njane@example.com\r\n"),
+            ContentType="application/x-gzip",
+        )
+        mock_infer_schema.return_value = []
+        assert infer_data_schema().json_body["columns"] == []
+        mock_infer_schema.assert_called_once()
+
+    # Errors are returned instead of raised.
+    s3.put_object(Bucket=test_configs["s3bucket"], Key="data.csv.gz", Body=gzip.compress(b""))
+    assert infer_data_schema().json_body == {
+        "Status": "Error",
+        "Message": "The file data.csv.gz is empty.",
+    }
+    s3.delete_object(Bucket=test_configs["s3bucket"], Key="data.csv.gz")
+    response = infer_data_schema()
+    assert response.status_code == 200
+    assert response.json_body["Status"] == "Error"
+
+
 def test_save_invalid_oauth_credentials(test_configs):
     # Validate that invalid client_id is not saved in the secrets manager.
     # save client and secret to Aws secret.
@@ -468,6 +627,115 @@ def test_list_upload_failures(test_configs):
     assert response.json_body == {"Status": "Error", "Message": "'dataSetId'"}
 
 
+@mock_aws
+def test_batch_list_upload_failures(test_configs):
+    dynamodb = boto3.resource("dynamodb", region_name=os.environ["AWS_REGION"])
+    table = dynamodb.create_table(
+        TableName=os.environ["UPLOAD_FAILURES_TABLE_NAME"],
+        KeySchema=[
+            {"AttributeName": "instance_id", "KeyType": "HASH"},
+            {"AttributeName": "dataset_id", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "instance_id", "AttributeType": "S"},
+            {"AttributeName": "dataset_id", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[
+            {
+                "IndexName": app.UPLOAD_FAILURES_DATASET_INDEX,
+                "KeySchema": [
+                    {"AttributeName": "dataset_id", "KeyType": "HASH"},
+                    {"AttributeName": "instance_id", "KeyType": "RANGE"},
+                ],
+                "Projection": {"ProjectionType": "ALL"},
+            }
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    for dataset_id, instance_id in [
+        ("dataset1", "instance1"),
+        ("dataset1", "instance2"),
+        ("dataset2", "instance1"),
+    ]:
+        table.put_item(
+            Item={
+                "dataset_id": dataset_id,
+                "instance_id": instance_id,
+                "Value": f"{dataset_id} failed in {instance_id}",
+            }
+        )
+
+    def batch_list_upload_failures(body):
+        with Client(app.app) as client:
+            return client.http.post(
+                "/batch_list_upload_failures",
+                headers={"Content-Type": test_configs["content_type"]},
+                body=json.dumps(body),
+            ).json_body
+
+    response = batch_list_upload_failures(
+        {
+            "items": [
+                {"dataSetId": "dataset1", "instance_id": "instance1"},
+                {"dataSetId": "dataset2", "instance_id": "instance1"},
+                {"dataSetId": "dataset2", "instance_id": "instance1"},
+                {"dataSetId": "dataset3", "instance_id": "instance1"},
+            ]
+        }
+    )
+    assert sorted(response["failures"], key=lambda failure: failure["dataSetId"]) == [
+        {"dataSetId": "dataset1", "instance_id": "instance1", "message": "dataset1 failed in instance1"},
+        {"dataSetId": "dataset2", "instance_id": "instance1", "message": "dataset2 failed in instance1"},
+    ]
+
+    # Keys are read in batches of BATCH_GET_ITEM_MAX_KEYS.
+    with patch("app.BATCH_GET_ITEM_MAX_KEYS", 1):
+        response = batch_list_upload_failures(
+            {
+                "items": [
+                    {"dataSetId": "dataset1", "instance_id": "instance2"},
+                    {"dataSetId": "dataset2", "instance_id": "instance1"},
+                ]
+            }
+        )
+        assert len(response["failures"]) == 2
+
+    response = batch_list_upload_failures({"dataSetId": "dataset1"})
+    assert sorted(failure["instance_id"] for failure in response["failures"]) == [
+        "instance1",
+        "instance2",
+    ]
+
+    assert batch_list_upload_failures({}) == {"Status": "Error", "Message": "'dataSetId'"}
+
+
+@patch("app.time.sleep")
+@patch("app.tasks.get_boto3_resource")
+def test_batch_get_upload_failures_retries(mock_get_boto3_resource, mock_sleep):
+    batch_get_item = mock_get_boto3_resource.return_value.batch_get_item
+    table_name = app.UPLOAD_FAILURES_TABLE_NAME
+    key = {"instance_id": "instance1", "dataset_id": "dataset1"}
+    unprocessed = {table_name: {"Keys": [key]}}
+    batch_get_item.side_effect = [
+        {"Responses": {}, "UnprocessedKeys": unprocessed},
+        {"Responses": {}, "UnprocessedKeys": unprocessed},
+        {"Responses": {table_name: [key]}, "UnprocessedKeys": {}},
+    ]
+    # Unprocessed keys are retried with exponential backoff.
+    assert app.batch_get_upload_failures([key]) == [key]
+    assert [call.args[0] for call in mock_sleep.call_args_list] == [
+        app.BATCH_GET_ITEM_BACKOFF_SECONDS,
+        app.BATCH_GET_ITEM_BACKOFF_SECONDS * 2,
+    ]
+
+    # Reads fail once the retries are used up.
+    batch_get_item.side_effect = None
+    batch_get_item.return_value = {"Responses": {}, "UnprocessedKeys": unprocessed}
+    with pytest.raises(app.ChaliceViewError):
+        app.batch_get_upload_failures([key])
+    assert batch_get_item.call_count == 3 + app.BATCH_GET_ITEM_MAX_RETRY + 1
+
+
 @mock_aws
 @pytest.fixture
 def run_amc_api_request_test():
@@ -701,6 +969,79 @@ def test_list_datasets(
     )
 
 
+@mock_aws
+def test_response_cache(test_configs, get_headers, get_amc_instance_info):
+    from chalicelib.response_cache import ResponseCache
+
+    dynamodb = boto3.resource("dynamodb", region_name=os.environ["AWS_REGION"])
+    dynamodb.create_table(
+        TableName="response_cache_test_table",
+        KeySchema=[
+            {"AttributeName": "cache_scope", "KeyType": "HASH"},
+            {"AttributeName": "cache_key", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "cache_scope", "AttributeType": "S"},
+            {"AttributeName": "cache_key", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    datasets = {"dataSets": [{"dataSetId": test_configs["data_set_id"]}]}
+    amc_response = MagicMock(status_code=200, text="{}")
+    amc_response.json.return_value = datasets
+    body = {**get_amc_instance_info, "user_id": "user123"}
+
+    def post(path, request_body=body):
+        with Client(app.app) as client:
+            return client.http.post(path, headers=get_headers, body=json.dumps(request_body))
+
+    with (
+        patch.object(app, "response_cache", ResponseCache(60, "response_cache_test_table")),
+        patch("app.tasks.get_ads_token", return_value={"access_token": "token"}) as mock_get_ads_token,
+        patch("app.tasks.AMCRequests.process_request", return_value=amc_response) as mock_process_request,
+    ):
+        response = post("/list_datasets")
+        assert response.json_body == datasets
+        assert response.headers["X-Cache"] == "Miss"
+        response = post("/list_datasets")
+        assert response.json_body == datasets
+        assert response.headers["X-Cache"] == "Hit"
+        assert mock_process_request.call_count == 1
+        # Cache hits are served without getting an LwA token.
+        assert mock_get_ads_token.call_count == 1
+
+        # Other containers read the response from DynamoDB.
+        app.response_cache.clear()
+        assert post("/list_datasets").headers["X-Cache"] == "Hit"
+        assert mock_process_request.call_count == 1
+
+        # Responses are cached per user.
+        post("/list_datasets", {**body, "user_id": "user456"})
+        assert mock_process_request.call_count == 2
+
+        assert post("/list_datasets?refresh=true").headers["X-Cache"] == "Miss"
+        assert mock_process_request.call_count == 3
+
+        # Creating a dataset invalidates the cached datasets of the instance.
+        post("/create_dataset", {**body, "body": {}})
+        assert mock_process_request.call_count == 4
+        assert dynamodb.Table("response_cache_test_table").scan()["Count"] == 0
+        assert post("/list_datasets").headers["X-Cache"] == "Miss"
+        assert mock_process_request.call_count == 5
+
+        for path in ["/get_amc_instances", "/get_amc_accounts"]:
+            assert post(path).headers["X-Cache"] == "Miss"
+            assert post(path).headers["X-Cache"] == "Hit"
+        assert mock_process_request.call_count == 7
+
+        # Failed responses are not cached.
+        amc_response.status_code = 500
+        app.response_cache.invalidate("amc_accounts")
+        post("/get_amc_accounts")
+        post("/get_amc_accounts")
+        assert mock_process_request.call_count == 9
+
+
 @mock_aws
 def test_describe_dataset(
     test_configs, get_amc_instance_info, get_headers, run_amc_api_request_test
@@ -906,6 +1247,93 @@ def test_upload_status(
         test_response=test_response,
     )
 
+@responses.activate
+@patch("app.tasks.get_ads_token")
+def test_bulk_upload_status(mock_get_ads_token, test_configs, get_headers, get_amc_instance_info):
+    mock_get_ads_token.return_value = {"client_id": "client_id", "access_token": "access_token"}
+    data_set_id = test_configs["data_set_id"]
+    amc_url = f"https://advertising-api.amazon.com/amc/advertiserData/{test_configs['instance_id']}"
+    responses.post(
+        url=f"{amc_url}/uploads/list",
+        match=[matchers.query_param_matcher({"dataSetId": data_set_id})],
+        json={"uploads": [{"uploadId": "upload1"}, {"uploadId": "upload2"}], "nextToken": "token1"},
+    )
+    responses.post(
+        url=f"{amc_url}/uploads/list",
+        match=[matchers.query_param_matcher({"dataSetId": data_set_id, "nextToken": "token1"})],
+        json={"uploads": [{"uploadId": "upload3"}]},
+    )
+    for upload_id, status in [("upload1", "Succeeded"), ("upload2", "Succeeded"), ("upload3", "Pending")]:
+        responses.get(
+            url=f"{amc_url}/uploads/{data_set_id}/{upload_id}",
+            json={"uploadId": upload_id, "status": status},
+        )
+    responses.get(
+        url=f"{amc_url}/uploads/other_dataset/upload4",
+        json={"message": "Not found"},
+        status=404,
+    )
+
+    def bulk_upload_status(**body):
+        with Client(app.app) as client:
+            return client.http.post(
+                "/bulk_upload_status",
+                headers=get_headers,
+                body=json.dumps({**get_amc_instance_info, "user_id": "user123", **body}),
+            ).json_body
+
+    response = bulk_upload_status(dataSetId=data_set_id)
+    assert [upload["uploadId"] for upload in response["uploads"]] == ["upload1", "upload2", "upload3"]
+    assert response["uploads"][2]["response"]["status"] == "Pending"
+    assert response["summary"] == {"Succeeded": 2, "Pending": 1}
+    assert "nextToken" not in response
+    # The token is requested once for all uploads.
+    mock_get_ads_token.assert_called_once()
+
+    response = bulk_upload_status(
+        uploads=[
+            {"dataSetId": data_set_id, "uploadId": "upload3"},
+            {"dataSetId": "other_dataset", "uploadId": "upload4"},
+        ]
+    )
+    assert response["uploads"][0]["statusCode"] == 200
+    assert response["uploads"][1]["statusCode"] == 404
+    assert response["summary"] == {"Pending": 1, "ERROR": 1}
+
+    # Listing stops once the maximum number of uploads is found.
+    with patch("app.BULK_UPLOAD_STATUS_MAX_UPLOADS", 2):
+        response = bulk_upload_status(dataSetId=data_set_id)
+        assert len(response["uploads"]) == 2
+        assert response["nextToken"] == "token1"
+
+        response = bulk_upload_status(
+            uploads=[{"dataSetId": data_set_id, "uploadId": "upload1"}] * 3
+        )
+        assert response["Status"] == "Error"
+
+    # A page that does not fit is listed again with the returned nextToken.
+    with patch("app.BULK_UPLOAD_STATUS_MAX_UPLOADS", 3):
+        response = bulk_upload_status(dataSetId=data_set_id)
+        assert [upload["uploadId"] for upload in response["uploads"]] == ["upload1", "upload2", "upload3"]
+    with patch("app.BULK_UPLOAD_STATUS_MAX_UPLOADS", 2), patch(
+        "app.tasks.AMCRequests.process_request"
+    ) as mock_process_request:
+        mock_process_request.return_value.status_code = 200
+        mock_process_request.return_value.json.side_effect = [
+            {"uploads": [{"uploadId": "upload1"}], "nextToken": "token1"},
+            {"uploads": [{"uploadId": "upload2"}, {"uploadId": "upload3"}], "nextToken": "token2"},
+        ]
+        uploads, next_token = app.list_dataset_uploads(data_set_id, None, {})
+        assert uploads == [{"dataSetId": data_set_id, "uploadId": "upload1"}]
+        assert next_token == "token1"
+
+    # Responses with more uploads than the maximum are cut short.
+    with patch("app.BULK_UPLOAD_STATUS_MAX_UPLOADS", 1):
+        response = bulk_upload_status(dataSetId=data_set_id)
+        assert [upload["uploadId"] for upload in response["uploads"]] == ["upload1"]
+        assert response["nextToken"] == "token1"
+
+
 @mock_aws
 def test_get_etl_jobs(
         test_configs, get_amc_instance_info, get_headers, run_amc_api_request_test
@@ -935,7 +1363,7 @@ def test_get_etl_jobs(
         JobName=os.environ["AMC_GLUE_JOB_NAME"],
         RunId=glue_response["JobRunId"],
     )
-    with patch("app.boto3.client") as mock_get_job_runs:
+    with patch("app.tasks.get_boto3_client") as mock_get_job_runs:
         job_run_data["JobRun"]["Arguments"].update(
             {"--dataset_id": data_set_id}
         )
@@ -957,6 +1385,158 @@ def test_get_etl_jobs(
             )
 
 
+def test_get_etl_jobs_pagination_filters_and_cache(test_configs):
+    def job_run(run_id, state, dataset_id, day):
+        return {
+            "Id": run_id,
+            "JobRunState": state,
+            "Arguments": {"--dataset_id": dataset_id},
+            "StartedOn": datetime(2024, 1, day, tzinfo=timezone.utc),
+        }
+
+    def get_etl_jobs(query_string=""):
+        with Client(app.app) as client:
+            return client.http.get(
+                "/get_etl_jobs" + query_string,
+                headers={"Content-Type": test_configs["content_type"]},
+            ).json_body
+
+    with patch("app.tasks.get_boto3_client") as mock_get_boto3_client:
+        glue_client = mock_get_boto3_client.return_value
+        glue_client.get_job_runs.return_value = {
+            "JobRuns": [
+                job_run("run2", "RUNNING", "dataset1", 2),
+                job_run("run1", "SUCCEEDED", "dataset2", 1),
+            ],
+            "NextToken": "token1",
+        }
+        response = get_etl_jobs()
+        assert [run["Id"] for run in response["JobRuns"]] == ["run2", "run1"]
+        assert response["JobRuns"][0]["DatasetId"] == "dataset1"
+        assert response["NextToken"] == "token1"
+
+        # Only the head of the run list is read again: new runs and the runs
+        # that were in progress.
+        glue_client.get_job_runs.reset_mock()
+        glue_client.get_job_runs.return_value = {
+            "JobRuns": [
+                job_run("run3", "STARTING", "dataset1", 3),
+                job_run("run2", "SUCCEEDED", "dataset1", 2),
+                job_run("run1", "SUCCEEDED", "dataset2", 1),
+            ],
+            "NextToken": "token1",
+        }
+        response = get_etl_jobs()
+        assert [(run["Id"], run["JobRunState"]) for run in response["JobRuns"]] == [
+            ("run3", "STARTING"),
+            ("run2", "SUCCEEDED"),
+            ("run1", "SUCCEEDED"),
+        ]
+        assert response["NextToken"] == "token1"
+        glue_client.get_job_runs.assert_called_once_with(
+            JobName=os.environ["AMC_GLUE_JOB_NAME"],
+            MaxResults=app.ETL_JOB_RUNS_PROBE_SIZE + 1,
+        )
+
+        response = get_etl_jobs("?dataset_id=dataset1")
+        assert [run["Id"] for run in response["JobRuns"]] == ["run3", "run2"]
+        response = get_etl_jobs("?state=succeeded,starting")
+        assert [run["Id"] for run in response["JobRuns"]] == ["run3", "run2", "run1"]
+        response = get_etl_jobs("?started_before=2024-01-02T12:00:00Z")
+        assert [run["Id"] for run in response["JobRuns"]] == ["run2", "run1"]
+        assert response["NextToken"] == "token1"
+        # Older pages cannot hold runs started after started_after.
+        response = get_etl_jobs("?started_after=2024-01-02")
+        assert [run["Id"] for run in response["JobRuns"]] == ["run3", "run2"]
+        assert "NextToken" not in response
+
+        # Once every cached run has finished, only new runs are read, with a
+        # small request.
+        finished_runs = [
+            job_run("run3", "SUCCEEDED", "dataset1", 3),
+            job_run("run2", "SUCCEEDED", "dataset1", 2),
+            job_run("run1", "SUCCEEDED", "dataset2", 1),
+        ]
+        glue_client.get_job_runs.return_value = {"JobRuns": finished_runs, "NextToken": "token1"}
+        get_etl_jobs()
+        glue_client.get_job_runs.reset_mock()
+        glue_client.get_job_runs.return_value = {
+            "JobRuns": [job_run("run4", "RUNNING", "dataset1", 4), finished_runs[0]],
+            "NextToken": "probe_token",
+        }
+        response = get_etl_jobs()
+        assert [run["Id"] for run in response["JobRuns"]] == ["run4", "run3", "run2", "run1"]
+        assert response["NextToken"] == "token1"
+        glue_client.get_job_runs.assert_called_once_with(
+            JobName=os.environ["AMC_GLUE_JOB_NAME"],
+            MaxResults=app.ETL_JOB_RUNS_PROBE_SIZE + 1,
+        )
+
+        # Runs in progress further down the page are read with more pages of
+        # the head of the list, and finished runs keep their cached state.
+        glue_client.get_job_runs.reset_mock()
+        glue_client.get_job_runs.side_effect = [
+            {"JobRuns": [job_run("run5", "RUNNING", "dataset1", 5)], "NextToken": "probe_token"},
+            {"JobRuns": [job_run("run4", "SUCCEEDED", "dataset1", 4), finished_runs[0]]},
+        ]
+        response = get_etl_jobs()
+        assert [(run["Id"], run["JobRunState"]) for run in response["JobRuns"]] == [
+            ("run5", "RUNNING"),
+            ("run4", "SUCCEEDED"),
+            ("run3", "SUCCEEDED"),
+            ("run2", "SUCCEEDED"),
+            ("run1", "SUCCEEDED"),
+        ]
+        assert glue_client.get_job_runs.call_args.kwargs["NextToken"] == "probe_token"
+        assert glue_client.get_job_runs.call_count == 2
+        glue_client.get_job_runs.side_effect = None
+
+        # The cached page never holds more than maxResults runs. If new runs
+        # do not fit, the page is read again.
+        glue_client.get_job_runs.return_value = {"JobRuns": finished_runs, "NextToken": "token1"}
+        get_etl_jobs("?maxResults=3")
+        glue_client.get_job_runs.reset_mock()
+        glue_client.get_job_runs.side_effect = [
+            {"JobRuns": [job_run("run4", "RUNNING", "dataset1", 4), finished_runs[0]]},
+            {"JobRuns": [job_run("run4", "RUNNING", "dataset1", 4)] + finished_runs[:2], "NextToken": "token2"},
+        ]
+        response = get_etl_jobs("?maxResults=3")
+        assert [run["Id"] for run in response["JobRuns"]] == ["run4", "run3", "run2"]
+        assert response["NextToken"] == "token2"
+        assert len(app.etl_job_runs_cache[3]["job_runs"]) == 3
+        glue_client.get_job_runs.assert_called_with(
+            JobName=os.environ["AMC_GLUE_JOB_NAME"], MaxResults=3
+        )
+        glue_client.get_job_runs.side_effect = None
+
+        # maxResults is at least 1.
+        glue_client.get_job_runs.reset_mock()
+        glue_client.get_job_runs.return_value = {"JobRuns": []}
+        get_etl_jobs("?nextToken=token1&maxResults=0")
+        glue_client.get_job_runs.assert_called_once_with(
+            JobName=os.environ["AMC_GLUE_JOB_NAME"],
+            NextToken="token1",
+            MaxResults=1,
+        )
+
+        # Later pages are read from Glue.
+        glue_client.get_job_runs.reset_mock()
+        glue_client.get_job_runs.return_value = {
+            "JobRuns": [job_run("run0", "FAILED", "dataset2", 1)],
+        }
+        response = get_etl_jobs("?nextToken=token1&maxResults=50")
+        assert [run["Id"] for run in response["JobRuns"]] == ["run0"]
+        assert "NextToken" not in response
+        glue_client.get_job_runs.assert_called_once_with(
+            JobName=os.environ["AMC_GLUE_JOB_NAME"],
+            NextToken="token1",
+            MaxResults=50,
+        )
+
+        response = get_etl_jobs("?started_after=yesterday")
+        assert response["Status"] == "Error"
+
+
 @mock_aws
 def test_create_dataset(
     test_configs, get_amc_instance_info, get_headers, run_amc_api_request_test
@@ -1079,6 +1659,94 @@ def test_start_amc_transformation(
             test_response=test_response,
         )
 
+@mock_aws
+@patch("app.time.sleep")
+@patch("app.tasks.get_ads_token")
+def test_batch_start_amc_transformation(mock_get_ads_token, mock_sleep, test_configs, get_headers):
+    mock_get_ads_token.return_value = {"client_id": "client_id", "access_token": "access_token"}
+    s3 = boto3.client("s3", region_name=os.environ["AWS_REGION"])
+    s3.create_bucket(Bucket=test_configs["s3bucket"])
+    s3.put_object(Bucket=test_configs["s3bucket"], Key="a.csv", Body=b"x\n1", ContentType="text/csv")
+    s3.put_object(Bucket=test_configs["s3bucket"], Key="b.json", Body=b"{}", ContentType="application/json")
+    s3.put_object(Bucket=test_configs["s3bucket"], Key="c.gz", Body=b"", ContentType="application/x-gzip")
+
+    glue_client = MagicMock()
+    glue_client.exceptions = boto3.client("glue", region_name=os.environ["AWS_REGION"]).exceptions
+    started = []
+
+    def start_job_run(JobName, Arguments):
+        source_key = Arguments["--source_key"]
+        # The first run of b.json exceeds the concurrent runs quota.
+        if source_key == "b.json" and source_key not in started:
+            started.append(source_key)
+            raise glue_client.exceptions.ConcurrentRunsExceededException(
+                {"Error": {"Code": "ConcurrentRunsExceededException", "Message": "Too many runs"}},
+                "StartJobRun",
+            )
+        started.append(source_key)
+        return {"JobRunId": f"jr_{source_key}_{Arguments['--file_format']}"}
+
+    glue_client.start_job_run.side_effect = start_job_run
+
+    def batch_start_amc_transformation(source_keys, **body):
+        with Client(app.app) as client:
+            return client.http.post(
+                "/batch_start_amc_transformation",
+                headers=get_headers,
+                body=json.dumps(
+                    {
+                        "sourceBucket": test_configs["s3bucket"],
+                        "sourceKeys": source_keys,
+                        "outputBucket": test_configs["outputBucket"],
+                        "piiFields": "[]",
+                        "deletedFields": "[]",
+                        "datasetId": test_configs["data_set_id"],
+                        "updateStrategy": "ADDITIVE",
+                        "user_id": "user123",
+                        "amc_instances": json.dumps([{"instance_id": test_configs["instance_id"]}]),
+                        **body,
+                    }
+                ),
+            ).json_body
+
+    with patch(
+        "app.tasks.get_boto3_client",
+        side_effect=lambda service_name: glue_client if service_name == "glue" else s3,
+    ):
+        response = batch_start_amc_transformation(["a.csv", "b.json", "c.gz", "a.csv"])
+        assert response["JobRunIds"] == {"a.csv": "jr_a.csv_CSV", "b.json": "jr_b.json_JSON"}
+        assert response["Errors"] == {"c.gz": "Cannot infer file format of gzipped file."}
+        assert sorted(started) == ["a.csv", "b.json", "b.json"]
+        mock_sleep.assert_called_once_with(1)
+        # The token is requested once for all files.
+        mock_get_ads_token.assert_called_once()
+
+        started.clear()
+        response = batch_start_amc_transformation(
+            ["c.gz"], fileFormat="CSV", countryCode="US", timestampColumn="timestamp", timeseriesPartitionSize="P1D"
+        )
+        assert response == {"JobRunIds": {"c.gz": "jr_c.gz_CSV"}, "Queued": {}, "Errors": {}}
+        arguments = glue_client.start_job_run.call_args.kwargs["Arguments"]
+        assert arguments["--country_code"] == "US"
+        assert arguments["--timeseries_partition_size"] == "P1D"
+
+        response = batch_start_amc_transformation(["c.gz"], fileFormat="CSV", timeseriesPartitionSize="P1M")
+        assert response == {"Status": "Error", "Message": "Unexpected timeseries partition size: P1M"}
+
+        # Runs that are still queued when the retry time runs out are
+        # returned so that they can be sent again.
+        started.clear()
+        with patch("app.BATCH_TRANSFORMATION_RETRY_SECONDS", 0):
+            response = batch_start_amc_transformation(["b.json"])
+        assert response["JobRunIds"] == {}
+        assert "Too many runs" in response["Queued"]["b.json"]
+        assert response["Errors"] == {}
+
+        with patch("app.BATCH_TRANSFORMATION_MAX_FILES", 1):
+            response = batch_start_amc_transformation(["a.csv", "b.json"])
+        assert response["Status"] == "Error"
+
+
 @mock_aws
 def test_system_configuration(test_configs, get_amc_instance_info):
     content_type = test_configs["content_type"]
@@ -1162,6 +1830,7 @@ def test_system_configuration(test_configs, get_amc_instance_info):
 
         assert response.status_code == 200
         assert response.json_body[0]["Name"] == "AmcInstances"
+        assert response.json_body[0]["Version"] is not None
         assert (
             response.json_body[0]["Value"][0]["data_upload_account_id"]
             == test_configs["data_upload_account_id"]
@@ -0,0 +1,84 @@
+# Copyright Amazon.com, Inc. or its affiliates. All Rights Reserved.
+# SPDX-License-Identifier: Apache-2.0
+#
+# ###############################################################################
+# PURPOSE:
+#   * Unit test for latency metrics in Embedded Metric Format.
+#
+# USAGE:
+#   ./run_test.sh --run_unit_test --test-file-name test_metrics.py
+###############################################################################
+
+import json
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+
+def read_emf_lines(capsys):
+    return [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+
+
+def test_timed_disabled(capsys):
+    from share import metrics
+
+    def func():
+        return "result"
+
+    with patch("share.metrics.METRICS_ENABLED", False):
+        # Decorated functions are returned unchanged.
+        assert metrics.timed("Phase")(func) is func
+        with metrics.timed("Phase"):
+            pass
+        metrics.count("Throttles", 1)
+    assert capsys.readouterr().out == ""
+
+
+@patch("share.metrics.METRICS_ENABLED", True)
+def test_timed_context_manager(capsys):
+    from share import metrics
+
+    with metrics.timed("TokenExchange", Route="/list_datasets"):
+        pass
+    with pytest.raises(ValueError):
+        with metrics.timed("TokenExchange"):
+            raise ValueError("test")
+
+    success, error = read_emf_lines(capsys)
+    directive = success["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Namespace"] == metrics.METRICS_NAMESPACE
+    assert directive["Dimensions"] == [["Phase", "Route"]]
+    assert directive["Metrics"] == [{"Name": "Latency", "Unit": "Milliseconds"}]
+    assert success["Phase"] == "TokenExchange"
+    assert success["Route"] == "/list_datasets"
+    assert success["Latency"] >= 0
+    assert "Errors" not in success
+    assert error["Errors"] == 1
+
+
+@patch("share.metrics.METRICS_ENABLED", True)
+def test_timed_decorator(capsys):
+    from share import metrics
+
+    @metrics.timed("AmcRequest")
+    def func(value):
+        return value
+
+    assert func(1) == 1
+    assert func(2) == 2
+    lines = read_emf_lines(capsys)
+    assert [line["Phase"] for line in lines] == ["AmcRequest", "AmcRequest"]
+
+
+@patch("share.metrics.METRICS_ENABLED", True)
+def test_record_retry_metrics(capsys):
+    from share.tasks import record_retry_metrics
+
+    response = MagicMock()
+    response.raw.retries.history = (MagicMock(status=429), MagicMock(status=500))
+    record_retry_metrics(response, "https://advertising-api.amazon.com/amc/instances")
+
+    retries, throttles = read_emf_lines(capsys)
+    assert retries["Retries"] == 2
+    assert throttles["Throttles"] == 1
+    assert throttles["Host"] == "advertising-api.amazon.com"
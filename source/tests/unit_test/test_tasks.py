@@ -11,9 +11,14 @@
 
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
 
+import boto3
 import pytest
+import responses
 from moto import mock_aws
+from responses import matchers
 
 
 def test_safe_json():
@@ -47,3 +52,142 @@ def test_get_client_id_secret_env():
     # Reapply env client_id and secrets.
     os.environ["CLIENT_ID"] = client_id
     os.environ["CLIENT_SECRET"] = client_secret
+
+
+def test_get_boto3_client_threads():
+    from share.tasks import create_boto3_client, get_boto3_client
+
+    # Threads that request a client at the same time share one client.
+    create_boto3_client.cache_clear()
+    with patch("share.tasks.boto3.client", side_effect=lambda *args, **kwargs: object()):
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            clients = list(executor.map(lambda _: get_boto3_client("s3"), range(32)))
+    assert len({id(client) for client in clients}) == 1
+    create_boto3_client.cache_clear()
+
+
+def test_get_boto3_client_config_override():
+    from botocore.config import Config
+    from share.tasks import create_boto3_client, get_boto3_client
+
+    create_boto3_client.cache_clear()
+    config_override = Config(max_pool_connections=32, read_timeout=10)
+    client = get_boto3_client("s3", config_override)
+    # The override is merged into the solution config, and the client is
+    # created once for each override.
+    assert client.meta.config.max_pool_connections == 32
+    assert client.meta.config.read_timeout == 10
+    assert get_boto3_client("s3", config_override) is client
+    assert get_boto3_client("s3") is not client
+    create_boto3_client.cache_clear()
+
+
+@responses.activate
+def test_fan_out_amc_requests():
+    from share.tasks import AsyncAMCRequests, fan_out_amc_requests
+
+    instance_ids = [f"amc{i:08d}" for i in range(25)]
+    for instance_id in instance_ids:
+        responses.post(
+            url=f"https://advertising-api.amazon.com/amc/advertiserData/{instance_id}/dataSets/list",
+            json={"dataSets": [{"dataSetId": instance_id}]},
+            status=200,
+            match=[
+                matchers.header_matcher(
+                    {
+                        "Amazon-Advertising-API-ClientId": "client_id",
+                        "Authorization": "Bearer access_token",
+                        "Amazon-Advertising-API-AdvertiserId": f"ads_{instance_id}",
+                    }
+                )
+            ],
+        )
+
+    amc_requests = [
+        (
+            AsyncAMCRequests(amc_path="/dataSets/list", http_method="POST"),
+            {
+                "client_id": "client_id",
+                "access_token": "access_token",
+                "instance_id": instance_id,
+                "advertiser_id": f"ads_{instance_id}",
+            },
+        )
+        for instance_id in instance_ids
+    ]
+    results = fan_out_amc_requests(amc_requests, max_concurrency=5)
+
+    assert len(results) == len(instance_ids)
+    for instance_id, response in zip(instance_ids, results):
+        assert response.json() == {"dataSets": [{"dataSetId": instance_id}]}
+
+    # A request that fails is returned as an exception in its own slot.
+    failing_request = (
+        AsyncAMCRequests(amc_path="/dataSets/list", http_method="POST"),
+        {"client_id": "client_id", "access_token": "access_token"},
+    )
+    results = fan_out_amc_requests([amc_requests[0], failing_request])
+    assert results[0].status_code == 200
+    assert isinstance(results[1], KeyError)
+    assert fan_out_amc_requests([]) == []
+
+
+@mock_aws
+def test_apply_amc_bucket_permission():
+    from share.tasks import apply_amc_bucket_permission
+
+    artifact_bucket = os.environ["ARTIFACT_BUCKET"]
+    s3 = boto3.client("s3", region_name=os.environ["AWS_REGION"])
+    s3.create_bucket(Bucket=artifact_bucket)
+    other_statement = {
+        "Sid": "Other",
+        "Effect": "Allow",
+        "Principal": {"AWS": "arn:aws:iam::111111111111:root"},
+        "Action": "s3:GetObject",
+        "Resource": f"arn:aws:s3:::{artifact_bucket}/*",
+    }
+    s3.put_bucket_policy(
+        Bucket=artifact_bucket,
+        Policy=json.dumps({"Version": "2012-10-17", "Statement": [other_statement]}),
+    )
+
+    def policy_principals():
+        policy = json.loads(s3.get_bucket_policy(Bucket=artifact_bucket)["Policy"])
+        assert policy["Statement"][1:] == [other_statement]
+        return policy["Statement"][0]["Principal"]["AWS"]
+
+    amc_instances = [
+        {"instance_id": "amc1", "data_upload_account_id": "222222222222"},
+        {"instance_id": "amc2", "data_upload_account_id": "222222222222"},
+    ]
+    assert apply_amc_bucket_permission(amc_instances=amc_instances) == {
+        "added": ["arn:aws:iam::222222222222:root"],
+        "removed": [],
+        "updated": True,
+    }
+    assert policy_principals() == ["arn:aws:iam::222222222222:root"]
+
+    # The bucket policy is not saved when the data upload accounts are unchanged.
+    with patch("share.tasks.get_boto3_client") as mock_get_boto3_client:
+        mock_get_boto3_client.return_value.get_bucket_policy.return_value = (
+            s3.get_bucket_policy(Bucket=artifact_bucket)
+        )
+        changes = apply_amc_bucket_permission(amc_instances=list(reversed(amc_instances)))
+    assert changes == {"added": [], "removed": [], "updated": False}
+    mock_get_boto3_client.return_value.put_bucket_policy.assert_not_called()
+
+    amc_instances = [{"instance_id": "amc3", "data_upload_account_id": "333333333333"}]
+    assert apply_amc_bucket_permission(amc_instances=amc_instances) == {
+        "added": ["arn:aws:iam::333333333333:root"],
+        "removed": ["arn:aws:iam::222222222222:root"],
+        "updated": True,
+    }
+    assert policy_principals() == ["arn:aws:iam::333333333333:root"]
+
+    # The bucket policy is left unchanged when there are no AMC instances.
+    assert apply_amc_bucket_permission(amc_instances=[]) == {
+        "added": [],
+        "removed": [],
+        "updated": False,
+    }
+    assert policy_principals() == ["arn:aws:iam::333333333333:root"]